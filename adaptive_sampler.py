@@ -0,0 +1,91 @@
+class AdaptiveSampler:
+    """
+    scan_video のサンプリング間隔を場面に合わせて変える。
+    - 顔が無く動きも小さい間は、間隔を倍々に広げる (最大 max_step)
+    - 顔が見つかる・動きが大きい場合は最小間隔 (min_step) に戻す
+    - 広げた間隔の後で顔が見つかった場合は、直前のサンプルの次から最小間隔で戻って調べ直し、
+      登場の始まりを固定間隔と同じ細かさで拾う
+    enabled=False の場合は常に base_step (従来の固定間隔) で進む。
+    grid を渡すと、間隔を grid の倍数に揃える (ffmpeg のパイプは決まった間隔のフレームしか出さないため)。
+    """
+
+    def __init__(self, base_step, min_step=None, max_step=None, motion_threshold=0.5, enabled=False, grid=1):
+        grid = max(1, int(grid))
+        self.base_step = max(1, int(base_step))
+        self.min_step = max(1, int(min_step or base_step))
+        self.max_step = max(self.min_step, int(max_step or base_step))
+        if grid > 1:
+            self.min_step = -(-self.min_step // grid) * grid # 切り上げ
+            self.max_step = max(self.min_step, self.max_step // grid * grid)
+        self.motion_threshold = motion_threshold
+        self.enabled = enabled and self.max_step > self.min_step
+
+        self.step = self.min_step if self.enabled else self.base_step
+        self._prev_index = None # 直前に評価した (顔が無かった) フレーム
+        self._dense_until = -1  # 戻って調べ直している間は、ここまで最小間隔のまま進む
+        self._expanding = False # 直前の判定で間隔を広げた (顔が無く動きも小さかった)
+        self._upcoming = None   # 最後に決めた、次に評価するフレーム
+        self.counters = {"evaluated": 0, "backtracks": 0}
+
+    def reset(self):
+        """離れた区間へ移動したときに、直前のサンプルの情報を捨てて最小間隔からやり直す"""
+        self.step = self.min_step if self.enabled else self.base_step
+        self._prev_index = None
+        self._dense_until = -1
+        self._expanding = False
+        self._upcoming = None
+
+    def backtrack_index(self, index, has_faces):
+        """
+        広げた間隔で顔を見つけた場合に、戻って調べ直す開始フレームを返す (不要なら None)。
+        戻った場合、このフレームの結果は使わずに捨てる。
+        """
+        self.counters["evaluated"] += 1
+        if not self.enabled or not has_faces or self._prev_index is None or self.step <= self.min_step:
+            return None
+        restart = self._prev_index + self.min_step
+        if restart >= index:
+            return None
+        self.counters["backtracks"] += 1
+        self.step = self.min_step
+        self._prev_index = None
+        self._dense_until = index
+        self._expanding = False
+        self._upcoming = restart
+        return restart
+
+    def next_index(self, index, has_faces, motion_score):
+        """このフレームの結果から次に評価するフレーム番号を決める"""
+        if not self.enabled:
+            return index + self.base_step
+        if has_faces or motion_score >= self.motion_threshold or index < self._dense_until:
+            self.step = self.min_step
+            self._prev_index = None if has_faces else index
+            self._expanding = False
+        else:
+            self._prev_index = index
+            self.step = min(self.step * 2, self.max_step)
+            self._expanding = True
+        self._upcoming = index + self.step
+        return self._upcoming
+
+    def predict_next(self, index, step=None):
+        """
+        先読み用: 今の場面が続いた場合に、index の次に評価するフレーム番号を返す。
+        step は index の直前の間隔 (None なら現在の間隔)。状態は変えない。
+        """
+        if not self.enabled:
+            return index + self.base_step
+        if self._upcoming is not None and index < self._upcoming:
+            # 予測より先に実際の次のフレームが決まっている場合は、そこへ合わせる
+            return self._upcoming
+        if self._expanding:
+            return index + min((step or self.step) * 2, self.max_step)
+        return index + self.min_step
+
+    def stats(self, start, end):
+        """評価したフレーム数と、固定間隔 (base_step) の場合のフレーム数"""
+        baseline = len(range(start, end, self.base_step)) if end > start else 0
+        out = dict(self.counters)
+        out["baseline"] = baseline
+        return out
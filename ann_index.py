@@ -0,0 +1,279 @@
+import os
+import numpy as np
+
+ENCODING_DIM = 128
+
+# 登録数がこれ未満の場合は全件比較の方が速いため、インデックスを作らない
+ANN_MIN_SIZE = 20000
+
+# 学習時の登録数の何倍まで増えたら、クラスタを作り直すか
+RETRAIN_GROWTH = 2.0
+
+
+def index_path_for(gallery_path):
+    """target_faces.gallery に対応するインデックスファイルのパス"""
+    return os.path.splitext(gallery_path)[0] + ".ann.npz"
+
+
+def _kmeans(data, k, iters=10, seed=0):
+    """NumPy のみで書いた単純な k-means (初期値はランダムサンプル)"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    data_sq = np.einsum("ij,ij->i", data, data)
+    for _ in range(iters):
+        assign = _nearest(data, centroids, data_sq)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k).astype(np.float32)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # 空になったクラスタはランダムな点で埋め直す
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), size=len(empty), replace=False)]
+    return centroids
+
+
+def _nearest(data, centroids, data_sq=None, chunk=8192):
+    """各ベクトルに最も近いセントロイドの番号 (メモリ節約のため分割して計算)"""
+    if data_sq is None:
+        data_sq = np.einsum("ij,ij->i", data, data)
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(len(data), dtype=np.int32)
+    for s in range(0, len(data), chunk):
+        block = data[s:s + chunk]
+        d2 = data_sq[s:s + chunk, None] + c_sq[None, :] - 2.0 * (block @ centroids.T)
+        out[s:s + chunk] = np.argmin(d2, axis=1)
+    return out
+
+
+class IVFIndex:
+    """
+    転置ファイル (IVF) 方式の近似最近傍インデックス。
+    k-means で登録エンコーディングを nlist 個のクラスタに分け、検索時はクエリに近い
+    nprobe 個のクラスタに属するエンコーディングだけと距離を計算する。
+    エンコーディングと人物名を自前で保持するので、ギャラリーの行番号 (削除・詰め直しで変わる) には依存しない。
+    """
+
+    def __init__(self, vectors, names, centroids, assign, trained_size, nprobe=8):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.names = np.asarray(names)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assign = np.asarray(assign, dtype=np.int32)
+        self.trained_size = int(trained_size)
+        self.nprobe = nprobe
+        self.path = None # 保存先・読み込み元のファイル (スキャン用プロセスにはこのパスだけを渡す)
+        self._rebuild_lists()
+
+    @classmethod
+    def build(cls, target_data, nlist=None, nprobe=8, seed=0):
+        vectors, names = _flatten(target_data)
+        return cls.from_vectors(vectors, names, nlist=nlist, nprobe=nprobe, seed=seed)
+
+    @classmethod
+    def from_vectors(cls, vectors, names, nlist=None, nprobe=8, seed=0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        if nlist is None:
+            nlist = int(np.sqrt(n)) if n > 0 else 1
+        nlist = max(1, min(nlist, n))
+        if n == 0:
+            centroids = np.zeros((1, ENCODING_DIM), dtype=np.float32)
+            return cls(vectors, names, centroids, np.empty(0, dtype=np.int32), 0, nprobe=nprobe)
+
+        # 学習はサンプルで十分 (クラスタあたり 64 件程度)
+        rng = np.random.default_rng(seed)
+        train = vectors if n <= nlist * 64 else vectors[rng.choice(n, size=nlist * 64, replace=False)]
+        centroids = _kmeans(train, nlist, seed=seed)
+        assign = _nearest(vectors, centroids)
+        return cls(vectors, names, centroids, assign, n, nprobe=nprobe)
+
+    def _rebuild_lists(self):
+        # クラスタごとの行番号を assign の並べ替えで作る (order[offsets[c]:offsets[c+1]] がクラスタ c)
+        self.order = np.argsort(self.assign, kind="stable").astype(np.int32)
+        counts = np.bincount(self.assign, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def needs_retrain(self):
+        return len(self.vectors) > max(self.trained_size, 1) * RETRAIN_GROWTH
+
+    def add(self, name, encodings):
+        """エンコーディングを追加する (既存クラスタに割り当てるだけで、再学習はしない)"""
+        new = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(new) == 0:
+            return
+        self.vectors = np.ascontiguousarray(np.concatenate([self.vectors, new]))
+        self.names = np.concatenate([self.names, np.asarray([name] * len(new))])
+        self.assign = np.concatenate([self.assign, _nearest(new, self.centroids)])
+        self._rebuild_lists()
+
+    def remove(self, name):
+        keep = self.names != name
+        self.vectors = np.ascontiguousarray(self.vectors[keep])
+        self.names = self.names[keep]
+        self.assign = self.assign[keep]
+        self._rebuild_lists()
+
+    def counts(self):
+        """人物ごとの登録数 (ギャラリーとの整合性チェック用)"""
+        uniq, cnt = np.unique(self.names, return_counts=True)
+        return {str(n): int(c) for n, c in zip(uniq, cnt)}
+
+    def search(self, queries):
+        """各クエリの近似最近傍の行番号を返す (候補が無い場合は -1)"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        nprobe = min(self.nprobe, len(self.centroids))
+        c_d2 = (np.einsum("ij,ij->i", queries, queries)[:, None]
+                + np.einsum("ij,ij->i", self.centroids, self.centroids)[None, :]
+                - 2.0 * (queries @ self.centroids.T))
+        probes = np.argpartition(c_d2, nprobe - 1, axis=1)[:, :nprobe]
+
+        best = np.full(len(queries), -1, dtype=np.int64)
+        for qi, q in enumerate(queries):
+            cand = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes[qi]])
+            if len(cand) == 0:
+                continue
+            d2 = self._sq_norms[cand] - 2.0 * (self.vectors[cand] @ q)
+            best[qi] = cand[np.argmin(d2)]
+        return best
+
+    def match(self, encodings):
+        """FaceMatcher.match と同じ形式 [(best_name, best_dist), ...] で返す"""
+        if len(encodings) == 0:
+            return []
+        queries64 = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM)
+        rows = self.search(queries64)
+        results = []
+        for q, row in zip(queries64, rows):
+            if row < 0:
+                results.append((None, 1.0))
+                continue
+            dist = float(np.linalg.norm(self.vectors[row].astype(np.float64) - q))
+            results.append((str(self.names[row]), dist) if dist < 1.0 else (None, 1.0))
+        return results
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, vectors=self.vectors, names=self.names.astype(str),
+                         centroids=self.centroids, assign=self.assign,
+                         trained_size=np.int64(self.trained_size))
+            os.replace(tmp_path, path)
+            self.path = path
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise e
+
+    @classmethod
+    def load(cls, path, nprobe=8):
+        with np.load(path, allow_pickle=False) as z:
+            index = cls(z["vectors"], z["names"], z["centroids"], z["assign"], int(z["trained_size"]), nprobe=nprobe)
+        index.path = path
+        return index
+
+
+_loaded_indexes = {}
+
+
+def load_index_cached(path, nprobe=8):
+    """
+    IVFIndex.load と同じだが、プロセス内で読み込んだものを使い回す (スキャン用プロセスでタスクごとに読み込まないため)。
+    ファイルが更新されていたら読み込み直す。
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), nprobe)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _loaded_indexes.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = _loaded_indexes[key] = (stamp, IVFIndex.load(path, nprobe=nprobe))
+    return cached[1]
+
+
+def _flatten(target_data):
+    if hasattr(target_data, "vectors_and_names"):
+        # gallery.Gallery
+        return target_data.vectors_and_names()
+    vectors, names = [], []
+    for name, enc_list in target_data.items():
+        if not isinstance(enc_list, list):
+            enc_list = [enc_list]
+        for enc in enc_list:
+            vectors.append(np.asarray(enc, dtype=np.float32).reshape(ENCODING_DIM))
+            names.append(name)
+    if not vectors:
+        return np.empty((0, ENCODING_DIM), dtype=np.float32), np.asarray([], dtype=str)
+    return np.stack(vectors), np.asarray(names)
+
+
+def _gallery_counts(target_data):
+    if hasattr(target_data, "counts"):
+        return target_data.counts()
+    counts = {}
+    for name, enc_list in target_data.items():
+        n = len(enc_list) if isinstance(enc_list, list) else 1
+        if n:
+            counts[name] = n
+    return counts
+
+
+def load_or_build_index(gallery_path, target_data, nprobe=8):
+    """
+    target_faces.gallery の隣に保存されたインデックスを読み込む。
+    無い場合や登録内容と食い違う場合は作り直して保存する。
+    """
+    path = index_path_for(gallery_path)
+    if os.path.exists(path):
+        try:
+            index = IVFIndex.load(path, nprobe=nprobe)
+            if index.counts() == _gallery_counts(target_data) and not index.needs_retrain():
+                return index
+        except Exception as e:
+            print(f"  Warning: 顔インデックスを読み込めませんでした ({e})。作り直します。")
+
+    print(f"  ... 顔インデックスを作成中 ({sum(_gallery_counts(target_data).values())} 件) ...")
+    index = IVFIndex.build(target_data, nprobe=nprobe)
+    try:
+        index.save(path)
+    except Exception as e:
+        print(f"  Warning: 顔インデックスを保存できませんでした: {e}")
+    return index
+
+
+def update_index_on_register(gallery_path, name, encodings, target_data):
+    """
+    register_person から呼ばれ、既存インデックスに新しいエンコーディングを追加する。
+    インデックスが未作成で、登録数がしきい値に達した場合はここで新規作成する。
+    """
+    path = index_path_for(gallery_path)
+    total = sum(_gallery_counts(target_data).values())
+    if not os.path.exists(path):
+        if total >= ANN_MIN_SIZE:
+            load_or_build_index(gallery_path, target_data)
+        return
+
+    try:
+        index = IVFIndex.load(path)
+        index.add(name, encodings)
+        if index.needs_retrain() or index.counts() != _gallery_counts(target_data):
+            index = IVFIndex.build(target_data)
+        index.save(path)
+    except Exception as e:
+        print(f"  Warning: 顔インデックスの更新に失敗しました: {e}")
+
+
+def update_index_on_delete(gallery_path, name):
+    path = index_path_for(gallery_path)
+    if not os.path.exists(path):
+        return
+    try:
+        index = IVFIndex.load(path)
+        index.remove(name)
+        index.save(path)
+    except Exception as e:
+        print(f"  Warning: 顔インデックスの更新に失敗しました: {e}")
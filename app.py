@@ -16,6 +16,7 @@ import queue
 import hashlib
 import unicodedata
 from PIL import Image, ImageTk
+import io
 import json
 import glob
 import re
@@ -30,6 +31,7 @@ import webbrowser
 import pygame
 import cv2
 from utils import resource_path, get_app_dir, get_user_data_dir
+from thumbnail_cache import ThumbnailImageCache
 
 class RedirectText(object):
     def __init__(self, callback):
@@ -97,13 +99,17 @@ class ModernDigestApp(ctk.CTk):
         # --- CONSTANTS & PATHS (Updated for Separation) ---
         self.CONFIG_FILE = os.path.join(self.user_data_dir, "config.json")
         self.SCAN_RESULTS_FILE = os.path.join(self.user_data_dir, "scan_results.json")
-        self.TARGET_FACES_FILE = os.path.join(self.user_data_dir, "target_faces.pkl")
+        self.TARGET_FACES_FILE = os.path.join(self.user_data_dir, "target_faces.gallery")
         self.PLAYLIST_FILE = os.path.join(self.user_data_dir, "story_playlist.json")
         
         self.PROFILES_DIR = os.path.join(self.user_data_dir, "profiles")
         if not os.path.exists(self.PROFILES_DIR):
             os.makedirs(self.PROFILES_DIR, exist_ok=True)
 
+        # 表示したサムネイルの画像キャッシュ (ページの行き来・表示モードの切り替えで読み直さない)
+        self.thumb_cache = ThumbnailImageCache()
+        self.thumb_prefetch_gen = 0
+
         # Output Textures / Icons (Keep in Resource Path)
         self.ICON_ASSETS_DIR = resource_path("assets") 
         
@@ -139,7 +145,8 @@ class ModernDigestApp(ctk.CTk):
         
         # Scan Data Cache
         self.cached_scan_data = None
-        self.cached_scan_mtime = 0
+        self.cached_scan_revision = -1
+        self._results_store = None
         
         # Audio Playback State
         try:
@@ -186,32 +193,27 @@ class ModernDigestApp(ctk.CTk):
         self.after(2000, self.start_thumbnail_warmup)
 
     def start_thumbnail_warmup(self):
-        """未作成のサムネイルをバックグラウンドで一括生成する"""
+        """未作成のサムネイルをバックグラウンドで一括生成する (動画ごとにまとめて並列に作成)"""
+        from thumbnail_warmup import ThumbnailWarmup
+        
+        reported = [0]
+        def report(done, total):
+            # 10% ごとに進捗を表示
+            step = done * 10 // total
+            if step > reported[0]:
+                reported[0] = step
+                print(f"Warm-up: {done}/{total} thumbnails")
+
         def warmup_task():
             results = self.load_scan_results()
             if not results or "people" not in results: return
             
-            from utils import generate_face_thumbnail, get_app_dir
-            app_dir = get_app_dir()
-            all_clips = []
-            for name, videos in results["people"].items():
-                for v_path, clips in videos.items():
-                    for clip in clips:
-                        all_clips.append((v_path, clip))
-            
-            # 既にスキャン済みかつサムネイルがないものを優先
-            count = 0
-            for v_path, clip in all_clips:
-                # 重複判定等は generate_face_thumbnail 内で行われる
-                res = generate_face_thumbnail(v_path, clip['t'], clip['face_loc'], app_dir)
-                if res: count += 1
-                if count % 10 == 0:
-                    import time
-                    time.sleep(0.01) # UI スレッドをブロックしない程度に
-            
-            if count > 0:
-                print(f"Warm-up: {count} thumbnails pre-generated.")
+            # スキャン時と同じプロファイルフォルダの thumbnails.db に作る (GUI もここから読む)
+            made = self.thumbnail_warmup.run(results)
+            if made:
+                print(f"Warm-up: {made} thumbnails pre-generated.")
 
+        self.thumbnail_warmup = ThumbnailWarmup(self.PROFILES_DIR, progress=report)
         threading.Thread(target=warmup_task, daemon=True).start()
 
     def check_log_queue(self):
@@ -690,12 +692,12 @@ class ModernDigestApp(ctk.CTk):
 
     # --- Consolidated Methods moved to line 1568 ---
         
-    def save_scan_results(self, data):
-        from utils import save_json_atomic
-        try:
-            save_json_atomic(self.SCAN_RESULTS_FILE, data)
-        except Exception as e:
-            print(f"Error saving scan results: {e}")
+    def get_results_store(self):
+        """スキャン結果のデータベース (初回に scan_results.json から自動で変換される)"""
+        if self._results_store is None:
+            from results_store import open_results_store
+            self._results_store = open_results_store(self.SCAN_RESULTS_FILE)
+        return self._results_store
 
     def load_config(self):
         if os.path.exists(self.CONFIG_FILE):
@@ -707,13 +709,16 @@ class ModernDigestApp(ctk.CTk):
         return {}
 
     def save_config(self, notify=False):
-        config = {
+        # GUIで編集しない項目 (スキャン設定 "scan" など) は保持したまま上書きする
+        config = dict(self.config)
+        config.update({
             "target_path": self.target_image_path.get(),
             "video_folder": self.video_folder_path.get(),
             "color_filter": self.color_filter.get(),
             "bgm_enabled": self.bgm_enabled.get(),
             "hf_token": self.hf_token.get().strip()
-        }
+        })
+        self.config = config
         with open(self.CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(config, f, indent=4)
             
@@ -737,7 +742,7 @@ class ModernDigestApp(ctk.CTk):
         
         # Step 3: Register
         self.log(f"[SYSTEM] Registering {name}...")
-        success, reason = register_person(path, name, pkl_path=self.TARGET_FACES_FILE)
+        success, reason = register_person(path, name, gallery_path=self.TARGET_FACES_FILE)
         
         if success:
             self.log(f"[SUCCESS] Registered {name}")
@@ -761,10 +766,10 @@ class ModernDigestApp(ctk.CTk):
             self.log(f"削除: {msg}")
             
             # Remove from scan results too
-            results = self.load_scan_results()
-            if results and "people" in results and name in results["people"]:
-                del results["people"][name]
-                self.save_scan_results(results)
+            try:
+                self.get_results_store().delete_person(name)
+            except Exception as e:
+                print(f"Error saving scan results: {e}")
             
             self.refresh_profiles()
 
@@ -822,7 +827,7 @@ class ModernDigestApp(ctk.CTk):
                 sys.stderr = RedirectText(lambda s: self.log(s, end=""))
                 
                 try:
-                    scan_videos.run_scan(folder, target_pkl=self.TARGET_FACES_FILE, output_json=self.SCAN_RESULTS_FILE, force=self.force_rescan.get(), stop_event=self.scan_stop_event)
+                    scan_videos.run_scan(folder, gallery_path=self.TARGET_FACES_FILE, output_json=self.SCAN_RESULTS_FILE, force=self.force_rescan.get(), stop_event=self.scan_stop_event)
                 finally:
                     sys.stdout = current_stdout
                     sys.stderr = current_stderr
@@ -863,13 +868,11 @@ class ModernDigestApp(ctk.CTk):
         loading_lbl.pack(pady=20)
         
         def bg_load():
-            if not os.path.exists(self.SCAN_RESULTS_FILE):
-                self.after(0, lambda: self._finalize_refresh_ui(None, [], loading_lbl))
-                return
-
             try:
-                with open(self.SCAN_RESULTS_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                data = self.load_scan_results()
+                if not data:
+                    self.after(0, lambda: self._finalize_refresh_ui(None, [], loading_lbl))
+                    return
                 
                 scanned_paths = sorted(data.get("metadata", {}).keys(), reverse=True)
                 if not scanned_paths:
@@ -1050,18 +1053,12 @@ class ModernDigestApp(ctk.CTk):
             self.target_person.set(names[0])
 
     def update_period_menu(self):
-        data = self.load_scan_results() # Use cache-aware loader
-        if not data:
-            return
         try:
-            metadata = data.get("metadata", {})
-            months = set()
-            years = set()
-            for path, meta in metadata.items():
-                m = meta.get("month")
-                if m:
-                    months.add(m)
-                    years.add(m.split("-")[0])
+            # 動画の撮影月だけをデータベースから読む
+            months = set(self.get_results_store().months())
+            if not months:
+                return
+            years = {m.split("-")[0] for m in months}
             
             p_list = ["All Time"] + sorted(list(years), reverse=True) + sorted(list(months), reverse=True)
             
@@ -1551,29 +1548,92 @@ class ModernDigestApp(ctk.CTk):
             self.log("[WARNING] 有効な数字を入力してください")
 
     def load_scan_results(self):
-        """Cache-aware loading of scan results with backup recovery"""
-        from utils import load_json_safe
-        
-        # 基本的なキャッシュチェック
-        if os.path.exists(self.SCAN_RESULTS_FILE):
-            mtime = os.path.getmtime(self.SCAN_RESULTS_FILE)
-            if self.cached_scan_data and mtime == self.cached_scan_mtime:
-                return self.cached_scan_data
-        
-        # 安全な回避策付きロード
-        data = load_json_safe(self.SCAN_RESULTS_FILE, lambda: None)
-        
-        if data:
-            self.cached_scan_data = data
-            if os.path.exists(self.SCAN_RESULTS_FILE):
-                self.cached_scan_mtime = os.path.getmtime(self.SCAN_RESULTS_FILE)
-        
+        """Cache-aware loading of all scan results (結果が無い場合は None)"""
+        store = self.get_results_store()
+        
+        # 基本的なキャッシュチェック (書き込みのたびに増える番号で判定)
+        revision = store.revision()
+        if self.cached_scan_data and revision == self.cached_scan_revision:
+            return self.cached_scan_data
+        
+        if store.is_empty():
+            return None
+        data = store.load()
+        self.cached_scan_data = data
+        self.cached_scan_revision = revision
         return data
 
-    def get_face_thumbnail(self, video_path, timestamp, face_loc):
-        """指定された動画のタイムスタンプ＋座標から、お顔のサムネイルを取得/生成する (utils共通ロジックを使用)"""
+    def iter_face_thumbnails(self, items):
+        """
+        表示するクリップのサムネイルを ((path, t), PIL.Image) の順に返す。
+        保存済みのものは1回の読み込みでまとめて取得し、無いものだけ後から生成する (utils共通ロジックを使用)
+        """
         from utils import generate_face_thumbnail
-        return generate_face_thumbnail(video_path, timestamp, face_loc, self.PROFILES_DIR)
+        from thumbnail_store import open_thumbnail_store
+        keys = [(itm['path'], itm['t']) for itm in items]
+        stored = open_thumbnail_store(self.PROFILES_DIR).get_many(keys)
+        pending = []
+        for itm, key in zip(items, keys):
+            if key in stored:
+                yield key, self.decode_thumbnail(stored[key])
+            else:
+                pending.append((itm, key))
+        for itm, key in pending:
+            jpeg = generate_face_thumbnail(itm['path'], itm['t'], itm['face_loc'], self.PROFILES_DIR)
+            if jpeg:
+                yield key, self.decode_thumbnail(jpeg)
+
+    def decode_thumbnail(self, jpeg):
+        """JPEG のバイト列を PIL 画像にする (表示時ではなく、読み込み用のスレッドでデコードしておく)"""
+        img = Image.open(io.BytesIO(jpeg))
+        img.load()
+        return img
+
+    def thumbnail_image(self, key, pil_img, size):
+        """表示用の CTkImage を作ってキャッシュに入れる (キーは (path, t, size))"""
+        img = ctk.CTkImage(light_image=pil_img, size=size)
+        # 元画像 (RGB) と、表示サイズの画像 (RGBA) の分を見積もる
+        nbytes = pil_img.width * pil_img.height * 3 + size[0] * size[1] * 4
+        self.thumb_cache.put((key[0], key[1], size), img, nbytes)
+        return img
+
+    def load_clip_thumbnails(self, batch, size, apply):
+        """
+        1ページ分のサムネイルを表示する。キャッシュにあるものはその場で apply(key, CTkImage) し、
+        残りはバックグラウンドで読み込んで GUI スレッドで apply する。
+        """
+        missing = []
+        for itm in batch:
+            key = (itm['path'], itm['t'])
+            img = self.thumb_cache.get((key[0], key[1], size))
+            if img is not None:
+                apply(key, img)
+            else:
+                missing.append(itm)
+        if not missing: return
+
+        def load_thumbs():
+            for key, pil_img in self.iter_face_thumbnails(missing):
+                try:
+                    img = self.thumbnail_image(key, pil_img, size)
+                    self.after(0, lambda k=key, i=img: apply(k, i))
+                except: pass
+        threading.Thread(target=load_thumbs, daemon=True).start()
+
+    def prefetch_clip_thumbnails(self, batch, size):
+        """次のページのサムネイルをキャッシュに読み込んでおく (別のページへ移ったら古い先読みは止める)"""
+        self.thumb_prefetch_gen += 1
+        gen = self.thumb_prefetch_gen
+        items = [itm for itm in batch if (itm['path'], itm['t'], size) not in self.thumb_cache]
+        if not items: return
+
+        def prefetch():
+            for key, pil_img in self.iter_face_thumbnails(items):
+                if gen != self.thumb_prefetch_gen: return
+                try:
+                    self.thumbnail_image(key, pil_img, size)
+                except: pass
+        threading.Thread(target=prefetch, daemon=True).start()
 
     def show_person_clips(self, person_name, restart=True, target_y=None, target_page=None):
         """特定の人物の全ヒットクリップを表示する (Pagination対応 / スクロール復元対応)"""
@@ -1621,7 +1681,8 @@ class ModernDigestApp(ctk.CTk):
             loading_lbl.pack(pady=20)
 
             def prep_data():
-                data = self.load_scan_results()
+                # この人物の検出だけをデータベースから読む
+                data = self.get_results_store().load(person_name)
                 if not data: return
                 
                 clips_dict = data.get("people", {}).get(person_name, {})
@@ -1681,9 +1742,11 @@ class ModernDigestApp(ctk.CTk):
 
         # 表示モードに応じて描画
         if self.clip_view_mode == "grid":
-            self.render_clips_grid(batch)
+            thumb_size = self.render_clips_grid(batch)
         else:
-            self.render_clips_list(batch)
+            thumb_size = self.render_clips_list(batch)
+        # 次のページのサムネイルを先読み
+        self.prefetch_clip_thumbnails(self.all_person_clips[end_idx:end_idx + batch_size], thumb_size)
 
         # ページネーションUI
         nav_frame = ctk.CTkFrame(self.clips_container, fg_color="transparent")
@@ -1805,21 +1868,13 @@ class ModernDigestApp(ctk.CTk):
             lbl_metrics = ctk.CTkLabel(info_frame, text=metrics_txt, font=ctk.CTkFont(size=10), anchor="w", text_color="gray70")
             lbl_metrics.pack(fill="x")
 
-        def load_thumbs():
-            for itm in batch:
-                path, ts, loc = itm['path'], itm['t'], itm['face_loc']
-                thumb_path = self.get_face_thumbnail(path, ts, loc)
-                if thumb_path and os.path.exists(thumb_path):
-                    try:
-                        img = ctk.CTkImage(light_image=Image.open(thumb_path), size=(80, 80))
-                        def update_ui(k=(path, ts), i=img):
-                            if k in row_widgets:
-                                w = row_widgets[k]
-                                if w.winfo_exists():
-                                    w.configure(image=i, text="")
-                        self.after(0, update_ui)
-                    except: pass
-        threading.Thread(target=load_thumbs, daemon=True).start()
+        def apply_thumb(k, i):
+            if k in row_widgets:
+                w = row_widgets[k]
+                if w.winfo_exists():
+                    w.configure(image=i, text="")
+        self.load_clip_thumbnails(batch, (80, 80), apply_thumb)
+        return (80, 80)
 
     def render_clips_grid(self, batch):
         """タイル形式で描画する (アトミック・サムネイルのみ・超密集版)"""
@@ -1867,22 +1922,14 @@ class ModernDigestApp(ctk.CTk):
             lbl_img.bind("<Button-1>", toggle_sel)
             grid_widgets[key] = lbl_img
 
-        def load_thumbs():
-            for itm in batch:
-                path, ts, loc = itm['path'], itm['t'], itm['face_loc']
-                thumb_path = self.get_face_thumbnail(path, ts, loc)
-                if thumb_path and os.path.exists(thumb_path):
-                    try:
-                        img = ctk.CTkImage(light_image=Image.open(thumb_path), size=(thumb_size, thumb_size))
-                        def update_ui(k=(path, ts), i=img):
-                            # 消去済みのウィジェットへのアクセスを防ぐ (エラー回避)
-                            if k in grid_widgets:
-                                w = grid_widgets[k]
-                                if w.winfo_exists():
-                                    w.configure(image=i, text="")
-                        self.after(0, update_ui)
-                    except: pass
-        threading.Thread(target=load_thumbs, daemon=True).start()
+        def apply_thumb(k, i):
+            # 消去済みのウィジェットへのアクセスを防ぐ (エラー回避)
+            if k in grid_widgets:
+                w = grid_widgets[k]
+                if w.winfo_exists():
+                    w.configure(image=i, text="")
+        self.load_clip_thumbnails(batch, (thumb_size, thumb_size), apply_thumb)
+        return (thumb_size, thumb_size)
 
     def bulk_delete_selected(self):
         """選択されたクリップを一括削除する"""
@@ -1890,16 +1937,9 @@ class ModernDigestApp(ctk.CTk):
         if count == 0: return
         if not messagebox.askyesno("確認", f"選択された {count} 件を削除しますか？"): return
         try:
-            from utils import load_json_safe, save_json_atomic
-            data = load_json_safe(self.SCAN_RESULTS_FILE, lambda: {"people": {}, "metadata": {}})
             person_name = self.last_person_viewed
-            if person_name in data["people"]:
-                person_data = data["people"][person_name]
-                for vp, ts in list(self.selected_clips):
-                    if vp in person_data:
-                        person_data[vp] = [d for d in person_data[vp] if abs(d['t'] - ts) > 0.01]
-                        if not person_data[vp]: del person_data[vp]
-                save_json_atomic(self.SCAN_RESULTS_FILE, data)
+            if person_name:
+                self.get_results_store().delete_detections(person_name, list(self.selected_clips))
                 self.all_person_clips = [c for c in self.all_person_clips if (c['path'], c['t']) not in self.selected_clips]
                 self.selected_clips = set()
                 self.cached_scan_data = None
@@ -1912,12 +1952,8 @@ class ModernDigestApp(ctk.CTk):
         """特定の検出カットを削除する"""
         if not messagebox.askyesno("確認", "このカットを削除しますか？"): return
         try:
-            from utils import load_json_safe, save_json_atomic
-            data = load_json_safe(self.SCAN_RESULTS_FILE, lambda: {"people": {}, "metadata": {}})
-            if person_name in data["people"] and video_path in data["people"][person_name]:
-                data["people"][person_name][video_path] = [d for d in data["people"][person_name][video_path] if abs(d['t'] - timestamp) > 0.01]
-                if not data["people"][person_name][video_path]: del data["people"][person_name][video_path]
-                save_json_atomic(self.SCAN_RESULTS_FILE, data)
+            if person_name:
+                self.get_results_store().delete_detections(person_name, [(video_path, timestamp)])
                 self.all_person_clips = [c for c in self.all_person_clips if not (c['path'] == video_path and abs(c['t'] - timestamp) < 0.01)]
                 self.cached_scan_data = None
                 if row_widget: row_widget.destroy()
@@ -1949,6 +1985,9 @@ class ModernDigestApp(ctk.CTk):
         self.is_running = False
 
     def on_closing(self):
+        warmup = getattr(self, "thumbnail_warmup", None)
+        if warmup:
+            warmup.cancel()
         try:
             pygame.mixer.music.stop()
             pygame.mixer.quit()
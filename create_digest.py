@@ -1,7 +1,6 @@
 import os
 import sys
 import json
-import pickle
 from moviepy.editor import VideoFileClip, concatenate_videoclips, ColorClip, CompositeVideoClip
 import cv2
 import numpy as np
@@ -12,14 +11,14 @@ import subprocess
 import imageio_ffmpeg
 from utils import resource_path, load_config, get_ffprobe_path
 
-def load_scan_results(json_path='scan_results.json'):
-    if not os.path.exists(json_path):
+def load_scan_results(json_path='scan_results.json', person_name=None):
+    """スキャン結果を読み込む (person_name を指定すると、その人物の検出と動画だけ)"""
+    from results_store import open_results_store, results_db_path_for, results_log_path_for
+    # results_backend = "jsonl" では、最初にまとめられるまで結果は追記ログにしか無い
+    if not any(os.path.exists(p) for p in (json_path, results_db_path_for(json_path), results_log_path_for(json_path))):
         print(f"エラー: スキャン結果ファイルが見つかりません: {json_path}")
         sys.exit(1)
-    
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return data
+    return open_results_store(json_path).load(person_name)
 
 def get_video_rotation(path):
     """ffprobeを使用して動画の回転メタデータを取得する。"""
@@ -44,7 +43,12 @@ def get_video_rotation(path):
 
 from utils import load_config
 
-def apply_blur(frame, target_encodings, blur_enabled):
+def apply_blur(frame, target_encodings, blur_enabled, detector=None):
+    """
+    ターゲット以外の顔をぼかす。
+    detector: 顔検出器 (face_detector.get_face_detector の戻り値)。フレームごとに設定を読まないよう、
+              呼び出し側で1回だけ作って渡す (省略時は HOG)
+    """
     if not blur_enabled:
         return frame
     
@@ -55,7 +59,10 @@ def apply_blur(frame, target_encodings, blur_enabled):
     small_frame = cv2.resize(processed_frame, (0, 0), fx=0.25, fy=0.25)
     
     # 縮小した画像で顔の場所を探す
-    small_face_locations = face_recognition.face_locations(small_frame)
+    if detector is None:
+        from face_detector import get_face_detector
+        detector = get_face_detector()
+    small_face_locations = detector.detect(small_frame)
     if not small_face_locations:
         return processed_frame
         
@@ -88,7 +95,7 @@ def apply_blur(frame, target_encodings, blur_enabled):
     return processed_frame
 
 def create_digest(scan_results_path, target_person_name=None, config_path='config.json', base_output_dir='output', period="All Time", focus="Balance", blur_enabled=None):
-    results = load_scan_results(scan_results_path)
+    results = load_scan_results(scan_results_path, target_person_name)
     config = load_config(config_path)
     
     # 引数、環境変数、Configの順で優先
@@ -98,15 +105,13 @@ def create_digest(scan_results_path, target_person_name=None, config_path='confi
     # ターゲットのエンコーディングをロード（ぼかし判定用）
     target_encodings = {}
     if blur_enabled:
-        target_pkl = resource_path('target_faces.pkl')
-        if os.path.exists(target_pkl):
-            with open(target_pkl, 'rb') as f:
-                target_encodings = pickle.load(f)
-        else:
+        from gallery import open_gallery
+        gallery = open_gallery(resource_path('target_faces.gallery'))
+        if gallery is None:
             # Fallback to absolute/local path if not found in bundle
-            if os.path.exists('target_faces.pkl'):
-                with open('target_faces.pkl', 'rb') as f:
-                    target_encodings = pickle.load(f)
+            gallery = open_gallery('target_faces.gallery')
+        if gallery is not None:
+            target_encodings = gallery.to_dict()
     
     if not results:
         print("スキャン結果が空です。")
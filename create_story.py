@@ -8,16 +8,17 @@ from datetime import datetime
 
 from utils import get_user_data_dir
 
-def load_scan_results(json_path='scan_results.json'):
-    from utils import load_json_safe
-    return load_json_safe(json_path, lambda: {"people": {}, "metadata": {}})
+def load_scan_results(json_path='scan_results.json', person_name=None):
+    """スキャン結果を読み込む (person_name を指定すると、その人物の検出と動画だけ)"""
+    from results_store import open_results_store
+    return open_results_store(json_path).load(person_name)
 
 def main():
     # Unused main method, keeping for future script logic or CLI extension
     pass
 def create_story(person_name, period="All Time", focus="Balance", bgm_enabled=False, json_path='scan_results.json', output_playlist_path='story_playlist.json', manual_bgm_path=""):
     print(f"DEBUG: create_story received manual_bgm_path = '{manual_bgm_path}'")
-    results = load_scan_results(json_path)
+    results = load_scan_results(json_path, person_name)
     if not results or person_name not in results.get("people", {}):
         print(f"Error: No data found for {person_name}")
         return
@@ -0,0 +1,175 @@
+import os
+import glob
+import hashlib
+
+import numpy as np
+
+# 保存形式のバージョン (読み込み時に一致しないファイルは使わない)
+STORE_VERSION = 1
+
+# scan_video と同じ判定基準 (照合距離のしきい値・小さすぎる顔の除外)
+MATCH_THRESHOLD = 0.42
+MIN_FACE_RATIO = 1.2
+
+
+def encodings_dir():
+    from utils import get_user_data_dir
+    return os.path.join(get_user_data_dir(), "encodings")
+
+
+def _store_key(fingerprint):
+    return hashlib.md5(fingerprint.encode("utf-8")).hexdigest()
+
+
+def encoding_store_path(fingerprint, part=None):
+    """動画の指紋 (scan_index.file_info) ごとのエンコーディング保存先。移動・名前変更しても同じファイルを使う"""
+    key = _store_key(fingerprint)
+    name = f"{key}.npz" if part is None else f"{key}-{part}.npz"
+    return os.path.join(encodings_dir(), name)
+
+
+def encoding_store_paths(fingerprint, parts):
+    """
+    metadata の encoding_parts に対応する保存先のリスト。
+    1 は分割せずにスキャンした動画 (ファイル1つ)、2 以上は区間ごとのファイル。
+    """
+    if parts == 1:
+        return [encoding_store_path(fingerprint)]
+    return [encoding_store_path(fingerprint, i) for i in range(parts)]
+
+
+def remove_encoding_store(fingerprint):
+    """その指紋の保存済みエンコーディング (分割した区間の分も含む) を削除する"""
+    key = _store_key(fingerprint)
+    for path in glob.glob(os.path.join(encodings_dir(), f"{key}.npz")) + glob.glob(os.path.join(encodings_dir(), f"{key}-*.npz")):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"  Warning: エンコーディングを削除できませんでした: {e}")
+
+
+class EncodingRecorder:
+    """
+    scan_video が評価したサンプルフレームと、計算した顔エンコーディングを記録する。
+    追跡で判定を引き継いだ顔はエンコーディングを計算しないので、引き継ぎ元の行を指す。
+    rematch_store で、動画をデコードせずに同じ判定 (連続検知フィルタを含む) をやり直せる。
+    """
+
+    def __init__(self):
+        self.encodings = []   # float16 (128,)
+        self.frame_t = []     # サンプルフレームの時刻 (秒)
+        self.frame_motion = []
+        self.frame_segment = [] # 1: 区間の先頭 (連続検知・追跡を引き継がない)
+        self.faces = []       # [frame_row, encoding_row, top, right, bottom, left, face_ratio]
+        self._track_rows = []
+        self._segment = True
+
+    def new_segment(self):
+        """離れた区間へ移動した (追跡と連続検知をリセットした) ことを記録する"""
+        self._segment = True
+        self._track_rows = []
+
+    def add_frame(self, t, motion, face_locs, face_ratios, assigned, new_encodings):
+        """
+        face_locs: 元解像度の (top, right, bottom, left)、assigned: FaceTracker.assign の結果、
+        new_encodings: assigned が None だった顔のエンコーディング (同じ順番)
+        """
+        frame_row = len(self.frame_t)
+        self.frame_t.append(float(t))
+        self.frame_motion.append(float(motion))
+        self.frame_segment.append(1 if self._segment else 0)
+        self._segment = False
+
+        new_iter = iter(new_encodings)
+        rows = []
+        for loc, ratio, j in zip(face_locs, face_ratios, assigned):
+            if j is None:
+                row = len(self.encodings)
+                self.encodings.append(np.asarray(next(new_iter), dtype=np.float16))
+            else:
+                row = self._track_rows[j]
+            rows.append(row)
+            self.faces.append([frame_row, row, *loc, ratio])
+        self._track_rows = rows
+
+    def save(self, path, keep_range=None, settings=None):
+        """npz に書き出す (一時ファイルに書いてから置き換える)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        faces = np.asarray(self.faces, dtype=np.float64).reshape(-1, 7)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path,
+                 version=np.int32(STORE_VERSION),
+                 encodings=np.asarray(self.encodings, dtype=np.float16).reshape(-1, 128),
+                 frame_t=np.asarray(self.frame_t, dtype=np.float64),
+                 frame_motion=np.asarray(self.frame_motion, dtype=np.float64),
+                 frame_segment=np.asarray(self.frame_segment, dtype=np.uint8),
+                 face_rows=faces[:, :2].astype(np.int32),
+                 face_locs=faces[:, 2:6].astype(np.int32),
+                 face_ratios=faces[:, 6],
+                 keep_range=np.asarray(keep_range if keep_range else (-np.inf, np.inf), dtype=np.float64),
+                 settings=np.asarray(repr(settings or {})))
+        os.replace(tmp_path, path)
+
+
+def load_encoding_store(path):
+    """保存済みのエンコーディングを読み込む (無い・形式が違う場合は None)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != STORE_VERSION:
+                return None
+            return {key: data[key] for key in data.files}
+    except Exception as e:
+        print(f"  Warning: エンコーディングを読み込めませんでした: {path} ({e})")
+        return None
+
+
+def rematch_store(store, matcher):
+    """
+    保存済みのエンコーディングを現在のギャラリーで照合し直し、scan_video と同じ形式の
+    {name: [det, ...]} を返す (感情分析の値は入っていない)。
+    """
+    results = {name: [] for name in matcher.names}
+    encodings = store["encodings"].astype(np.float32)
+    matches = matcher.match(encodings) if len(encodings) else []
+
+    faces_by_frame = {}
+    for (frame_row, enc_row), loc, ratio in zip(store["face_rows"], store["face_locs"], store["face_ratios"]):
+        faces_by_frame.setdefault(int(frame_row), []).append((int(enc_row), loc, float(ratio)))
+
+    keep_start, keep_end = store["keep_range"]
+    last_detections = {}
+    for frame_row, t in enumerate(store["frame_t"]):
+        if store["frame_segment"][frame_row]:
+            last_detections.clear()
+        motion = float(store["frame_motion"][frame_row])
+        current_frame_matches = set()
+        for enc_row, loc, ratio in faces_by_frame.get(frame_row, []):
+            best_name, best_dist = matches[enc_row]
+            if not best_name or best_dist >= MATCH_THRESHOLD or ratio < MIN_FACE_RATIO:
+                continue
+            current_frame_matches.add(best_name)
+            det = {
+                "t": round(float(t), 2),
+                "motion": round(motion, 2),
+                "face_ratio": round(ratio, 2),
+                "dist": round(float(best_dist), 4),
+                "face_loc": [int(v) for v in loc],
+                "timestamp": "PENDING",
+            }
+            # 連続検知フィルタ (scan_video と同じく、2回連続した場合のみ記録)
+            if best_name in last_detections:
+                prev_det, added = last_detections[best_name]
+                if not added:
+                    results[best_name].append(prev_det)
+                results[best_name].append(det)
+                last_detections[best_name] = (det, True)
+            else:
+                last_detections[best_name] = (det, False)
+        for name in list(last_detections.keys()):
+            if name not in current_frame_matches:
+                del last_detections[name]
+
+    # 分割スキャンの区間は、担当範囲の検出だけを残す
+    return {name: [d for d in dets if keep_start <= d["t"] < keep_end] for name, dets in results.items()}
@@ -1,13 +1,13 @@
 import face_recognition
-import pickle
 import sys
 import os
 import glob
 import cv2
 
-def register_person(image_path, name, pkl_path='target_faces.pkl', profile_dir=None):
+def register_person(image_path, name, gallery_path='target_faces.gallery', profile_dir=None, detector=None):
     """
     1枚の画像から人物を登録。顔をクロップしてアイコン保存し、エンコーディングを保存する。
+    detector: 顔検出器 (省略時は config.json のスキャン設定の検出器)
     """
     if profile_dir is None:
         from utils import get_user_data_dir
@@ -24,7 +24,10 @@ def register_person(image_path, name, pkl_path='target_faces.pkl', profile_dir=N
         # ロード
         print(f"[{name}] 処理中...")
         image = face_recognition.load_image_file(image_path)
-        face_locations = face_recognition.face_locations(image)
+        if detector is None:
+            from face_detector import get_face_detector, load_detector_options
+            detector = get_face_detector(load_detector_options())
+        face_locations = detector.detect(image)
         
         if not face_locations:
             print("  => 顔が検出されませんでした。")
@@ -39,27 +42,14 @@ def register_person(image_path, name, pkl_path='target_faces.pkl', profile_dir=N
         if not encodings:
             return False, "ENCODING_ERROR"
             
-        # 既存データの読み込み (互換性のため、常にリスト形式で保存)
-        data = {}
-        if os.path.exists(pkl_path):
-            try:
-                with open(pkl_path, 'rb') as f:
-                    data = pickle.load(f)
-            except:
-                data = {}
-        
-        # データの追加/更新 (常にリストに格納)
-        if name in data:
-            if isinstance(data[name], list):
-                data[name].append(encodings[0])
-            else:
-                # 旧データが単一エンコーディングの場合、リストに変換して追加
-                data[name] = [data[name], encodings[0]]
-        else:
-            data[name] = [encodings[0]]
+        # ギャラリーの末尾に追記する (旧形式の pkl があれば先に変換される)
+        from gallery import open_gallery, append_encodings
+        open_gallery(gallery_path, create=True)
+        append_encodings(gallery_path, name, [encodings[0]], source=os.path.basename(image_path))
 
-        with open(pkl_path, 'wb') as f:
-            pickle.dump(data, f)
+        # 近似最近傍インデックスがあれば追加分だけ反映する (大規模登録向け)
+        from ann_index import update_index_on_register
+        update_index_on_register(gallery_path, name, [encodings[0]], open_gallery(gallery_path))
             
         # アイコンの保存 (OpenCV)
         # face_recognition の locations は (top, right, bottom, left)
@@ -88,20 +78,17 @@ def register_person(image_path, name, pkl_path='target_faces.pkl', profile_dir=N
         print(f"Error in register_person: {e}")
         return False, str(e)
 
-def delete_person(name, pkl_path='target_faces.pkl'):
+def delete_person(name, gallery_path='target_faces.gallery'):
     """
     指定した名前の人物を削除する。
     """
     try:
-        # pkl から削除
-        if os.path.exists(pkl_path):
-            with open(pkl_path, 'rb') as f:
-                data = pickle.load(f)
-            if name in data:
-                del data[name]
-                with open(pkl_path, 'wb') as f:
-                    pickle.dump(data, f)
-                print(f"  => データの削除完了: {name}")
+        # ギャラリーから削除 (削除フラグを立てるだけで、ファイルの書き直しはしない)
+        from gallery import open_gallery, delete_name
+        if open_gallery(gallery_path) is not None and delete_name(gallery_path, name):
+            from ann_index import update_index_on_delete
+            update_index_on_delete(gallery_path, name)
+            print(f"  => データの削除完了: {name}")
 
         # アイコンを削除
         from utils import get_user_data_dir
@@ -115,7 +102,7 @@ def delete_person(name, pkl_path='target_faces.pkl'):
         print(f"Error deleting person {name}: {e}")
         return False
 
-def extract_faces_from_folder(folder_path, output_path='target_faces.pkl'):
+def extract_faces_from_folder(folder_path, output_path='target_faces.gallery'):
     # (既存のフォルダバルクスキャン機能も一応残しておく)
     # ... 省略 ...
     pass
@@ -0,0 +1,144 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# config.json の scan.face_detector で選べる検出器
+#   "hog" : face_recognition (dlib HOG)。従来通りのデフォルト
+#   "onnx": onnxruntime で動かす軽量な SSD 系の顔検出モデル (Ultra-Light-Fast-Generic-Face-Detector-1MB)
+ONNX_DETECTOR_MODEL = "version-RFB-320.onnx"
+
+# config.json の "scan" セクションのうち、顔検出器の設定 (scan_videos.SCAN_OPTION_DEFAULTS にも含まれる)
+DETECTOR_OPTION_DEFAULTS = {
+    "face_detector": "hog",     # "hog" (face_recognition) | "onnx" (軽量 SSD 系モデル、assets/models/version-RFB-320.onnx)
+    "face_detector_model": "",  # ONNX モデルのパス (空なら assets/models から探す)
+    "face_detector_threshold": 0.7,  # ONNX 検出器の信頼度しきい値
+}
+
+_detector_cache = {}
+
+
+class FaceDetector:
+    """顔検出器の共通インターフェース。detect() は face_recognition と同じ (top, right, bottom, left) のリストを返す"""
+
+    name = "base"
+
+    def detect(self, rgb_image):
+        raise NotImplementedError
+
+
+class HOGFaceDetector(FaceDetector):
+    """
+    face_recognition.face_locations (model="hog") と同じ検出。
+    face_recognition はプロセスで1つの dlib 検出器を共有しており、複数スレッドから同時に呼べないため
+    (パイプラインの先読みスレッドから呼ばれる)、dlib の検出器をスレッドごとに作って使う。
+    """
+
+    name = "hog"
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+        self._local = threading.local()
+
+    def detect(self, rgb_image):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            import dlib
+            detector = self._local.detector = dlib.get_frontal_face_detector()
+        img_h, img_w = rgb_image.shape[:2]
+        # face_recognition と同じく、画像からはみ出た枠は画像内に切り詰める
+        return [(max(rect.top(), 0), min(rect.right(), img_w), min(rect.bottom(), img_h), max(rect.left(), 0))
+                for rect in detector(rgb_image, self.upsample)]
+
+
+class ONNXFaceDetector(FaceDetector):
+    """
+    Ultra-Light-Fast-Generic-Face-Detector-1MB (RFB-320) の ONNX 版。
+    入力: 1x3x240x320 RGB ((x - 127) / 128)、出力: scores (1,N,2) / boxes (1,N,4: 正規化済み x1,y1,x2,y2)。
+    この検出器の枠は HOG より額・顎まで広めなので、face_encodings に渡せるよう HOG に近い正方形の枠に整える。
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path, score_threshold=0.7, nms_threshold=0.3):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(model_path)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # モデルの入力サイズ (N, C, H, W)。可変の場合は 320x240
+        h, w = model_input.shape[2], model_input.shape[3]
+        self.input_size = (w if isinstance(w, int) else 320, h if isinstance(h, int) else 240)
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+
+    def detect(self, rgb_image):
+        img_h, img_w = rgb_image.shape[:2]
+        resized = cv2.resize(rgb_image, self.input_size)
+        blob = ((resized.astype(np.float32) - 127.0) / 128.0).transpose(2, 0, 1)[np.newaxis]
+        scores, boxes = self.session.run(None, {self.input_name: blob})
+        scores = scores[0][:, 1]
+        boxes = boxes[0]
+
+        keep = scores > self.score_threshold
+        if not np.any(keep):
+            return []
+        scores = scores[keep]
+        boxes = boxes[keep] * np.array([img_w, img_h, img_w, img_h], dtype=np.float32)
+
+        rects = [[float(x1), float(y1), float(x2 - x1), float(y2 - y1)] for x1, y1, x2, y2 in boxes]
+        idxs = cv2.dnn.NMSBoxes(rects, scores.tolist(), self.score_threshold, self.nms_threshold)
+        locations = []
+        for i in np.asarray(idxs).reshape(-1):
+            x1, y1, x2, y2 = boxes[i]
+            # HOG の枠に近づける: 幅と高さの平均を一辺とし、少し下寄り (目〜顎中心) の正方形にする
+            side = ((x2 - x1) + (y2 - y1)) / 2.0 * 0.85
+            cx = (x1 + x2) / 2.0
+            cy = (y1 + y2) / 2.0 + (y2 - y1) * 0.05
+            top = int(max(0, round(cy - side / 2)))
+            bottom = int(min(img_h, round(cy + side / 2)))
+            left = int(max(0, round(cx - side / 2)))
+            right = int(min(img_w, round(cx + side / 2)))
+            if bottom > top and right > left:
+                locations.append((top, right, bottom, left))
+        return locations
+
+
+def load_detector_options(config=None):
+    """
+    config.json の "scan" セクションから顔検出器の設定だけを読む。
+    スキャン以外 (人物の登録・ダイジェストのぼかし) から、scan_videos を import せずに使う。
+    """
+    if config is None:
+        from utils import load_config, get_user_data_dir
+        config = load_config(os.path.join(get_user_data_dir(), "config.json"))
+    scan = config.get("scan", {}) or {}
+    return {key: scan.get(key, default) for key, default in DETECTOR_OPTION_DEFAULTS.items()}
+
+
+def get_face_detector(options=None):
+    """
+    スキャン設定 (get_scan_options) に応じた顔検出器を返す (プロセスごとにキャッシュ)。
+    ONNX モデルや onnxruntime が使えない場合は HOG にフォールバックする。
+    """
+    options = options or {}
+    backend = str(options.get("face_detector", "hog")).lower()
+    key = (backend, options.get("face_detector_model"), options.get("face_detector_threshold"))
+    if key in _detector_cache:
+        return _detector_cache[key]
+
+    detector = None
+    if backend == "onnx":
+        try:
+            from utils import find_model_path
+            model_path = options.get("face_detector_model") or find_model_path(ONNX_DETECTOR_MODEL)
+            detector = ONNXFaceDetector(model_path, score_threshold=float(options.get("face_detector_threshold", 0.7)))
+        except Exception as e:
+            print(f"  Warning: ONNX 顔検出器を初期化できませんでした ({e})。HOG を使用します。")
+    elif backend != "hog":
+        print(f"  Warning: 不明な顔検出器です: {backend}。HOG を使用します。")
+
+    if detector is None:
+        detector = HOGFaceDetector()
+    _detector_cache[key] = detector
+    return detector
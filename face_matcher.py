@@ -0,0 +1,110 @@
+import numpy as np
+
+ENCODING_DIM = 128
+
+
+class FaceMatcher:
+    """
+    登録済みの顔エンコーディングを (N,128) float32 の連続行列と人物ラベル配列にまとめ、
+    1フレーム分の顔をまとめて最近傍検索する。
+    target_data: { "Name": [encoding, ...] } (旧形式の単一エンコーディングも可)
+    index: 大規模な登録データ用の近似最近傍インデックス (ann_index.IVFIndex)。指定時は検索を委譲する。
+    """
+
+    def __init__(self, target_data, index=None):
+        self.index = index
+        self._gallery_path = None
+        self.names = list(target_data.keys())
+        rows = []
+        labels = []
+        for label, name in enumerate(self.names):
+            enc_list = target_data[name]
+            # 互換性のため、単一エンコーディングの場合はリストとして扱う
+            if not isinstance(enc_list, list):
+                enc_list = [enc_list]
+            for enc in enc_list:
+                rows.append(np.asarray(enc, dtype=np.float32).reshape(ENCODING_DIM))
+                labels.append(label)
+
+        if rows:
+            self.matrix = np.ascontiguousarray(np.stack(rows))
+        else:
+            self.matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self._sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+
+    @classmethod
+    def from_gallery(cls, gallery, index=None):
+        """
+        gallery.Gallery の memmap をコピーせずにそのまま使う。
+        削除済みの行は |m|^2 を無限大にして、最近傍に選ばれないようにする。
+        """
+        self = cls.__new__(cls)
+        self.index = index
+        self._gallery_path = gallery.path
+        self.names = list(gallery.names)
+        self.matrix = gallery.encodings
+        self.labels = gallery.labels
+        self._sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self._sq_norms[~gallery.alive] = np.inf
+        self._alive_count = len(gallery)
+        return self
+
+    def __reduce__(self):
+        # ギャラリー由来の場合はパスだけを渡し、スキャン用プロセス側で memmap を開き直す。
+        # 保存済みのインデックスも同じくファイルのパスだけを渡し、プロセスごとに1回だけ読み込む
+        if self._gallery_path is not None:
+            index = self.index
+            if index is not None and getattr(index, "path", None):
+                return (_matcher_from_gallery_path, (self._gallery_path, None, index.path, index.nprobe))
+            return (_matcher_from_gallery_path, (self._gallery_path, index))
+        return object.__reduce__(self)
+
+    def __len__(self):
+        return getattr(self, "_alive_count", len(self.matrix))
+
+    def match(self, encodings):
+        """
+        各顔エンコーディングについて、最も近い登録人物とその距離を返す。
+        戻り値: [(best_name, best_dist), ...] (該当なしは (None, 1.0))
+        """
+        if len(encodings) == 0:
+            return []
+        if self.index is not None:
+            return self.index.match(encodings)
+        if len(self) == 0:
+            return [(None, 1.0)] * len(encodings)
+
+        queries64 = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM)
+        queries = queries64.astype(np.float32)
+
+        # |q - m|^2 = |q|^2 + |m|^2 - 2 q・m を全組み合わせについて一括計算
+        q_sq = np.einsum("ij,ij->i", queries, queries)
+        d2 = q_sq[:, None] + self._sq_norms[None, :] - 2.0 * (queries @ self.matrix.T)
+        best_rows = np.argmin(d2, axis=1)
+
+        # 採用した行だけ float64 で正確な距離を計算し直す (face_recognition.face_distance と同じ定義)
+        diff = self.matrix[best_rows].astype(np.float64) - queries64
+        best_dists = np.linalg.norm(diff, axis=1)
+
+        results = []
+        for row, dist in zip(best_rows, best_dists):
+            # 従来通り、距離 1.0 以上は該当なしとして扱う
+            if dist < 1.0:
+                results.append((self.names[self.labels[row]], float(dist)))
+            else:
+                results.append((None, 1.0))
+        return results
+
+
+def _matcher_from_gallery_path(path, index=None, index_path=None, nprobe=8):
+    from gallery import Gallery
+    gallery = Gallery(path)
+    if index_path is not None:
+        from ann_index import load_index_cached, load_or_build_index
+        try:
+            index = load_index_cached(index_path, nprobe=nprobe)
+        except Exception as e:
+            print(f"  Warning: 顔インデックスを読み込めませんでした ({e})。作り直します。")
+            index = load_or_build_index(path, gallery, nprobe=nprobe)
+    return FaceMatcher.from_gallery(gallery, index=index)
@@ -0,0 +1,75 @@
+def box_iou(a, b):
+    """(top, right, bottom, left) 同士の IoU"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTracker:
+    """
+    連続するサンプルフレーム間で、同じ位置にいる顔を IoU で対応付けて人物の判定を引き継ぐ。
+    引き継げた顔は face_encodings / 照合を省略し、新しい顔・見失った顔・一定回数引き継いだ顔だけを
+    エンコードし直す。見つからなかったトラックはそのフレームで破棄する。
+    人物と判定できなかった顔 (該当なし、または距離が match_threshold 以上) は引き継がず、毎回エンコードする
+    (横顔から正面に向き直った場合などに、未判定のまま検出を取りこぼさないため)。
+    引き継いだ顔の距離は最後にエンコードしたときの値なので、最大 reencode_every - 1 サンプル分古い。
+    """
+
+    def __init__(self, iou_threshold=0.5, reencode_every=4, match_threshold=1.0):
+        self.iou_threshold = iou_threshold
+        self.reencode_every = max(1, int(reencode_every))
+        self.match_threshold = match_threshold
+        self.tracks = [] # [{"box", "name", "dist", "age"}] (age: 最後にエンコードしてから引き継いだ回数)
+        self.counters = {"encoded": 0, "reused": 0}
+
+    def assign(self, face_locations):
+        """
+        各顔に対応するトラックの番号を返す。
+        引き継ぎ不可 (新しい顔・再エンコードの時期) の場合は None。
+        """
+        pairs = []
+        for i, box in enumerate(face_locations):
+            for j, track in enumerate(self.tracks):
+                v = box_iou(box, track["box"])
+                if v >= self.iou_threshold:
+                    pairs.append((v, i, j))
+        # IoU の大きい組から貪欲に対応付ける (1つのトラックは1つの顔にだけ引き継ぐ)
+        assigned = [None] * len(face_locations)
+        used = set()
+        for v, i, j in sorted(pairs, reverse=True):
+            if assigned[i] is None and j not in used:
+                assigned[i] = j
+                used.add(j)
+        for i, j in enumerate(assigned):
+            if j is None:
+                continue
+            track = self.tracks[j]
+            if track["age"] + 1 >= self.reencode_every or not track["name"] or track["dist"] >= self.match_threshold:
+                assigned[i] = None
+        return assigned
+
+    def update(self, face_locations, assigned, new_matches):
+        """
+        このフレームの結果でトラックを更新し、全顔分の [(name, dist), ...] を返す。
+        new_matches: assigned が None だった顔について、エンコード・照合した結果 (同じ順番)
+        """
+        new_iter = iter(new_matches)
+        matches = []
+        tracks = []
+        for box, j in zip(face_locations, assigned):
+            if j is None:
+                name, dist = next(new_iter)
+                tracks.append({"box": box, "name": name, "dist": dist, "age": 0})
+                self.counters["encoded"] += 1
+            else:
+                prev = self.tracks[j]
+                name, dist = prev["name"], prev["dist"]
+                tracks.append({"box": box, "name": name, "dist": dist, "age": prev["age"] + 1})
+                self.counters["reused"] += 1
+            matches.append((name, dist))
+        self.tracks = tracks
+        return matches
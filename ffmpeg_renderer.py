@@ -0,0 +1,233 @@
+import os
+import re
+import shutil
+import tempfile
+import logging
+import subprocess
+
+import imageio_ffmpeg
+
+# render_story と同じ出力形式
+TARGET_W, TARGET_H = 1280, 720
+FPS = 24
+AUDIO_RATE = 44100
+
+# 縦長・比率の違う動画の背景のボカシ (cv2.GaussianBlur の (51, 51) カーネルの既定の sigma と同じ)。
+# 強くぼかすので、1/BOKEH_DOWNSCALE の解像度でぼかしてから拡大する (見た目は同じで計算は 1/16)
+BOKEH_SIGMA = 8.0
+BOKEH_DOWNSCALE = 4
+
+# BGM の音量 (元の音声は 1.0 のまま重ねる)
+BGM_VOLUME = 0.3
+BGM_FADE_OUT = 2.0
+
+# 色フィルター (render_story.apply_color_filter と同じ計算。val は 0〜255 の RGB の各チャンネル)
+COLOR_FILTERS = {
+    "Film": ("val*1.1-10", "val*1.1-10", "(val*1.1-10)*1.1"),
+    "Sunset": ("val*1.2", "val*1.1", "val*0.8"),
+    "Nostalgic": ("val*1.15*0.9+15", "val*1.05*0.9+15", "val*0.85*0.9+15"),
+    "Vivid": ("((val-128)*1.3+128)*1.1",) * 3,
+    "Pastel": ("(val*0.6+90)*1.15", "val*0.6+90", "(val*0.6+90)*1.10"),
+}
+
+
+class FFmpegRenderError(Exception):
+    """ffmpeg でのレンダリングに失敗した (呼び出し側は MoviePy での描画に切り替える)"""
+
+
+def _startupinfo():
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return startupinfo
+
+
+def probe_video(path):
+    """動画の {"size": 回転を反映した (幅, 高さ), "duration", "has_audio"} を返す (ffprobe は使わない)"""
+    # 回転した動画で出る「サイズが違う」の警告を抑える
+    log = logging.getLogger("imageio_ffmpeg")
+    level = log.level
+    log.setLevel(logging.ERROR)
+    try:
+        reader = imageio_ffmpeg.read_frames(path)
+        try:
+            meta = next(reader)
+        finally:
+            reader.close()
+    finally:
+        log.setLevel(level)
+    return {"size": tuple(meta["size"]), "duration": float(meta.get("duration") or 0.0),
+            "has_audio": bool(meta.get("audio_codec"))}
+
+
+def probe_duration(path):
+    """音声ファイルなどの長さ (秒)。ffmpeg -i の出力から読む"""
+    result = subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-i", path],
+                            capture_output=True, startupinfo=_startupinfo())
+    m = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr.decode("utf-8", errors="ignore"))
+    if not m:
+        raise FFmpegRenderError(f"長さを取得できませんでした: {path}")
+    return int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3))
+
+
+def color_filter_chain(filter_type):
+    """色フィルターの ffmpeg フィルター (None: フィルターなし)"""
+    if not filter_type or filter_type == "None":
+        return None
+    if filter_type == "Cinema":
+        # (val*1.25-20) の後に 30% だけ3チャンネルの平均に寄せる = r' = 1.0r + 0.125g + 0.125b - 20。
+        # colorchannelmixer には定数項が無いので先に各チャンネルから 16 (= 20 / 1.25) を引く
+        # (チャンネルが 16 未満の暗い部分だけ、わずかに明るめになる)
+        return ("format=gbrp,lutrgb=r='clip(val-16,0,255)':g='clip(val-16,0,255)':b='clip(val-16,0,255)',"
+                "colorchannelmixer=rr=1.0:rg=0.125:rb=0.125:gr=0.125:gg=1.0:gb=0.125:br=0.125:bg=0.125:bb=1.0")
+    exprs = COLOR_FILTERS.get(filter_type)
+    if exprs is None:
+        return None
+    r, g, b = (f"'clip({e},0,255)'" for e in exprs)
+    # RGB のパック形式より、プレーン形式 (gbrp) の方が変換が軽い
+    return f"format=gbrp,lutrgb=r={r}:g={g}:b={b}"
+
+
+def _normalize_chain(src, label, size):
+    """1280x720 のキャンバスに収める (縦長・比率の違う動画はボカした背景を敷く)。render_story と同じ判定"""
+    w, h = size
+    is_vertical = h > w
+    ratio_diff = abs((w / h) - (TARGET_W / TARGET_H))
+    if is_vertical or ratio_diff > 0.1:
+        small_w, small_h = TARGET_W // BOKEH_DOWNSCALE, TARGET_H // BOKEH_DOWNSCALE
+        return (f"[{src}]fps={FPS},split=2[{label}bg][{label}fg];"
+                f"[{label}bg]scale={small_w}:{small_h}:force_original_aspect_ratio=increase,"
+                f"crop={small_w}:{small_h},gblur=sigma={BOKEH_SIGMA / BOKEH_DOWNSCALE},"
+                f"scale={TARGET_W}:{TARGET_H}[{label}bgb];"
+                f"[{label}fg]scale={TARGET_W}:{TARGET_H}:force_original_aspect_ratio=decrease[{label}fgs];"
+                f"[{label}bgb][{label}fgs]overlay=(W-w)/2:(H-h)/2,setsar=1")
+    return (f"[{src}]fps={FPS},scale={TARGET_W}:{TARGET_H}:force_original_aspect_ratio=decrease,"
+            f"pad={TARGET_W}:{TARGET_H}:(ow-iw)/2:(oh-ih)/2:black,setsar=1")
+
+
+def bgm_chain(src, label, bgm_duration, video_duration, placement):
+    """
+    BGM を動画の長さに合わせるフィルター (render_story の MoviePy 版と同じ配置)。
+    placement="tail": ループせず、20秒以降で動画の終わりに合わせて配置する。
+    placement="loop": 足りない分は 3秒 (最大で長さの 1/3) のクロスフェードでつなぐ。
+    配置できない (動画が短すぎる) 場合は None。
+    """
+    if placement == "tail":
+        start = max(20.0, video_duration - bgm_duration)
+        if start >= video_duration:
+            return None
+        delay = int(round(start * 1000))
+        chain = f"[{src}]atrim=0:{video_duration - start:.3f},adelay={delay}|{delay},"
+    else:
+        if bgm_duration < video_duration:
+            crossfade = min(3.0, bgm_duration / 3)
+            copies = 1
+            current_len = bgm_duration
+            while current_len < video_duration + crossfade:
+                copies += 1
+                current_len += bgm_duration - crossfade
+            parts = [f"[{src}]asplit={copies}" + "".join(f"[{label}c{i}]" for i in range(copies))]
+            prev = f"{label}c0"
+            for i in range(1, copies):
+                parts.append(f"[{prev}][{label}c{i}]acrossfade=d={crossfade:.3f}:c1=tri:c2=tri[{label}x{i}]")
+                prev = f"{label}x{i}"
+            chain = ";".join(parts) + f";[{prev}]atrim=0:{video_duration:.3f},"
+        else:
+            chain = f"[{src}]atrim=0:{video_duration:.3f},"
+    return (chain + f"asetpts=PTS-STARTPTS,afade=t=out:st={max(0.0, video_duration - BGM_FADE_OUT):.3f}:d={BGM_FADE_OUT},"
+            f"volume={BGM_VOLUME}[{label}]")
+
+
+def build_render_graph(segments, bgm=None):
+    """
+    segments を1本の動画にする ffmpeg の (入力の引数, filter_complex) を返す。出力は [vout] と [aout]。
+      {"kind": "clip", "path", "start", "duration", "size", "has_audio", "color_filter", "overlay": PNG または None}
+      {"kind": "card", "image": PNG, "duration", "fade_in", "fade_out"}
+    bgm: {"path", "duration", "placement": "tail" | "loop"} または None
+    """
+    inputs = []
+    graph = []
+    concat_labels = []
+    total = 0.0
+
+    def add_input(args):
+        inputs.extend(args)
+        return sum(1 for a in inputs if a == "-i") - 1
+
+    for n, seg in enumerate(segments):
+        dur = float(seg["duration"])
+        v, a = f"v{n}", f"a{n}"
+        if seg["kind"] == "card":
+            # 静止画は1回だけデコードして、フィルター内で繰り返す (-loop 1 だと毎フレーム PNG をデコードする)
+            k = add_input(["-i", seg["image"]])
+            frames = int(round(dur * FPS))
+            chain = f"[{k}:v]format=gbrp,setsar=1,loop=loop={frames - 1}:size=1:start=0,setpts=N/{FPS}/TB"
+            if seg.get("fade_in"):
+                chain += f",fade=t=in:st=0:d={seg['fade_in']}"
+            if seg.get("fade_out"):
+                chain += f",fade=t=out:st={dur - seg['fade_out']:.3f}:d={seg['fade_out']}"
+            graph.append(chain + f",trim=duration={dur:.3f},setpts=PTS-STARTPTS[{v}]")
+            graph.append(f"anullsrc=r={AUDIO_RATE}:cl=stereo,atrim=duration={dur:.3f}[{a}]")
+        else:
+            k = add_input(["-ss", f"{seg['start']:.3f}", "-t", f"{dur:.3f}", "-i", seg["path"]])
+            chain = _normalize_chain(f"{k}:v", v, seg["size"])
+            color = color_filter_chain(seg.get("color_filter"))
+            if color:
+                chain += "," + color
+            # 動画の終わりに近い場合は最後のフレームで埋めて長さを揃える
+            chain += f",tpad=stop_mode=clone:stop_duration={dur:.3f},trim=duration={dur:.3f},setpts=PTS-STARTPTS"
+            if seg.get("overlay"):
+                # 1枚の画像を重ね続ける (overlay は重ねる側が終わると最後のフレームを使い続ける)
+                o = add_input(["-i", seg["overlay"]])
+                graph.append(chain + f"[{v}base]")
+                graph.append(f"[{v}base][{o}:v]overlay=0:0:eof_action=repeat[{v}]")
+            else:
+                graph.append(chain + f"[{v}]")
+            if seg.get("has_audio"):
+                graph.append(f"[{k}:a]aresample={AUDIO_RATE},aformat=sample_fmts=fltp:channel_layouts=stereo,"
+                             f"apad,atrim=duration={dur:.3f},asetpts=PTS-STARTPTS[{a}]")
+            else:
+                graph.append(f"anullsrc=r={AUDIO_RATE}:cl=stereo,atrim=duration={dur:.3f}[{a}]")
+        concat_labels.append(f"[{v}][{a}]")
+        total += dur
+
+    graph.append("".join(concat_labels) + f"concat=n={len(segments)}:v=1:a=1[vcat][acat]")
+    graph.append("[vcat]format=yuv420p[vout]")
+
+    bgm_graph = None
+    if bgm:
+        b = add_input(["-i", bgm["path"]])
+        bgm_graph = bgm_chain(f"{b}:a", "bgm", bgm["duration"], total, bgm["placement"])
+    if bgm_graph:
+        graph.append(bgm_graph)
+        graph.append("[acat][bgm]amix=inputs=2:duration=first:normalize=0[aout]")
+    else:
+        graph.append("[acat]anull[aout]")
+    return inputs, ";\n".join(graph)
+
+
+def render_with_ffmpeg(segments, output_path, bgm=None, threads=4):
+    """segments を ffmpeg 1回の実行で output_path (H.264 / AAC) に書き出す。失敗したら FFmpegRenderError"""
+    inputs, graph = build_render_graph(segments, bgm)
+    work_dir = tempfile.mkdtemp(prefix="render_ffmpeg_")
+    try:
+        # フィルターが長くなるので、コマンドラインではなくファイルで渡す (Windows の長さ制限対策)
+        script_path = os.path.join(work_dir, "filter_complex.txt")
+        with open(script_path, "w", encoding="utf-8") as f:
+            f.write(graph)
+        cmd = [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-hide_banner", "-loglevel", "error", "-stats",
+               *inputs,
+               "-filter_complex_script", script_path,
+               "-map", "[vout]", "-map", "[aout]",
+               "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-r", str(FPS),
+               "-c:a", "aac", "-ar", str(AUDIO_RATE),
+               "-threads", str(threads),
+               output_path]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=_startupinfo())
+        if result.returncode != 0:
+            err = result.stderr.decode("utf-8", errors="ignore").strip().splitlines()
+            raise FFmpegRenderError("\n".join(err[-10:]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return output_path
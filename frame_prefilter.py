@@ -0,0 +1,107 @@
+import time
+import cv2
+import numpy as np
+
+# 判定に使う縮小画像の幅 (これくらいでも「動いたか」「肌色があるか」は十分わかる)
+TINY_WIDTH = 96
+
+
+class FramePrefilter:
+    """
+    顔検出の前に、顔が新しく映っている可能性の無いフレームを安価に見分けて検出を省略する。
+    mode:
+      "off"    : 何もしない (従来通り全フレームで検出)
+      "static" : 直前に検出を行って顔が無かったフレームから、ほとんど変化していなければ省略
+      "skin"   : 縮小画像に肌色の画素がほとんど無ければ省略
+      "all"    : static と skin の両方
+    """
+
+    def __init__(self, mode="off", static_threshold=0.15, skin_ratio=0.003, max_skips=8):
+        self.mode = mode
+        self.use_static = mode in ("static", "all")
+        self.use_skin = mode in ("skin", "all")
+        self.static_threshold = static_threshold # 0-10 の motion_score と同じ尺度
+        self.skin_ratio = skin_ratio
+        self.max_skips = max_skips # 取りこぼし防止: 連続してこれ以上は省略しない
+
+        self._ref_tiny = None # 最後に検出を行って顔が無かったフレーム
+        self._pending_tiny = None
+        self._consecutive = 0
+        self.counters = {"sampled": 0, "skipped_static": 0, "skipped_skin": 0, "detected": 0}
+        self.detect_sec = 0.0
+        self.filter_sec = 0.0
+
+    @property
+    def enabled(self):
+        return self.use_static or self.use_skin
+
+    def _tiny(self, sample):
+        rgb = sample.rgb_small
+        h, w = rgb.shape[:2]
+        if w <= TINY_WIDTH:
+            return rgb
+        return cv2.resize(rgb, (TINY_WIDTH, max(1, int(h * TINY_WIDTH / w))), interpolation=cv2.INTER_AREA)
+
+    def should_skip(self, sample):
+        """検出を省略してよいフレームなら理由 ("static" / "skin")、そうでなければ None"""
+        self.counters["sampled"] += 1
+        if not self.enabled or self._consecutive >= self.max_skips:
+            self._pending_tiny = self._tiny(sample) if self.use_static else None
+            return None
+
+        t0 = time.perf_counter()
+        tiny = self._tiny(sample)
+        self._pending_tiny = tiny
+        reason = None
+        if self.use_static and self._ref_tiny is not None and self._ref_tiny.shape == tiny.shape:
+            diff = cv2.absdiff(cv2.cvtColor(tiny, cv2.COLOR_RGB2GRAY), cv2.cvtColor(self._ref_tiny, cv2.COLOR_RGB2GRAY))
+            if np.mean(diff) / 25.5 < self.static_threshold:
+                reason = "static"
+        if reason is None and self.use_skin and skin_pixel_ratio(tiny) < self.skin_ratio:
+            reason = "skin"
+        self.filter_sec += time.perf_counter() - t0
+
+        if reason:
+            self.counters[f"skipped_{reason}"] += 1
+            self._consecutive += 1
+        return reason
+
+    def record_detection(self, face_count, elapsed_sec):
+        """検出を行ったフレームの結果を記録する (顔が無ければ static 判定の基準フレームにする)"""
+        self.counters["detected"] += 1
+        self.detect_sec += elapsed_sec
+        self._consecutive = 0
+        self._ref_tiny = self._pending_tiny if face_count == 0 else None
+
+    def stats(self):
+        """カウンタと、省略した検出時間から見積もった (顔検出部分の) 高速化率"""
+        skipped = self.counters["skipped_static"] + self.counters["skipped_skin"]
+        avg_detect = self.detect_sec / self.counters["detected"] if self.counters["detected"] else 0.0
+        out = dict(self.counters)
+        out["skipped"] = skipped
+        out["detect_sec"] = round(self.detect_sec, 3)
+        out["filter_sec"] = round(self.filter_sec, 3)
+        out["est_saved_sec"] = round(avg_detect * skipped, 3)
+        out["est_speedup"] = _speedup(out)
+        return out
+
+
+def skin_pixel_ratio(rgb):
+    """YCrCb の典型的な肌色範囲に入る画素の割合"""
+    ycrcb = cv2.cvtColor(rgb, cv2.COLOR_RGB2YCrCb)
+    mask = cv2.inRange(ycrcb, (0, 133, 77), (255, 173, 127))
+    return cv2.countNonZero(mask) / float(mask.size)
+
+
+def merge_prefilter_stats(total, stats):
+    """run_scan で動画ごとの stats を合算する"""
+    for key in ("sampled", "skipped_static", "skipped_skin", "detected", "skipped", "detect_sec", "filter_sec", "est_saved_sec"):
+        total[key] = total.get(key, 0) + stats.get(key, 0)
+    total["est_speedup"] = _speedup(total)
+    return total
+
+
+def _speedup(stats):
+    # 全フレームで検出した場合の見積もり時間 / 実際の (検出 + プレフィルタ) 時間
+    spent = stats["detect_sec"] + stats["filter_sec"]
+    return round((stats["detect_sec"] + stats["est_saved_sec"]) / spent, 2) if spent > 0 else 1.0
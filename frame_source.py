@@ -0,0 +1,527 @@
+import os
+import queue
+import subprocess
+import threading
+import cv2
+import numpy as np
+
+# シーク1回あたりのオーバーヘッド（デコードフレーム数換算の概算値）
+SEEK_OVERHEAD_FRAMES = 16
+
+# GOP長の推定に読むパケット数の上限
+GOP_PROBE_PACKETS = 300
+
+
+def probe_gop_size(video_path, max_packets=GOP_PROBE_PACKETS):
+    """
+    先頭パケットのキーフレーム間隔から GOP 長（フレーム数）を推定する。
+    デコードは行わず、同梱の ffmpeg で -c copy のパケットフラグだけを読む。
+    推定できない場合は None を返す。
+    """
+    try:
+        import imageio_ffmpeg
+        ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
+        cmd = [
+            ffmpeg_exe, "-v", "error",
+            "-i", video_path,
+            "-map", "0:v:0", "-c", "copy",
+            "-frames:v", str(max_packets),
+            "-f", "framecrc", "-"
+        ]
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        result = subprocess.run(cmd, capture_output=True, text=True, startupinfo=startupinfo, timeout=30)
+        if result.returncode != 0:
+            return None
+
+        # framecrc: キーフレーム(flags=1)は "F=" が省略され、それ以外は "F=0x0" などが付く
+        keyframes = []
+        packet_count = 0
+        for line in result.stdout.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            flags = 1
+            if "F=0x" in line:
+                flags = int(line.rsplit("F=0x", 1)[1].strip(), 16)
+            if flags & 1:
+                keyframes.append(packet_count)
+            packet_count += 1
+
+        if packet_count == 0:
+            return None
+        if len(keyframes) < 2:
+            # 読んだ範囲にキーフレームが1つしかない = GOP はそれ以上に長い
+            return packet_count
+
+        gaps = sorted(b - a for a, b in zip(keyframes, keyframes[1:]))
+        return max(1, gaps[len(gaps) // 2])
+    except Exception:
+        return None
+
+
+class Sample:
+    """
+    1サンプル分のフレーム。
+    rgb_small は顔検出用の縮小RGB画像、bgr は動きの計算用のBGR画像。
+    scale は bgr の元解像度に対する倍率（face_loc を bgr 上の座標に変換する際に使う）。
+    解析（感情・画質・サムネイル）には analysis_frame() を使う。
+    """
+    # PrefetchingFrameSource が先に始めておいた顔検出 (concurrent.futures.Future、無ければ None)
+    detection = None
+
+    def __init__(self, index, rgb_small, bgr=None, scale=1.0, load_full=None):
+        self.index = index
+        self.rgb_small = rgb_small
+        self._bgr = bgr
+        self.scale = scale
+        self._load_full = load_full # 縮小済みのサンプルの場合、元解像度の BGR を読み込む関数 (frame_index -> BGR or None)
+        self._full = None
+
+    def analysis_frame(self):
+        """
+        解析用の (BGR 画像, 元解像度に対する倍率)。
+        縮小済みのサンプル (ffmpeg 読み込み) は元解像度のフレームを読み直し、OpenCV で読んだ場合と同じ画像で解析する。
+        """
+        if self._load_full is not None:
+            load, self._load_full = self._load_full, None
+            self._full = load(self.index)
+        if self._full is not None:
+            return self._full, 1.0
+        return self.bgr, self.scale
+
+    @property
+    def bgr(self):
+        if self._bgr is None:
+            self._bgr = cv2.cvtColor(self.rgb_small, cv2.COLOR_RGB2BGR)
+        return self._bgr
+
+    @property
+    def gray(self):
+        if self._bgr is not None:
+            return cv2.cvtColor(self._bgr, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(self.rgb_small, cv2.COLOR_RGB2GRAY)
+
+
+class FrameSource:
+    """
+    動画から指定フレームを取り出すための共通インターフェース。
+    read() には単調増加するフレーム番号を渡す前提で、戻り値は (ret, frame)。
+    """
+    name = "base"
+    # 再起動・シーク無しで続けて読めるフレーム番号の間隔 (この倍数ずつ進めると効率がよい)
+    frame_grid = 1
+    # True の場合、read_sample() の画像は読み込みバッファのコピーになる (再利用バッファを使う FrameSource のみ)
+    copy_samples = False
+
+    def __init__(self, video_path, cap=None):
+        self.video_path = video_path
+        self.cap = cap if cap is not None else cv2.VideoCapture(video_path)
+        self.position = 0 # 次に cap.read() したときに得られるフレーム番号
+        self.decoded_frames = 0 # 統計用: デコードしたフレーム数
+        self.seek_count = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def _seek(self, frame_index):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        self.position = frame_index
+        self.seek_count += 1
+
+    def _skip_to(self, frame_index):
+        # grab() はデコードのみで、BGRへの変換（retrieve）を省略できる
+        while self.position < frame_index:
+            if not self.cap.grab():
+                return False
+            self.position += 1
+            self.decoded_frames += 1
+        return True
+
+    def _read_current(self):
+        ret, frame = self.cap.read()
+        if ret:
+            self.position += 1
+            self.decoded_frames += 1
+        return ret, frame
+
+    def read(self, frame_index):
+        raise NotImplementedError
+
+    def read_sample(self, frame_index, resize_scale):
+        """指定フレームを読み、検出用の縮小RGBを添えた Sample を返す。読めなければ None。"""
+        ret, frame = self.read(frame_index)
+        if not ret:
+            return None
+        # BGR(OpenCV) -> RGB(face_recognition)
+        small_frame = cv2.resize(frame, (0, 0), fx=resize_scale, fy=resize_scale)
+        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        return Sample(frame_index, rgb_small_frame, bgr=frame, scale=1.0)
+
+    def release(self):
+        self.cap.release()
+
+
+class SeekFrameSource(FrameSource):
+    """
+    サンプルごとに cap.set() でシークする（従来の方式）。
+    gop_size が分かっている場合は、次のキーフレームを跨がないジャンプや
+    シークしても節約にならないジャンプでは grab() による読み飛ばしを使う。
+    """
+    name = "seek"
+
+    def __init__(self, video_path, gop_size=None, cap=None):
+        super().__init__(video_path, cap=cap)
+        self.gop_size = gop_size
+        if gop_size:
+            self.name = "keyframe"
+
+    def _should_seek(self, frame_index):
+        if frame_index < self.position or not self.gop_size:
+            return True
+        # ターゲット直前のキーフレームから読み直すコストと、現在位置から読み飛ばすコストを比較
+        keyframe = (frame_index // self.gop_size) * self.gop_size
+        if keyframe <= self.position:
+            return False
+        seek_cost = (frame_index - keyframe) + SEEK_OVERHEAD_FRAMES
+        skip_cost = frame_index - self.position
+        return seek_cost < skip_cost
+
+    def read(self, frame_index):
+        if frame_index != self.position:
+            if self._should_seek(frame_index):
+                self._seek(frame_index)
+            elif not self._skip_to(frame_index):
+                return False, None
+        return self._read_current()
+
+
+class SequentialFrameSource(FrameSource):
+    """先頭から順にデコードし、サンプル間のフレームは grab() で読み飛ばす。"""
+    name = "sequential"
+
+    def read(self, frame_index):
+        if frame_index < self.position:
+            # 巻き戻しが必要な場合のみシークする
+            self._seek(frame_index)
+        elif frame_index > self.position:
+            if self.position == 0 and frame_index > 0:
+                # 開始マージン分は一度だけシークして飛ばす
+                self._seek(frame_index)
+            elif not self._skip_to(frame_index):
+                return False, None
+        return self._read_current()
+
+
+class FFmpegPipeFrameSource(FrameSource):
+    """
+    同梱の ffmpeg を fps= + scale= のフィルタグラフ付きで起動し、
+    デコーダ側で間引き・縮小済みの RGB フレームをパイプ経由で読む。
+    解析 (感情・画質・サムネイル) 用の元解像度のフレームは、記録が確定した検出の分だけ
+    OpenCV で読み直す (read_full)。スコアは OpenCV で読んだ場合と同じになる。
+    フレームは BUFFER_RING 個の再利用バッファに順番に読み込むため、返したフレームは
+    BUFFER_RING - 1 回後の read() まで有効 (scan_video は今のサンプルと直前のサンプルを持つ)。
+    それより長く保持する場合 (先読み) は copy_samples を True にする。
+    """
+    name = "ffmpeg"
+
+    BUFFER_RING = 3
+
+    # これ以上先へのジャンプはパイプを読み捨てず ffmpeg を -ss で再起動する
+    RESTART_GAP_SEC = 10.0
+
+    def __init__(self, video_path, check_interval_sec=0.5, resize_scale=0.5, cap=None):
+        cap = cap if cap is not None else cv2.VideoCapture(video_path)
+        # メタデータのみ OpenCV から取得する (回転補正後のサイズ)
+        self.props = {prop: cap.get(prop) for prop in (
+            cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_COUNT,
+            cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT)}
+        self.opened = cap.isOpened()
+        cap.release()
+
+        self.video_path = video_path
+        self.position = 0
+        self.decoded_frames = 0
+        self.seek_count = 0
+        self.proc = None
+
+        self.fps = self.props[cv2.CAP_PROP_FPS]
+        self.step = max(1, int(self.fps * check_interval_sec)) if self.fps > 0 else 1
+        self.frame_grid = self.step
+        self.resize_scale = resize_scale
+        # cv2.resize(fx=resize_scale) と同じ丸めで出力サイズを決める
+        self.out_w = max(1, int(round(self.props[cv2.CAP_PROP_FRAME_WIDTH] * resize_scale)))
+        self.out_h = max(1, int(round(self.props[cv2.CAP_PROP_FRAME_HEIGHT] * resize_scale)))
+        self.buffers = [np.empty((self.out_h, self.out_w, 3), dtype=np.uint8) for _ in range(self.BUFFER_RING)]
+        self._views = [memoryview(buf).cast("B") for buf in self.buffers]
+        self._next_buffer = 0
+        self._full_source = None
+
+    def isOpened(self):
+        return self.opened and self.fps > 0
+
+    def get(self, prop_id):
+        return self.props.get(prop_id, 0.0)
+
+    def _start(self, frame_index):
+        import imageio_ffmpeg
+        self._stop()
+        start_sec = frame_index / self.fps
+        out_rate = self.fps / self.step
+        cmd = [
+            imageio_ffmpeg.get_ffmpeg_exe(), "-v", "error", "-nostdin",
+            "-ss", f"{start_sec:.6f}", "-i", self.video_path,
+            "-an", "-sn", "-dn",
+            # round=up: 各出力スロットの先頭フレームを採用し、OpenCV のフレーム番号と揃える
+            "-vf", f"fps={out_rate:.9f}:round=up,scale={self.out_w}:{self.out_h}",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"
+        ]
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     bufsize=self.buffers[0].nbytes * 2, startupinfo=startupinfo)
+        self.position = frame_index
+        self.seek_count += 1
+
+    def _stop(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdout.close()
+                self.proc.kill()
+                self.proc.wait()
+            except Exception:
+                pass
+            self.proc = None
+
+    def _read_into_buffer(self, view):
+        total = len(view)
+        got = 0
+        while got < total:
+            n = self.proc.stdout.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+        self.decoded_frames += 1
+        return True
+
+    def read(self, frame_index):
+        """frame_index のフレーム（縮小済み RGB）を返す。"""
+        gap = frame_index - self.position
+        # パイプからは position + k * step のフレームしか出てこないので、その並びに無いフレームも再起動して読む
+        if self.proc is None or gap < 0 or gap > self.RESTART_GAP_SEC * self.fps or gap % self.step != 0:
+            self._start(frame_index)
+
+        # 読み捨てるフレームも含めて、今回返すバッファに読み込む (前回までに返したバッファは上書きしない)
+        buffer, view = self.buffers[self._next_buffer], self._views[self._next_buffer]
+        # パイプからは step フレームおきのフレームしか出てこないので、目的の位置まで読み捨てる
+        while self.position + self.step <= frame_index:
+            if not self._read_into_buffer(view):
+                return False, None
+            self.position += self.step
+
+        if not self._read_into_buffer(view):
+            return False, None
+        self.position += self.step
+        self._next_buffer = (self._next_buffer + 1) % len(self.buffers)
+        return True, buffer
+
+    def read_sample(self, frame_index, resize_scale=None):
+        ret, rgb = self.read(frame_index)
+        if not ret:
+            return None
+        if self.copy_samples:
+            rgb = rgb.copy()
+        return Sample(frame_index, rgb, scale=self.resize_scale, load_full=self.read_full)
+
+    def read_full(self, frame_index):
+        """元解像度の BGR フレームを OpenCV で読む (読めなければ None)。解析する検出の分だけ呼ばれる"""
+        if self._full_source is None:
+            self._full_source = SeekFrameSource(self.video_path, gop_size=probe_gop_size(self.video_path))
+        ret, frame = self._full_source.read(frame_index)
+        return frame if ret else None
+
+    def release(self):
+        self._stop()
+        if self._full_source is not None:
+            self._full_source.release()
+            self._full_source = None
+
+
+class PrefetchingFrameSource:
+    """
+    別スレッドで次のサンプルを先読みして、上限付きのキューにためておく FrameSource のラッパー。
+    先読みする位置は planner(index, step) で決める (step は index の直前の間隔、最初は None)。
+    適応サンプリングでは AdaptiveSampler.predict_next を渡し、今の場面が続いた場合の間隔で先読みする。
+    要求されたフレームが先読みの続きにあればキューから返し (途中の先読みは捨てる)、
+    無い場合 (区間の移動・戻り・予測の外れ) はそのフレームから先読みをやり直す。
+    detect と executor を渡すと、先読みしたサンプルの顔検出もスレッドプールで始めておき、
+    結果を Sample.detection (Future) として返す。
+    dlib / onnxruntime / OpenCV は処理中に GIL を解放するため、デコード・検出と
+    呼び出し側の処理 (エンコード・照合など) を別のコアで並行に進められる。
+    """
+
+    def __init__(self, source, step, resize_scale, depth=4, detect=None, executor=None, end=None, planner=None):
+        self.source = source
+        self.step = max(1, int(step))
+        self.planner = planner or (lambda index, step: index + self.step)
+        self.resize_scale = resize_scale
+        self.depth = max(1, int(depth))
+        self.detect = detect if executor is not None else None
+        self.executor = executor
+        self.end = end
+        self.restarts = 0
+        self.skipped = 0 # 予測が外れて読み捨てた先読みの数
+        # 先読みしたサンプルはキューや検出中のスレッドが保持するので、再利用バッファのままでは渡せない
+        source.copy_samples = True
+
+        self._queue = None
+        self._thread = None
+        self._stop_flag = None
+
+    @property
+    def name(self):
+        return self.source.name
+
+    @property
+    def frame_grid(self):
+        return self.source.frame_grid
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def get(self, prop_id):
+        return self.source.get(prop_id)
+
+    def _produce(self, start, out, stop_flag):
+        index, step = start, None
+        while not stop_flag.is_set():
+            if self.end is not None and index >= self.end:
+                sample = None
+            else:
+                try:
+                    sample = self.source.read_sample(index, self.resize_scale)
+                except Exception as e:
+                    print(f"  Warning: フレームの先読みに失敗しました: {e}")
+                    sample = None
+            if sample is not None and self.detect is not None:
+                sample.detection = self.executor.submit(self.detect, sample.rgb_small)
+            while not stop_flag.is_set():
+                try:
+                    out.put((index, sample), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if sample is None:
+                return
+            next_index = max(index + 1, int(self.planner(index, step)))
+            index, step = next_index, next_index - index
+
+    def _stop(self):
+        if self._thread is None:
+            return
+        self._stop_flag.set()
+        # 待っている put を抜けさせるためにキューを空にし、始めていた検出は取り消す
+        while self._thread.is_alive():
+            self._drain()
+            self._thread.join(timeout=0.05)
+        self._drain()
+        self._thread = None
+
+    def _drain(self):
+        while True:
+            try:
+                _, sample = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(sample)
+
+    @staticmethod
+    def _discard(sample):
+        if sample is not None and sample.detection is not None:
+            sample.detection.cancel()
+
+    def _start(self, frame_index):
+        self._stop()
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._stop_flag = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True,
+                                        args=(frame_index, self._queue, self._stop_flag))
+        self._thread.start()
+        self.restarts += 1
+
+    def _take(self, frame_index):
+        """先読みの続きから frame_index のサンプルを取り出す。(見つかったか, サンプル) を返す"""
+        for _ in range(self.depth + 1):
+            index, sample = self._queue.get()
+            if index == frame_index:
+                return True, sample
+            if index > frame_index or sample is None:
+                # 要求より先まで進んでいる (戻り・間隔を狭めた) か、途中で先読みが止まっている
+                self._discard(sample)
+                return False, None
+            self._discard(sample)
+            self.skipped += 1
+        return False, None
+
+    def read_sample(self, frame_index, resize_scale=None):
+        found, sample = False, None
+        if self._thread is not None:
+            found, sample = self._take(frame_index)
+        if not found:
+            self._start(frame_index)
+            _, sample = self._queue.get()
+        if sample is None:
+            self._stop()
+        return sample
+
+    def release(self):
+        self._stop()
+        self.source.release()
+
+
+def choose_strategy(frame_step, gop_size, fps):
+    """GOP長とサンプリング間隔から、読み飛ばし方式かシーク方式かを決める。"""
+    if gop_size:
+        # サンプル間隔が GOP より短ければ、シークしてもキーフレームから同じだけデコードすることになる
+        if frame_step <= gop_size // 2 + SEEK_OVERHEAD_FRAMES:
+            return "sequential"
+        return "keyframe"
+    # GOP不明: 1秒以内の間隔なら読み飛ばしの方が安全に速い
+    if fps > 0 and frame_step <= fps:
+        return "sequential"
+    return "seek"
+
+
+def open_frame_source(video_path, check_interval_sec=0.5, strategy="auto", reader="opencv", resize_scale=0.5):
+    """
+    動画ごとに最適なフレーム取得方式を選んで FrameSource を返す。
+    reader: "opencv" | "ffmpeg" (ffmpeg はデコーダ側で縮小する)
+    strategy: "auto" | "sequential" | "keyframe" | "seek" (reader="opencv" の場合のみ有効)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if reader == "ffmpeg" and cap.isOpened():
+        return FFmpegPipeFrameSource(video_path, check_interval_sec=check_interval_sec,
+                                     resize_scale=resize_scale, cap=cap)
+    if not cap.isOpened():
+        return SeekFrameSource(video_path, cap=cap)
+
+    gop_size = None
+    if strategy in ("auto", "keyframe"):
+        gop_size = probe_gop_size(video_path)
+
+    if strategy == "auto":
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_step = max(1, int(fps * check_interval_sec))
+        strategy = choose_strategy(frame_step, gop_size, fps)
+
+    if strategy == "sequential":
+        return SequentialFrameSource(video_path, cap=cap)
+    if strategy == "keyframe":
+        return SeekFrameSource(video_path, gop_size=gop_size, cap=cap)
+    return SeekFrameSource(video_path, cap=cap)
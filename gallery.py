@@ -0,0 +1,331 @@
+import os
+import glob
+import time
+import pickle
+import contextlib
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ENCODING_DIM = 128
+
+# 顔ギャラリー (登録エンコーディング) のバイナリ形式
+#   <base>.gallery      : ヘッダ + float32 (N,128) の連続行列 (追記のみ)
+#   <base>.gallery.meta : ヘッダ + N 件の固定長メタデータ (人物名・登録元画像・登録日時・削除フラグ)
+# どちらも np.memmap でそのまま開けるため、スキャン用プロセスはファイルを共有するだけで済む。
+# 削除は削除フラグ (tombstone) を立てるだけで、行番号は変わらない。
+GALLERY_MAGIC = b"OMKGAL"
+META_MAGIC = b"OMKMET"
+GALLERY_VERSION = 1
+HEADER_SIZE = 64
+
+META_DTYPE = np.dtype([
+    ("name", "S96"),        # UTF-8
+    ("source", "S160"),     # 登録元画像のファイル名 (UTF-8)
+    ("added", "<i8"),       # 登録日時 (UNIX 時刻)
+    ("deleted", "u1"),      # 1 = 削除済み (tombstone)
+    ("_pad", "V7"),
+])
+
+# 削除済みの行がこの割合を超えたら、ファイルを詰め直す
+COMPACT_RATIO = 0.5
+
+# スキャン中 (ギャラリーを memmap で開いている間) に置く目印のファイル名: <base>.gallery.inuse.<pid>-<時刻>
+# 開かれているファイルは置き換えられない (Windows) か、古い内容を読み続ける (POSIX) ため、目印がある間は詰め直さない
+IN_USE_SUFFIX = ".inuse."
+
+
+def gallery_path_for(path):
+    """target_faces.pkl / target_faces.gallery のどちらを渡されてもギャラリーのパスを返す"""
+    return os.path.splitext(path)[0] + ".gallery"
+
+
+def legacy_pkl_path_for(path):
+    return os.path.splitext(path)[0] + ".pkl"
+
+
+def _header(magic, row_size):
+    head = magic + np.array([GALLERY_VERSION, row_size], dtype="<u4").tobytes()
+    return head.ljust(HEADER_SIZE, b"\0")
+
+
+def _check_header(f, magic, row_size):
+    head = f.read(HEADER_SIZE)
+    if len(head) < HEADER_SIZE or not head.startswith(magic):
+        raise ValueError(f"顔ギャラリーの形式が不正です: {f.name}")
+    version, size = np.frombuffer(head[len(magic):len(magic) + 8], dtype="<u4")
+    if version != GALLERY_VERSION or size != row_size:
+        raise ValueError(f"未対応の顔ギャラリーのバージョンです: {f.name} (v{version})")
+
+
+def _encode(text, dtype_field):
+    limit = META_DTYPE[dtype_field].itemsize
+    raw = str(text).encode("utf-8")
+    if len(raw) > limit:
+        # マルチバイト文字の途中で切らないように切り詰める
+        raw = raw[:limit].decode("utf-8", errors="ignore").encode("utf-8")
+    return raw
+
+
+class Gallery:
+    """
+    登録済みの顔エンコーディング。encodings / meta は読み取り専用の memmap。
+    追加・削除はファイルに直接書き込むので、変更後は open_gallery() で開き直す。
+    """
+
+    def __init__(self, path):
+        self.path = gallery_path_for(path)
+        self.meta_path = self.path + ".meta"
+        row_bytes = ENCODING_DIM * 4
+
+        with open(self.path, "rb") as f:
+            _check_header(f, GALLERY_MAGIC, row_bytes)
+        with open(self.meta_path, "rb") as f:
+            _check_header(f, META_MAGIC, META_DTYPE.itemsize)
+
+        # 追記途中で中断された場合に備え、両ファイルで揃っている行数だけを有効とする
+        n_enc = (os.path.getsize(self.path) - HEADER_SIZE) // row_bytes
+        n_meta = (os.path.getsize(self.meta_path) - HEADER_SIZE) // META_DTYPE.itemsize
+        n = int(min(n_enc, n_meta))
+
+        if n > 0:
+            self.encodings = np.memmap(self.path, dtype="<f4", mode="r", offset=HEADER_SIZE, shape=(n, ENCODING_DIM))
+            self.meta = np.memmap(self.meta_path, dtype=META_DTYPE, mode="r", offset=HEADER_SIZE, shape=(n,))
+        else:
+            self.encodings = np.empty((0, ENCODING_DIM), dtype=np.float32)
+            self.meta = np.empty(0, dtype=META_DTYPE)
+
+        self.alive = self.meta["deleted"] == 0
+        raw_names = self.meta["name"]
+        # 人物名は登録順 (最初に登録された順) に並べる
+        self.names = []
+        self.labels = np.full(n, -1, dtype=np.int32)
+        label_of = {}
+        for row in np.flatnonzero(self.alive):
+            name = raw_names[row].decode("utf-8")
+            if name not in label_of:
+                label_of[name] = len(self.names)
+                self.names.append(name)
+            self.labels[row] = label_of[name]
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    @property
+    def deleted_count(self):
+        return len(self.alive) - len(self)
+
+    def counts(self):
+        cnt = np.bincount(self.labels[self.alive], minlength=len(self.names))
+        return {name: int(c) for name, c in zip(self.names, cnt)}
+
+    def vectors_and_names(self):
+        """削除済みを除いた (M,128) float32 とその人物名の配列"""
+        rows = np.flatnonzero(self.alive)
+        names = np.asarray(self.names)[self.labels[rows]] if len(rows) else np.asarray([], dtype=str)
+        return np.ascontiguousarray(self.encodings[rows], dtype=np.float32), names
+
+    def to_dict(self):
+        """旧 target_faces.pkl と同じ { "Name": [encoding, ...] } 形式 (互換用)"""
+        data = {name: [] for name in self.names}
+        for row in np.flatnonzero(self.alive):
+            data[self.names[self.labels[row]]].append(np.asarray(self.encodings[row], dtype=np.float64))
+        return data
+
+    def entries(self, name):
+        """人物ごとの登録情報 [(source, added), ...]"""
+        out = []
+        for row in np.flatnonzero(self.alive):
+            if self.names[self.labels[row]] == name:
+                out.append((self.meta["source"][row].decode("utf-8"), int(self.meta["added"][row])))
+        return out
+
+
+def create_gallery(path):
+    path = gallery_path_for(path)
+    for p, magic, size in ((path, GALLERY_MAGIC, ENCODING_DIM * 4), (path + ".meta", META_MAGIC, META_DTYPE.itemsize)):
+        tmp_path = p + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_header(magic, size))
+        os.replace(tmp_path, p)
+
+
+def _trim_to_consistent(path):
+    """中断された追記の残り (片方のファイルにだけある行) を切り落とす"""
+    meta_path = path + ".meta"
+    row_bytes = ENCODING_DIM * 4
+    n = min((os.path.getsize(path) - HEADER_SIZE) // row_bytes,
+            (os.path.getsize(meta_path) - HEADER_SIZE) // META_DTYPE.itemsize)
+    for p, size in ((path, HEADER_SIZE + n * row_bytes), (meta_path, HEADER_SIZE + n * META_DTYPE.itemsize)):
+        if os.path.getsize(p) != size:
+            with open(p, "r+b") as f:
+                f.truncate(size)
+
+
+def append_encodings(path, name, encodings, source="", added=None):
+    """エンコーディングを末尾に追記する (既存の行は書き換えない)"""
+    path = gallery_path_for(path)
+    if not os.path.exists(path):
+        create_gallery(path)
+    _trim_to_consistent(path)
+
+    enc = np.asarray(encodings, dtype="<f4").reshape(-1, ENCODING_DIM)
+    meta = np.zeros(len(enc), dtype=META_DTYPE)
+    meta["name"] = _encode(name, "name")
+    meta["source"] = _encode(source, "source")
+    meta["added"] = int(time.time() if added is None else added)
+
+    # エンコーディング → メタデータの順に書く (メタデータの行数が有効行数になる)
+    with open(path, "ab") as f:
+        f.write(enc.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    with open(path + ".meta", "ab") as f:
+        f.write(meta.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def delete_name(path, name):
+    """人物の全エンコーディングに削除フラグを立てる。削除した件数を返す"""
+    gallery = Gallery(path)
+    rows = [row for row in np.flatnonzero(gallery.alive) if gallery.names[gallery.labels[row]] == name]
+    if not rows:
+        return 0
+    flag_offset = META_DTYPE.fields["deleted"][1]
+    with open(gallery.meta_path, "r+b") as f:
+        for row in rows:
+            f.seek(HEADER_SIZE + int(row) * META_DTYPE.itemsize + flag_offset)
+            f.write(b"\x01")
+        f.flush()
+        os.fsync(f.fileno())
+    del gallery
+
+    compact_if_needed(path)
+    return len(rows)
+
+
+def _needs_compaction(path):
+    gallery = Gallery(path)
+    total = len(gallery.alive)
+    return total > 0 and gallery.deleted_count / total > COMPACT_RATIO
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    if psutil is None:
+        return True # 確かめられない場合は使用中とみなす (詰め直しを見送るだけで、削除フラグで動作は変わらない)
+    return psutil.pid_exists(pid)
+
+
+@contextlib.contextmanager
+def gallery_in_use(path):
+    """この間はギャラリーを開いているものとして、他のプロセス・スレッドからの詰め直しを止める"""
+    marker = f"{gallery_path_for(path)}{IN_USE_SUFFIX}{os.getpid()}-{time.time_ns()}"
+    with open(marker, "w", encoding="utf-8"):
+        pass
+    try:
+        yield
+    finally:
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+
+
+def is_gallery_in_use(path):
+    """スキャンなどがギャラリーを開いている間は True (終了したプロセスが残した目印は消す)"""
+    prefix = gallery_path_for(path) + IN_USE_SUFFIX
+    for marker in glob.glob(glob.escape(prefix) + "*"):
+        try:
+            pid = int(marker[len(prefix):].split("-")[0])
+        except ValueError:
+            continue
+        if _pid_alive(pid):
+            return True
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+    return False
+
+
+def compact_if_needed(path):
+    """
+    削除済みの行が多ければ詰め直す。ギャラリーが使用中の場合は見送り、
+    次の削除時かスキャンの開始時に詰め直す。詰め直した場合は True。
+    """
+    if not os.path.exists(gallery_path_for(path)) or not _needs_compaction(path) or is_gallery_in_use(path):
+        return False
+    try:
+        compact_gallery(path)
+    except OSError as e:
+        # 他のアプリなどがファイルを開いている (Windows)。削除フラグのままでも結果は同じ
+        print(f"  Warning: 顔ギャラリーを詰め直せませんでした: {e}")
+        return False
+    return True
+
+
+def compact_gallery(path):
+    """
+    削除済みの行を取り除いてファイルを作り直す。
+    ファイルを置き換えるため、ギャラリーを開いているプロセスが無いときに呼ぶ (compact_if_needed を参照)。
+    """
+    path = gallery_path_for(path)
+    gallery = Gallery(path)
+    rows = np.flatnonzero(gallery.alive)
+    enc = np.ascontiguousarray(gallery.encodings[rows], dtype="<f4")
+    meta = np.array(gallery.meta[rows])
+    del gallery
+
+    for p, magic, size, body in ((path, GALLERY_MAGIC, ENCODING_DIM * 4, enc),
+                                 (path + ".meta", META_MAGIC, META_DTYPE.itemsize, meta)):
+        tmp_path = p + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_header(magic, size))
+            f.write(body.tobytes())
+        os.replace(tmp_path, p)
+
+
+def migrate_from_pkl(pkl_path, path=None):
+    """旧形式の target_faces.pkl をギャラリーに変換する。元ファイルは .pkl.migrated として残す"""
+    path = gallery_path_for(path or pkl_path)
+    with open(pkl_path, "rb") as f:
+        data = pickle.load(f)
+    if not isinstance(data, dict):
+        # 旧バージョン互換性（単一人物）
+        data = {"target": data}
+
+    added = os.path.getmtime(pkl_path)
+    tmp_path = os.path.splitext(path)[0] + ".migrating.gallery"
+    create_gallery(tmp_path)
+    for name, enc_list in data.items():
+        if not isinstance(enc_list, list):
+            enc_list = [enc_list]
+        if enc_list:
+            append_encodings(tmp_path, name, enc_list, source=os.path.basename(pkl_path), added=added)
+    os.replace(tmp_path + ".meta", path + ".meta")
+    os.replace(tmp_path, path)
+    os.replace(pkl_path, pkl_path + ".migrated")
+    print(f"  => 顔データを新形式に変換しました: {os.path.basename(path)} ({len(data)} 人)")
+
+
+def open_gallery(path, create=False):
+    """
+    ギャラリーを開く。ギャラリーが無く旧形式の pkl がある場合は自動で変換する。
+    見つからない場合は None (create=True なら空のギャラリーを作成)。
+    """
+    path = gallery_path_for(path)
+    if not os.path.exists(path) or not os.path.exists(path + ".meta"):
+        pkl_path = legacy_pkl_path_for(path)
+        if os.path.exists(pkl_path):
+            migrate_from_pkl(pkl_path, path)
+        elif create:
+            create_gallery(path)
+        else:
+            return None
+    return Gallery(path)
@@ -13,6 +13,25 @@ import imageio_ffmpeg
 from moviepy.editor import VideoFileClip, concatenate_videoclips, ColorClip, CompositeVideoClip, AudioFileClip, CompositeAudioClip, ImageClip
 from utils import resource_path, load_config, get_user_data_dir, get_ffprobe_path
 
+# 描画エンジン。config.json の "render_engine" で選ぶ。
+#   "moviepy" (既定): クリップごとに MoviePy で合成する (フレームごとに Python で処理)
+#   "ffmpeg"        : 同じ内容を1つの ffmpeg の filter_complex にまとめて1回で書き出す (失敗したら MoviePy で描画)
+RENDER_ENGINES = ("moviepy", "ffmpeg")
+
+# エンディングの文言 (ランダムに1つ)
+ED_TEXTS = [
+    "The Best is Yet to Come",
+    "Life is a Journey",
+    "Moments to Treasure",
+    "Timeless Memories",
+    "To Be Continued...",
+    "Every Day is a New Beginning",
+    "Cherish Every Moment",
+    "Our Story Continues",
+    "Always in Our Hearts",
+    "Focus on the Good"
+]
+
 
 def get_video_rotation(path):
     """ffprobeを使用して動画の回転メタデータを取得する。
@@ -50,10 +69,8 @@ def get_video_rotation(path):
 
 
 
-def add_date_overlay(frame, date_str):
-    from PIL import Image, ImageDraw, ImageFont
-    img_pil = Image.fromarray(frame)
-    draw = ImageDraw.Draw(img_pil)
+def draw_date_text(draw, date_str):
+    from PIL import ImageFont
     try:
         font_path = resource_path("assets/fonts/NotoSansJP-Bold.ttf")
         font = ImageFont.truetype(font_path, 40)
@@ -63,8 +80,20 @@ def add_date_overlay(frame, date_str):
     offset = 2
     draw.text((pos[0]+offset, pos[1]+offset), date_str, font=font, fill=(0,0,0))
     draw.text(pos, date_str, font=font, fill=(255,255,255))
+
+def add_date_overlay(frame, date_str):
+    from PIL import Image, ImageDraw
+    img_pil = Image.fromarray(frame)
+    draw_date_text(ImageDraw.Draw(img_pil), date_str)
     return np.array(img_pil)
 
+def date_overlay_image(date_str, width=1280, height=720):
+    """add_date_overlay と同じ文字を透明な画像に描く (ffmpeg で重ねる用)"""
+    from PIL import Image, ImageDraw
+    img_pil = Image.new('RGBA', (width, height), color=(0, 0, 0, 0))
+    draw_date_text(ImageDraw.Draw(img_pil), date_str)
+    return img_pil
+
 def apply_color_filter(frame, filter_type):
     if filter_type == "None" or not filter_type:
         return frame
@@ -114,7 +143,7 @@ def add_title_overlay(frame, title_text):
     cv2.putText(img, title_text, (text_x, text_y), font, scale, (255, 255, 255), thickness, cv2.LINE_AA)
     return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-def create_title_card(title_text, subtitle_text="", duration=3.0, font_size=80):
+def title_card_image(title_text, subtitle_text="", font_size=80):
     from PIL import Image, ImageDraw, ImageFont
     width, height = 1280, 720
     img_pil = Image.new('RGB', (width, height), color=(0, 0, 0))
@@ -138,9 +167,186 @@ def create_title_card(title_text, subtitle_text="", duration=3.0, font_size=80):
     draw_centered(title_text, font_title, y_offset=-20 if subtitle_text else 0)
     if subtitle_text:
         draw_centered(subtitle_text, font_sub, y_offset=60)
+    return img_pil
+
+def create_title_card(title_text, subtitle_text="", duration=3.0, font_size=80):
+    img_pil = title_card_image(title_text, subtitle_text, font_size)
     return ImageClip(np.array(img_pil)).set_duration(duration).set_fps(24)
 
-def render_documentary(playlist_path='story_playlist.json', config_path='config.json', output_dir='output', filter_type=None, bgm_enabled=None, focus=None):
+def resolve_media_path(path):
+    """見つからない場合は Unicode の正規化 (NFC/NFD) を変えて探す。見つからなければ None"""
+    if os.path.exists(path):
+        return path
+    import unicodedata
+    for form in ('NFC', 'NFD'):
+        normalized = unicodedata.normalize(form, path)
+        if os.path.exists(normalized):
+            return normalized
+    return None
+
+def story_titles(playlist, playlist_data):
+    """オープニングのタイトル・期間と、エンディングの文言 (op_title, period_str, ed_text)"""
+    period_str = ""
+    if playlist:
+        try:
+            dates = [c.get("timestamp", "").split(" ")[0] for c in playlist if c.get("timestamp")]
+            dates.sort()
+            if dates:
+                start_year = dates[0][:4]
+                end_year = dates[-1][:4]
+                if start_year == end_year:
+                    period_str = start_year
+                else:
+                    period_str = f"{start_year} - {end_year}"
+        except:
+            pass
+            
+    # OP: Title + Period
+    person_name = ""
+    if isinstance(playlist_data, dict):
+        person_name = playlist_data.get("person_name", "")
+        
+    if person_name:
+        op_title = f"The Story of {person_name}"
+    else:
+        op_title = "Memory Documentary"
+
+    # ED: Randomized Text
+    ed_text = random.choice(ED_TEXTS)
+    return op_title, period_str, ed_text
+
+def find_bgm_file(manual_bgm):
+    """プレイリストで選ばれた BGM のファイルを探す (正規化の違い・フォルダ内の同名ファイルも探す)。無ければ None"""
+    import unicodedata
+    print(f"DEBUG: Manual BGM Path from playlist: '{manual_bgm}'")
+    
+    candidates = []
+    if manual_bgm:
+        # 1. Try exact match
+        if os.path.exists(manual_bgm):
+            candidates = [manual_bgm]
+        else:
+            # 2. Try Unicode normalization (NFC/NFD)
+            normalized_nfc = unicodedata.normalize('NFC', manual_bgm)
+            normalized_nfd = unicodedata.normalize('NFD', manual_bgm)
+            
+            if os.path.exists(normalized_nfc):
+                candidates = [normalized_nfc]
+                print(f"DEBUG: Found BGM via NFC normalization: {normalized_nfc}")
+            elif os.path.exists(normalized_nfd):
+                candidates = [normalized_nfd]
+                print(f"DEBUG: Found BGM via NFD normalization: {normalized_nfd}")
+            else:
+                # 3. Try finding by filename in the bgm directory (loose match)
+                bgm_dir = os.path.dirname(manual_bgm)
+                bgm_name = os.path.basename(manual_bgm)
+                
+                if os.path.exists(bgm_dir):
+                    print(f"DEBUG: Searching in {bgm_dir} for {bgm_name}...")
+                    for f in os.listdir(bgm_dir):
+                        # Normalize both for comparison
+                        if unicodedata.normalize('NFC', f) == unicodedata.normalize('NFC', bgm_name):
+                            found_path = os.path.join(bgm_dir, f)
+                            candidates = [found_path]
+                            print(f"DEBUG: Found BGM via directory search: {found_path}")
+                            break
+    
+    if candidates:
+        # Use the first valid candidate
+        print(f"\n>>> Using Manually Selected BGM (Found): {candidates[0]}")
+        return candidates[0]
+    if manual_bgm:
+        print(f"DEBUG: Manual BGM path was provided but file not found: {manual_bgm}")
+    print(">>> No manual BGM selected. Proceeding without BGM.")
+    return None
+
+def render_documentary_ffmpeg(playlist, playlist_data, dominant_vibe, filter_type, bgm_enabled, output_path):
+    """
+    render_documentary と同じ構成 (OP・各クリップ・ED・BGM) を ffmpeg_renderer で1回の ffmpeg の実行にまとめて書き出す。
+    文字 (日付・タイトル) は MoviePy 版と同じ描画で画像にして重ねる。
+    ffmpeg で描画できなかった場合は False を返す (呼び出し側で MoviePy に切り替える)。
+    """
+    import shutil
+    import tempfile
+    from ffmpeg_renderer import render_with_ffmpeg, probe_video, probe_duration
+
+    print(f"\n>>>> ドキュメンタリーをレンダリング中 ({len(playlist)} clips, ffmpeg) <<<<")
+    work_dir = tempfile.mkdtemp(prefix="render_story_")
+    try:
+        segments = []
+        date_images = {}
+        for i, item in enumerate(playlist):
+            # NFC/NFD normalization check
+            video_path = resolve_media_path(item["video_path"])
+            if not video_path:
+                print(f"  [ERROR] File not found: {item['video_path']}")
+                continue
+            try:
+                info = probe_video(video_path)
+            except Exception as e:
+                print(f"  Error processing {video_path}: {e}")
+                continue
+
+            best_t = item["t"]
+            print(f"  [{i+1}/{len(playlist)}] Processing: {os.path.basename(video_path)} @ {best_t}s ({info['size'][0]}x{info['size'][1]})")
+
+            overlay = None
+            timestamp = item.get("timestamp", "")
+            if timestamp:
+                ds = timestamp.split(" ")[0].replace("-", "/")
+                if ds not in date_images:
+                    date_images[ds] = os.path.join(work_dir, f"date_{len(date_images)}.png")
+                    date_overlay_image(ds).save(date_images[ds])
+                overlay = date_images[ds]
+
+            segments.append({"kind": "clip", "path": video_path, "start": max(0, best_t - 1.5), "duration": 3.0,
+                             "size": info["size"], "has_audio": info["has_audio"],
+                             "color_filter": filter_type, "overlay": overlay})
+
+        if not segments:
+            # MoviePy でも同じく描画するものが無いので、切り替えずに終える
+            print("Error: No clips to concatenate.")
+            return True
+
+        # --- Add Opening and Ending ---
+        op_title, period_str, ed_text = story_titles(playlist, playlist_data)
+        op_path = os.path.join(work_dir, "op.png")
+        title_card_image(op_title, period_str).save(op_path)
+        ed_path = os.path.join(work_dir, "ed.png")
+        title_card_image(ed_text, "", font_size=50).save(ed_path)
+        segments = ([{"kind": "card", "image": op_path, "duration": 3.0, "fade_in": 1.0}] + segments +
+                    [{"kind": "card", "image": ed_path, "duration": 4.0, "fade_in": 1.0, "fade_out": 1.0}])
+
+        # BGMミキシング (感動的: ループせず動画の終わりに合わせる / それ以外: 必要に応じてループ)
+        bgm = None
+        if bgm_enabled and isinstance(playlist_data, dict):
+            bgm_file = find_bgm_file(playlist_data.get("manual_bgm_path", ""))
+            if bgm_file:
+                try:
+                    bgm = {"path": bgm_file, "duration": probe_duration(bgm_file),
+                           "placement": "tail" if dominant_vibe in ["感動的"] else "loop"}
+                    print(f"\n>>> BGMをミックス中: {bgm_file}")
+                except Exception as e:
+                    print(f"  BGMミキシングエラー: {e}")
+                    print(f"  BGMなしで続行します...")
+
+        print(f"\n>>> RENDERING FILE: {output_path}")
+        print(f"    (Engine: ffmpeg, Preset: ultrafast, FPS: 24, Segments: {len(segments)})")
+        render_with_ffmpeg(segments, output_path, bgm=bgm)
+        print(f"\n>>> DOCUMENTARY GENERATED SUCCESSFULLY: {output_path}")
+        return True
+    except Exception as e:
+        print(f"  ffmpeg でのレンダリングに失敗しました: {e}")
+        return False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def configured_render_engine(config):
+    """config.json の "render_engine" (未設定・不明な値なら "moviepy")"""
+    engine = config.get("render_engine", "moviepy")
+    return engine if engine in RENDER_ENGINES else "moviepy"
+
+def render_documentary(playlist_path='story_playlist.json', config_path='config.json', output_dir='output', filter_type=None, bgm_enabled=None, focus=None, engine=None):
     if not os.path.exists(playlist_path):
         print(f"Error: Playlist not found: {playlist_path}")
         return
@@ -181,19 +387,20 @@ def render_documentary(playlist_path='story_playlist.json', config_path='config.
     f_tag = f"_{focus}" if focus else ""
     output_path = os.path.join(output_dir, f"documentary_{timestamp_str}{f_tag}.mp4")
 
+    if engine is None:
+        engine = configured_render_engine(config)
+    if engine == "ffmpeg":
+        if render_documentary_ffmpeg(playlist, playlist_data, dominant_vibe, filter_type, bgm_enabled, output_path):
+            return
+        print(">>> MoviePy でレンダリングし直します...")
+
     final_clips = []
     print(f"\n>>>> ドキュメンタリーをレンダリング中 ({len(playlist)} clips) <<<<")
 
     for i, item in enumerate(playlist):
-        video_path = item["video_path"]
         # NFC/NFD normalization check
-        if not os.path.exists(video_path):
-            import unicodedata
-            video_path = unicodedata.normalize('NFC', item["video_path"])
-            if not os.path.exists(video_path):
-                video_path = unicodedata.normalize('NFD', item["video_path"])
-            
-        if not os.path.exists(video_path):
+        video_path = resolve_media_path(item["video_path"])
+        if not video_path:
             print(f"  [ERROR] File not found: {item['video_path']}")
             continue
             
@@ -342,48 +549,10 @@ def render_documentary(playlist_path='story_playlist.json', config_path='config.
     # クリップ情報から推測する。ここではシンプルに "Memory Documentary" とするか、
     # クリップがあればその期間を表示。
     
-    period_str = ""
-    if playlist:
-        try:
-            dates = [c.get("timestamp", "").split(" ")[0] for c in playlist if c.get("timestamp")]
-            dates.sort()
-            if dates:
-                start_year = dates[0][:4]
-                end_year = dates[-1][:4]
-                if start_year == end_year:
-                    period_str = start_year
-                else:
-                    period_str = f"{start_year} - {end_year}"
-        except:
-            pass
-            
-    # OP: Title + Period
-    person_name = ""
-    if isinstance(playlist_data, dict):
-        person_name = playlist_data.get("person_name", "")
-        
-    if person_name:
-        op_title = f"The Story of {person_name}"
-    else:
-        op_title = "Memory Documentary"
-        
+    op_title, period_str, ed_text = story_titles(playlist, playlist_data)
     op_clip = create_title_card(op_title, period_str, duration=3.0).fadein(1.0)
     
     # ED: To Be Continued...
-    # ED: Randomized Text
-    ed_texts = [
-        "The Best is Yet to Come",
-        "Life is a Journey",
-        "Moments to Treasure",
-        "Timeless Memories",
-        "To Be Continued...",
-        "Every Day is a New Beginning",
-        "Cherish Every Moment",
-        "Our Story Continues",
-        "Always in Our Hearts",
-        "Focus on the Good"
-    ]
-    ed_text = random.choice(ed_texts)
     ed_clip = create_title_card(ed_text, "", duration=4.0, font_size=50).fadein(1.0).fadeout(1.0)
     
     # 結合: OP + Main + ED
@@ -408,51 +577,9 @@ def render_documentary(playlist_path='story_playlist.json', config_path='config.
                 "かわいい": "cute"
             }
             
-            import unicodedata
-            
             # Check for manual BGM
-            manual_bgm = playlist_data.get("manual_bgm_path", "")
-            print(f"DEBUG: Manual BGM Path from playlist: '{manual_bgm}'")
-            
-            candidates = []
-            if manual_bgm:
-                # 1. Try exact match
-                if os.path.exists(manual_bgm):
-                    candidates = [manual_bgm]
-                else:
-                    # 2. Try Unicode normalization (NFC/NFD)
-                    normalized_nfc = unicodedata.normalize('NFC', manual_bgm)
-                    normalized_nfd = unicodedata.normalize('NFD', manual_bgm)
-                    
-                    if os.path.exists(normalized_nfc):
-                        candidates = [normalized_nfc]
-                        print(f"DEBUG: Found BGM via NFC normalization: {normalized_nfc}")
-                    elif os.path.exists(normalized_nfd):
-                        candidates = [normalized_nfd]
-                        print(f"DEBUG: Found BGM via NFD normalization: {normalized_nfd}")
-                    else:
-                        # 3. Try finding by filename in the bgm directory (loose match)
-                        bgm_dir = os.path.dirname(manual_bgm)
-                        bgm_name = os.path.basename(manual_bgm)
-                        
-                        if os.path.exists(bgm_dir):
-                            print(f"DEBUG: Searching in {bgm_dir} for {bgm_name}...")
-                            for f in os.listdir(bgm_dir):
-                                # Normalize both for comparison
-                                if unicodedata.normalize('NFC', f) == unicodedata.normalize('NFC', bgm_name):
-                                    found_path = os.path.join(bgm_dir, f)
-                                    candidates = [found_path]
-                                    print(f"DEBUG: Found BGM via directory search: {found_path}")
-                                    break
-            
-            if candidates:
-                # Use the first valid candidate
-                manual_bgm = candidates[0]
-                print(f"\n>>> Using Manually Selected BGM (Found): {manual_bgm}")
-            else:
-                if manual_bgm:
-                    print(f"DEBUG: Manual BGM path was provided but file not found: {manual_bgm}")
-                print(">>> No manual BGM selected. Proceeding without BGM.")
+            bgm_path = find_bgm_file(playlist_data.get("manual_bgm_path", ""))
+            candidates = [bgm_path] if bgm_path else []
                 
             if candidates:
                 bgm_file = candidates[0] # Only one candidate
@@ -612,9 +739,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--bgm", action="store_true")
     parser.add_argument("--no-bgm", action="store_false", dest="bgm")
+    parser.add_argument("--engine", choices=RENDER_ENGINES, default=None, help="描画エンジン (省略時は config.json の render_engine)")
     args = parser.parse_args()
 
     # 環境変数にセットして render_documentary 内で参照
     os.environ["RENDER_BGM"] = "1" if args.bgm else "0"
 
-    render_documentary()
+    render_documentary(engine=args.engine)
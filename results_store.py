@@ -0,0 +1,477 @@
+import os
+import json
+import sqlite3
+import threading
+import contextlib
+
+# スキャン結果の保存先。config.json の "results_backend" で選ぶ。
+#   "sqlite" (既定): scan_results.json と同じ内容を、動画・人物・検出のテーブルに分けて持つ。
+#                    scan_results.json があれば初回に取り込み、JSON が必要な場合は export_json で書き出せる。
+#   "jsonl"        : scan_results.json (スナップショット) + scan_results.log.jsonl (追記ログ) のテキストファイル。
+#                    変更はログに1行ずつ追記し、ログが大きくなったらスナップショットにまとめる。
+RESULTS_BACKENDS = ("sqlite", "jsonl")
+
+# ログをスナップショットにまとめる目安 (ログがこのサイズ以上、かつスナップショットの COMPACT_RATIO 倍以上)
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+COMPACT_RATIO = 0.5
+
+# results_backend = "sqlite" のテーブル
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    path TEXT PRIMARY KEY,
+    month TEXT,
+    date TEXT,
+    meta TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS people (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    person TEXT NOT NULL,
+    video TEXT NOT NULL,
+    t REAL NOT NULL,
+    month TEXT,
+    visual_score REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_person_video ON detections(person, video, t);
+CREATE INDEX IF NOT EXISTS idx_detections_person_month ON detections(person, month);
+CREATE INDEX IF NOT EXISTS idx_detections_person_score ON detections(person, visual_score);
+CREATE INDEX IF NOT EXISTS idx_detections_video ON detections(video);
+CREATE INDEX IF NOT EXISTS idx_videos_month ON videos(month);
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# GUI の削除と同じく、この差以内の時刻は同じ検出とみなす
+SAME_TIME_TOLERANCE = 0.01
+
+
+def results_db_path_for(results_path):
+    """scan_results.json のパスから、対応するデータベースのパスを返す"""
+    base, ext = os.path.splitext(results_path)
+    return results_path if ext == ".db" else base + ".db"
+
+
+def results_log_path_for(results_path):
+    """scan_results.json (スナップショット) に対応する追記ログのパス"""
+    return os.path.splitext(results_path)[0] + ".log.jsonl"
+
+
+class ResultsStore:
+    """
+    スキャン結果 (動画のメタデータ・人物ごとの検出) を SQLite (WAL) に保存する。
+    操作ごとに接続を開くので、GUI のバックグラウンドスレッドやスキャン中の別スレッドからも使える。
+    load() は従来の scan_results.json と同じ形 {"people": {...}, "metadata": {...}} を返す。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn: # 正常終了ならコミット、例外ならロールバック
+                yield conn
+        finally:
+            conn.close()
+
+    def _bump_revision(self, conn):
+        conn.execute("INSERT INTO info(key, value) VALUES ('revision', '1') "
+                     "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    def revision(self):
+        """書き込みのたびに増える番号 (GUI のキャッシュの判定用)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM info WHERE key = 'revision'").fetchone()
+        return int(row[0]) if row else 0
+
+    def is_empty(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM videos LIMIT 1").fetchone() is None
+
+    # --- 読み込み ---
+
+    def load(self, person=None):
+        """
+        従来の JSON と同じ形の辞書を返す。person を指定すると、その人物の検出と、
+        その人物が映っている動画のメタデータだけを読み込む。
+        """
+        people = {}
+        metadata = {}
+        with self._connect() as conn:
+            if person is None:
+                for (name,) in conn.execute("SELECT name FROM people ORDER BY rowid"):
+                    people[name] = {}
+                rows = conn.execute("SELECT person, video, data FROM detections ORDER BY id")
+                meta_rows = conn.execute("SELECT path, meta FROM videos ORDER BY rowid").fetchall()
+            else:
+                if conn.execute("SELECT 1 FROM people WHERE name = ?", (person,)).fetchone():
+                    people[person] = {}
+                rows = conn.execute("SELECT person, video, data FROM detections WHERE person = ? ORDER BY id", (person,))
+                meta_rows = conn.execute("SELECT path, meta FROM videos WHERE path IN "
+                                         "(SELECT DISTINCT video FROM detections WHERE person = ?) ORDER BY rowid",
+                                         (person,)).fetchall()
+            for name, video, data in rows:
+                people.setdefault(name, {}).setdefault(video, []).append(json.loads(data))
+            for path, meta in meta_rows:
+                metadata[path] = json.loads(meta)
+        return {"people": people, "metadata": metadata}
+
+    def video_metadata(self):
+        """{動画パス: メタデータ}"""
+        with self._connect() as conn:
+            return {path: json.loads(meta) for path, meta in conn.execute("SELECT path, meta FROM videos ORDER BY rowid")}
+
+    def video_detections(self, video_path):
+        """1本の動画の {人物: [検出, ...]}"""
+        out = {}
+        with self._connect() as conn:
+            for name, data in conn.execute("SELECT person, data FROM detections WHERE video = ? ORDER BY id", (video_path,)):
+                out.setdefault(name, []).append(json.loads(data))
+        return out
+
+    def months(self):
+        """スキャン済み動画の撮影月 (YYYY-MM) のリスト"""
+        with self._connect() as conn:
+            return [m for (m,) in conn.execute("SELECT DISTINCT month FROM videos WHERE month IS NOT NULL ORDER BY month")]
+
+    # --- 書き込み ---
+
+    def _write_detections(self, conn, name, video_path, month, dets):
+        conn.execute("DELETE FROM detections WHERE person = ? AND video = ?", (name, video_path))
+        conn.executemany(
+            "INSERT INTO detections(person, video, t, month, visual_score, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [(name, video_path, float(d["t"]), month, _as_float(d.get("visual_score")), json.dumps(d, ensure_ascii=False))
+             for d in dets])
+
+    def _write_video(self, conn, video_path, meta):
+        conn.execute("INSERT INTO videos(path, month, date, meta) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(path) DO UPDATE SET month = excluded.month, date = excluded.date, meta = excluded.meta",
+                     (video_path, meta.get("month"), meta.get("date"), json.dumps(meta, ensure_ascii=False)))
+
+    def add_people(self, names):
+        with self._connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO people(name) VALUES (?)", [(n,) for n in names])
+
+    def record_video(self, video_path, meta, results_per_person):
+        """
+        1本分の結果を書き込む (run_scan の record_result と同じ扱い)。
+        検出が空の人物は、その動画の検出を削除する。
+        """
+        with self._connect() as conn:
+            self._write_video(conn, video_path, meta)
+            for name, dets in results_per_person.items():
+                conn.execute("INSERT OR IGNORE INTO people(name) VALUES (?)", (name,))
+                self._write_detections(conn, name, video_path, meta.get("month"), dets)
+            self._bump_revision(conn)
+
+    def update_metadata(self, video_path, meta):
+        with self._connect() as conn:
+            self._write_video(conn, video_path, meta)
+            conn.execute("UPDATE detections SET month = ? WHERE video = ?", (meta.get("month"), video_path))
+            self._bump_revision(conn)
+
+    def relink_video(self, old_path, new_path):
+        """移動・名前変更された動画の結果を新しいパスに付け替える (新しいパスに結果が既にあれば何もしない)"""
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM videos WHERE path = ?", (new_path,)).fetchone():
+                return
+            conn.execute("UPDATE videos SET path = ? WHERE path = ?", (new_path, old_path))
+            conn.execute("UPDATE detections SET video = ? WHERE video = ?", (new_path, old_path))
+            self._bump_revision(conn)
+
+    def delete_person(self, name):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM detections WHERE person = ?", (name,))
+            conn.execute("DELETE FROM people WHERE name = ?", (name,))
+            self._bump_revision(conn)
+
+    def delete_detections(self, name, clips):
+        """clips: [(動画パス, 時刻), ...] の検出を削除する"""
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM detections WHERE person = ? AND video = ? AND abs(t - ?) <= ?",
+                             [(name, v, float(t), SAME_TIME_TOLERANCE) for v, t in clips])
+            self._bump_revision(conn)
+
+    # --- JSON との変換 ---
+
+    def import_results(self, data):
+        """従来の JSON の内容で置き換える"""
+        metadata = data.get("metadata", {}) or {}
+        with self._connect() as conn:
+            conn.execute("DELETE FROM detections")
+            conn.execute("DELETE FROM videos")
+            conn.execute("DELETE FROM people")
+            for path, meta in metadata.items():
+                self._write_video(conn, path, meta)
+            for name, videos in (data.get("people", {}) or {}).items():
+                conn.execute("INSERT OR IGNORE INTO people(name) VALUES (?)", (name,))
+                for video_path, dets in videos.items():
+                    self._write_detections(conn, name, video_path, metadata.get(video_path, {}).get("month"), dets)
+            self._bump_revision(conn)
+
+    def export_json(self, json_path):
+        """従来の scan_results.json 形式で書き出す (他のツールとの互換用)"""
+        from utils import save_json_atomic
+        save_json_atomic(json_path, self.load())
+
+
+# --- 追記ログ (results_backend = "jsonl") ---
+
+def apply_log_record(data, record):
+    """
+    ログの1レコードを {"people", "metadata"} に反映する。
+    どのレコードも同じものを2回反映しても結果が変わらないので、まとめる途中で中断しても
+    ログを最初から反映し直せばよい。
+    """
+    op = record.get("op")
+    people = data.setdefault("people", {})
+    metadata = data.setdefault("metadata", {})
+    if op == "video":
+        path = record["path"]
+        metadata[path] = record["meta"]
+        for name, dets in record["people"].items():
+            per_video = people.setdefault(name, {})
+            if dets:
+                per_video[path] = dets
+            else:
+                per_video.pop(path, None)
+    elif op == "meta":
+        metadata[record["path"]] = record["meta"]
+    elif op == "relink":
+        old_path, new_path = record["old"], record["new"]
+        if new_path in metadata: # ResultsStore.relink_video と同じく、付け替え先に結果があれば何もしない
+            return data
+        if old_path in metadata:
+            metadata[new_path] = metadata.pop(old_path)
+        for per_video in people.values():
+            if old_path in per_video:
+                per_video[new_path] = per_video.pop(old_path)
+    elif op == "people":
+        for name in record["names"]:
+            people.setdefault(name, {})
+    elif op == "delete_person":
+        people.pop(record["name"], None)
+    elif op == "delete_detections":
+        per_video = people.get(record["name"], {})
+        for video_path, t in record["clips"]:
+            if video_path in per_video:
+                per_video[video_path] = [d for d in per_video[video_path] if abs(d["t"] - t) > SAME_TIME_TOLERANCE]
+                if not per_video[video_path]:
+                    del per_video[video_path]
+    return data
+
+
+def merge_results_log(data, log_path):
+    """スナップショットの内容 data に追記ログを順に反映する (書きかけの最後の行は無視する)"""
+    with open(log_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            apply_log_record(data, record)
+    return data
+
+
+_log_locks = {}
+_log_locks_guard = threading.Lock()
+
+
+def _log_lock(path):
+    # GUI とスキャンが別々のインスタンスから同じログに書くことがあるので、パスごとに1つのロックを使う
+    with _log_locks_guard:
+        return _log_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+class JsonlResultsStore:
+    """
+    ResultsStore と同じ操作を、スナップショット (scan_results.json) + 追記ログ (JSON Lines) で行う。
+    1本の動画の記録はログへの1行の追記だけなので、書き込みの量は結果の大きさに比例し、
+    これまでの結果全体の大きさには依存しない。読み込みはスナップショットにログを反映したもの
+    (utils.load_json_safe も同じようにログを反映する)。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = results_log_path_for(path)
+        self._lock = _log_lock(self.log_path)
+        self._repair_tail()
+
+    def _repair_tail(self):
+        # 書き込み途中で中断された最後の行を切り落とす (続けて追記した行が壊れないように)
+        with self._lock:
+            if not os.path.exists(self.log_path):
+                return
+            valid_size = 0
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    valid_size += len(line)
+            if os.path.getsize(self.log_path) != valid_size:
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(valid_size)
+
+    def _read(self):
+        from utils import load_json_safe
+        with self._lock:
+            return load_json_safe(self.path, lambda: {"people": {}, "metadata": {}})
+
+    def _append(self, record):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if self.needs_compaction():
+                self.compact()
+
+    def needs_compaction(self):
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        snapshot_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return log_size >= COMPACT_MIN_BYTES and log_size >= snapshot_size * COMPACT_RATIO
+
+    def compact(self):
+        """ログをスナップショットにまとめ、ログを空にする"""
+        from utils import save_json_atomic
+        with self._lock:
+            data = self._read()
+            save_json_atomic(self.path, data)
+            # ここで中断してもログの反映は何度行っても同じ結果になる
+            with open(self.log_path, "w", encoding="utf-8"):
+                pass
+
+    def revision(self):
+        stamps = []
+        for path in (self.path, self.log_path):
+            st = os.stat(path) if os.path.exists(path) else None
+            stamps.append((st.st_mtime_ns, st.st_size) if st else None)
+        return tuple(stamps)
+
+    def is_empty(self):
+        return not self._read().get("metadata")
+
+    def load(self, person=None):
+        data = self._read()
+        data.setdefault("people", {})
+        data.setdefault("metadata", {})
+        if person is None:
+            return data
+        videos = data["people"].get(person)
+        people = {person: videos} if videos is not None else {}
+        metadata = {path: meta for path, meta in data["metadata"].items() if videos and path in videos}
+        return {"people": people, "metadata": metadata}
+
+    def video_metadata(self):
+        return self._read().get("metadata", {})
+
+    def video_detections(self, video_path):
+        return {name: videos[video_path] for name, videos in self._read().get("people", {}).items() if video_path in videos}
+
+    def months(self):
+        return sorted({meta["month"] for meta in self.video_metadata().values() if meta.get("month")})
+
+    def add_people(self, names):
+        known = self._read().get("people", {})
+        missing = [n for n in names if n not in known]
+        if missing:
+            self._append({"op": "people", "names": missing})
+
+    def record_video(self, video_path, meta, results_per_person):
+        self._append({"op": "video", "path": video_path, "meta": meta, "people": results_per_person})
+
+    def update_metadata(self, video_path, meta):
+        self._append({"op": "meta", "path": video_path, "meta": meta})
+
+    def relink_video(self, old_path, new_path):
+        self._append({"op": "relink", "old": old_path, "new": new_path})
+
+    def delete_person(self, name):
+        self._append({"op": "delete_person", "name": name})
+
+    def delete_detections(self, name, clips):
+        self._append({"op": "delete_detections", "name": name, "clips": [[v, float(t)] for v, t in clips]})
+
+    def import_results(self, data):
+        from utils import save_json_atomic
+        with self._lock:
+            save_json_atomic(self.path, data)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+
+    def export_json(self, json_path):
+        from utils import save_json_atomic
+        save_json_atomic(json_path, self.load())
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def configured_backend():
+    """config.json の "results_backend" (未設定・不明な値なら "sqlite")"""
+    try:
+        from utils import load_config, get_user_data_dir
+        backend = load_config(os.path.join(get_user_data_dir(), "config.json")).get("results_backend", "sqlite")
+    except Exception:
+        backend = "sqlite"
+    return backend if backend in RESULTS_BACKENDS else "sqlite"
+
+
+def open_results_store(results_path, backend=None):
+    """
+    scan_results.json のパス (または .db のパス) からスキャン結果の保存先を開く。
+    backend を省略すると config.json の "results_backend" に従う。
+    - sqlite: データベースが無く JSON (またはそのバックアップ・追記ログ) がある場合は取り込み、
+              取り込んだファイルは .migrated に改名する。
+    - jsonl : スナップショットもログも無く、データベースがある場合はその内容をスナップショットに書き出す。
+    """
+    backend = backend or configured_backend()
+    db_path = results_db_path_for(results_path)
+    if backend == "jsonl":
+        json_path = os.path.splitext(results_path)[0] + ".json" if db_path == results_path else results_path
+        store = JsonlResultsStore(json_path)
+        if not os.path.exists(json_path) and not os.path.exists(store.log_path) and os.path.exists(db_path):
+            print(f"スキャン結果を JSON に書き出しています: {os.path.basename(db_path)} -> {os.path.basename(json_path)}")
+            store.import_results(ResultsStore(db_path).load())
+        return store
+
+    is_new = not os.path.exists(db_path)
+    store = ResultsStore(db_path)
+    if is_new and db_path != results_path:
+        from utils import load_json_safe
+        data = load_json_safe(results_path, lambda: None)
+        if data:
+            print(f"スキャン結果をデータベースに変換しています: {os.path.basename(results_path)} -> {os.path.basename(db_path)}")
+            store.import_results(data)
+            for path in (results_path, results_path.replace(".json", "_bk.json"), results_log_path_for(results_path)):
+                if os.path.exists(path):
+                    os.replace(path, path + ".migrated")
+    return store
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="スキャン結果データベースを JSON に書き出す")
+    parser.add_argument("database", help="scan_results.db (または scan_results.json のパス)")
+    parser.add_argument("output", help="書き出す JSON ファイル")
+    args = parser.parse_args()
+    open_results_store(args.database).export_json(args.output)
+    print(f"書き出しました: {args.output}")
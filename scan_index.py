@@ -0,0 +1,125 @@
+import os
+import hashlib
+
+# スキャン対象の拡張子 (大文字・小文字は区別しない)
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv")
+
+# 指紋に使う、ファイルの先頭と末尾から読むバイト数
+HASH_BLOCK = 64 * 1024
+
+
+def find_videos(folder, extensions=VIDEO_EXTENSIONS):
+    """
+    folder 以下を os.scandir で1回だけたどり、動画ファイルの [(path, stat_result), ...] をパス順で返す。
+    glob と同じく、名前が "." で始まるファイル・フォルダは対象外。
+    """
+    found = []
+    visited = set()
+    stack = [folder]
+    while stack:
+        directory = stack.pop()
+        real = os.path.realpath(directory)
+        if real in visited: # シンボリックリンクの循環対策
+            continue
+        visited.add(real)
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError as e:
+            print(f"  Warning: フォルダを読めませんでした: {directory} ({e})")
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                    found.append((entry.path, entry.stat()))
+            except OSError:
+                continue
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+def partial_hash(path, size):
+    """ファイルの先頭と末尾 HASH_BLOCK バイトの MD5 (動画全体を読まずに内容の違いを見分ける)"""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        md5.update(f.read(HASH_BLOCK))
+        if size > HASH_BLOCK * 2:
+            f.seek(size - HASH_BLOCK)
+            md5.update(f.read(HASH_BLOCK))
+        elif size > HASH_BLOCK:
+            md5.update(f.read())
+    return md5.hexdigest()[:16]
+
+
+def file_info(path, st, known=None):
+    """
+    スキャン結果の動画のメタデータに保存する {"size", "mtime", "fingerprint"}。
+    指紋は (サイズ, 更新日時, 先頭と末尾の内容のハッシュ)。前回の metadata (known) と
+    サイズ・更新日時が同じなら、ファイルを読まずに前回の指紋を使う。
+    """
+    mtime = round(st.st_mtime, 3)
+    if known and known.get("fingerprint") and known.get("size") == st.st_size and known.get("mtime") == mtime:
+        return {"size": st.st_size, "mtime": mtime, "fingerprint": known["fingerprint"]}
+    return {"size": st.st_size, "mtime": mtime,
+            "fingerprint": f"{st.st_size}-{mtime}-{partial_hash(path, st.st_size)}"}
+
+
+def relink_video(results, old_path, new_path):
+    """移動・名前変更された動画の結果を、新しいパスに付け替える (新しいパスに結果が既にあれば何もしない)"""
+    if new_path in results["metadata"]:
+        return
+    results["metadata"][new_path] = results["metadata"].pop(old_path)
+    for per_video in results["people"].values():
+        if old_path in per_video:
+            per_video[new_path] = per_video.pop(old_path)
+
+
+def plan_incremental_scan(results, videos, force=False):
+    """
+    見つかった動画 [(path, stat), ...] と既存の結果から、スキャンが必要な動画を決める。
+    - 同じパスで指紋も同じ: スキャン済み (スキップ)
+    - 同じパスで指紋が違う: 内容が変わったので再スキャン
+    - 新しいパスだが、存在しなくなったパスと指紋が同じ: 移動・名前変更とみなし、結果を付け替えてスキップ
+    - 指紋を持たない以前の結果: 従来通りスキップし、指紋だけを補う
+    results は直接更新される。(スキャンする動画のリスト, {path: file_info}, 付け替えた [(旧パス, 新パス)],
+    指紋を補った動画のリスト) を返す。
+    """
+    metadata = results["metadata"]
+    found_paths = {path for path, _ in videos}
+    # 見つからなくなった動画の指紋 (付け替え先の候補)。
+    # 今回のフォルダの外にあるだけでまだ存在する動画 (別フォルダの同じ内容のコピーなど) は含めない
+    missing = {}
+    for path, meta in metadata.items():
+        if path not in found_paths and meta.get("fingerprint") and not os.path.exists(path):
+            missing.setdefault(meta["fingerprint"], path)
+
+    to_scan = []
+    infos = {}
+    relinked = []
+    backfilled = []
+    for path, st in videos:
+        known = metadata.get(path)
+        try:
+            info = file_info(path, st, known)
+        except OSError as e:
+            print(f"  Warning: ファイルを読めませんでした: {path} ({e})")
+            continue
+        infos[path] = info
+
+        if known is None and info["fingerprint"] in missing:
+            old_path = missing.pop(info["fingerprint"])
+            relink_video(results, old_path, path)
+            relinked.append((old_path, path))
+            continue
+        if force or known is None:
+            to_scan.append(path)
+        elif not known.get("fingerprint"):
+            known.update(info)
+            backfilled.append(path)
+        elif known["fingerprint"] != info["fingerprint"]:
+            to_scan.append(path)
+    return to_scan, infos, relinked, backfilled
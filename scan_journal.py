@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+
+
+def journal_dir():
+    from utils import get_user_data_dir
+    return os.path.join(get_user_data_dir(), "scan_journal")
+
+
+def _video_key(video_path):
+    return hashlib.md5(os.path.abspath(video_path).encode("utf-8")).hexdigest()
+
+
+def journal_path_for(video_path, part=None):
+    """動画 (分割時はその区間) ごとのジャーナルファイルのパス (ファイル名は動画パスのハッシュ)"""
+    key = _video_key(video_path)
+    name = f"{key}.jsonl" if part is None else f"{key}-{part}.jsonl"
+    return os.path.join(journal_dir(), name)
+
+
+def remove_journal(video_path):
+    """scan_results.json に反映し終えた動画のジャーナル (分割した区間の分も含む) を削除する"""
+    directory = journal_dir()
+    if not os.path.isdir(directory):
+        return
+    key = _video_key(video_path)
+    for name in os.listdir(directory):
+        if name == f"{key}.jsonl" or (name.startswith(f"{key}-") and name.endswith(".jsonl")):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                print(f"  Warning: ジャーナルを削除できませんでした: {e}")
+
+
+class ScanJournal:
+    """
+    長い動画のスキャン途中経過を、一定区間 (チャンク) ごとに JSON Lines で追記する。
+    1行目はヘッダ (動画のサイズ・更新日時とスキャン設定)、以降は各チャンクの
+    {"end": 次にスキャンするフレーム, "detections": {name: [det, ...]}, "pending": {name: [det, added]}}。
+    中断・クラッシュ後に同じ条件でスキャンし直すと、最後に書けたチャンクの続きから再開する。
+    """
+
+    def __init__(self, path, video_path, settings):
+        self.path = path
+        self.video_path = video_path
+        st = os.stat(video_path)
+        self.signature = {"video": os.path.abspath(video_path), "size": st.st_size,
+                          "mtime": round(st.st_mtime, 3), "settings": settings}
+        self._header_written = False
+
+    def load(self):
+        """
+        再開できる場合は (再開フレーム, {name: [det, ...]}, {name: (det, added)}) を返す。
+        ジャーナルが無い・条件が違う場合は None (古いジャーナルは破棄する)。
+        """
+        if not os.path.exists(self.path):
+            return None
+        resume_index = None
+        detections = {}
+        pending = {}
+        valid_size = 0
+        try:
+            with open(self.path, "rb") as f:
+                header_line = f.readline()
+                header = json.loads(header_line.decode("utf-8") or "null")
+                if not header or header.get("signature") != self.signature:
+                    raise ValueError("signature mismatch")
+                valid_size = len(header_line)
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete line")
+                        chunk = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        break # 書き込み途中で中断された最後の行
+                    for name, dets in chunk.get("detections", {}).items():
+                        detections.setdefault(name, []).extend(dets)
+                    pending = {name: (d, added) for name, (d, added) in chunk.get("pending", {}).items()}
+                    resume_index = chunk["end"]
+                    valid_size += len(line)
+        except Exception:
+            os.remove(self.path)
+            return None
+
+        # 書きかけの行を切り落としてから、続きを追記する
+        if os.path.getsize(self.path) != valid_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_size)
+
+        if resume_index is None:
+            return None
+        self._header_written = True
+        return resume_index, detections, pending
+
+    def append_chunk(self, end_index, detections, pending):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        mode = "a" if self._header_written else "w"
+        with open(self.path, mode, encoding="utf-8") as f:
+            if not self._header_written:
+                f.write(json.dumps({"signature": self.signature}, ensure_ascii=False) + "\n")
+                self._header_written = True
+            chunk = {"end": int(end_index), "detections": detections,
+                     "pending": {name: [d, added] for name, (d, added) in pending.items()}}
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
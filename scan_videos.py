@@ -1,17 +1,28 @@
 import face_recognition
 import cv2
-import pickle
 import sys
 import os
 import json
-import glob
 import datetime
+import time
 import os
 
 import multiprocessing
+import collections
 import concurrent.futures
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from frame_source import open_frame_source, PrefetchingFrameSource
+from face_matcher import FaceMatcher
+from face_detector import get_face_detector, DETECTOR_OPTION_DEFAULTS
+from frame_prefilter import FramePrefilter, merge_prefilter_stats
+from face_tracker import FaceTracker
+from adaptive_sampler import AdaptiveSampler
+from scan_journal import ScanJournal, journal_path_for, remove_journal
+from video_shards import plan_video_shards
+from worker_scaler import WorkerScaler, ScalingProcessPool
+from scan_index import find_videos, plan_incremental_scan
+from encoding_store import EncodingRecorder, encoding_store_path, encoding_store_paths, remove_encoding_store, load_encoding_store, rematch_store
 
 # Use spawn for Windows/macOS to ensure clean subprocess environment
 try:
@@ -22,18 +33,43 @@ except:
 
 # 感情分析用ライブラリ（ONNX）を遅延インポート
 emotion_analyzer = None
+_emotion_init_attempted = False
+
+# config.json の scan.emotion_graph_optimization に指定できる値
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
 
 class EmotionAnalyzer:
-    def __init__(self, model_path):
+    def __init__(self, model_path, options=None):
         import onnxruntime as ort
-        self.session = ort.InferenceSession(model_path)
-        self.input_name = self.session.get_inputs()[0].name
+        options = options or {}
+        sess_options = ort.SessionOptions()
+        # 0 の場合は onnxruntime のデフォルト (全コア) のまま
+        if options.get("emotion_intra_op_threads"):
+            sess_options.intra_op_num_threads = int(options["emotion_intra_op_threads"])
+        if options.get("emotion_inter_op_threads"):
+            sess_options.inter_op_num_threads = int(options["emotion_inter_op_threads"])
+        level = GRAPH_OPTIMIZATION_LEVELS.get(str(options.get("emotion_graph_optimization", "all")).lower())
+        if level:
+            sess_options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, level)
+
+        self.session = ort.InferenceSession(model_path, sess_options=sess_options)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # バッチ次元が可変のモデルは batch_size 件ずつ1回の推論にまとめる。
+        # 配布されている FER+ モデルのようにバッチ次元が固定されている場合はその件数ずつ推論する (1 なら1枚ずつ)
+        batch_dim = model_input.shape[0] if model_input.shape else None
+        self.fixed_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
         self.emotion_table = {
             0: 'neutral', 1: 'happiness', 2: 'surprise', 3: 'sadness',
             4: 'anger', 5: 'disgust', 6: 'fear', 7: 'contempt'
         }
 
-    def analyze(self, img_bgr):
+    def preprocess(self, img_bgr):
         # Preprocess: Gray -> Resize (64x64) -> Normalize
         if len(img_bgr.shape) == 3:
             gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
@@ -42,14 +78,10 @@ class EmotionAnalyzer:
             
         resized = cv2.resize(gray, (64, 64))
         # ImageNet mean/std equivalent for specialized model or simple 0-1 scaling
-        # FER+ model typically expects float32 input [1, 1, 64, 64]
-        img_arr = resized.astype(np.float32)
-        img_arr = img_arr[np.newaxis, np.newaxis, :, :]
-        
-        # Run inference
-        outputs = self.session.run(None, {self.input_name: img_arr})
-        scores = outputs[0][0] # Logits
-        
+        # FER+ model typically expects float32 input [N, 1, 64, 64]
+        return resized.astype(np.float32)
+
+    def _to_emotion(self, scores):
         # Softmax
         exp_scores = np.exp(scores - np.max(scores))
         probs = exp_scores / exp_scores.sum()
@@ -66,18 +98,38 @@ class EmotionAnalyzer:
                 
         return {'emotion': emotion_dict}
 
-def init_emotion_analyzer():
-    global emotion_analyzer
-    if emotion_analyzer is None:
+    def analyze_batch(self, inputs, batch_size=16):
+        """preprocess() 済みの (64,64) 配列のリストをまとめて推論し、analyze() と同じ形式のリストを返す"""
+        batch_size = self.fixed_batch or max(1, int(batch_size))
+        results = []
+        for s in range(0, len(inputs), batch_size):
+            chunk = inputs[s:s + batch_size]
+            img_arr = np.stack(chunk)[:, np.newaxis, :, :]
+            if self.fixed_batch and len(chunk) < self.fixed_batch:
+                # 固定のバッチ数に満たない分は空の画像で埋め、その結果は捨てる
+                pad = np.zeros((self.fixed_batch - len(chunk),) + img_arr.shape[1:], dtype=img_arr.dtype)
+                img_arr = np.concatenate([img_arr, pad])
+            # Run inference (InferenceSession.run は複数スレッドから同時に呼べる)
+            outputs = self.session.run(None, {self.input_name: img_arr})
+            for scores in outputs[0][:len(chunk)]: # Logits
+                results.append(self._to_emotion(scores))
+        return results
+
+    def analyze(self, img_bgr):
+        return self.analyze_batch([self.preprocess(img_bgr)], batch_size=1)[0]
+
+def init_emotion_analyzer(options=None):
+    global emotion_analyzer, _emotion_init_attempted
+    # モデルが無い・読み込めない場合も、同じプロセスでは1回だけ試す
+    if emotion_analyzer is None and not _emotion_init_attempted:
+        _emotion_init_attempted = True
         try:
-            model_path = os.path.join(get_app_dir(), "assets", "models", "emotion-ferplus-8.onnx")
-            if not os.path.exists(model_path):
-                # Fallback check for dev environment
-                model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "models", "emotion-ferplus-8.onnx")
+            from utils import find_model_path
+            model_path = find_model_path("emotion-ferplus-8.onnx")
             
             if os.path.exists(model_path):
                 print(f"  ... Initializing EmotionAnalyzer (ONNX) ...")
-                emotion_analyzer = EmotionAnalyzer(model_path)
+                emotion_analyzer = EmotionAnalyzer(model_path, options)
             else:
                 print(f"  Warning: ONNX model not found at {model_path}")
         except Exception as e:
@@ -170,44 +222,202 @@ def main(video_folder):
 
     # --- PATH SETUP ---
     user_data_dir = get_user_data_dir()
-    target_faces_path = os.path.join(user_data_dir, "target_faces.pkl")
+    target_faces_path = os.path.join(user_data_dir, "target_faces.gallery")
     scan_results_path = os.path.join(user_data_dir, "scan_results.json")
     
     # Check Target Faces
-    if not os.path.exists(target_faces_path):
+    if not os.path.exists(target_faces_path) and not os.path.exists(os.path.join(user_data_dir, "target_faces.pkl")):
         print("Error: Target faces not registered.")
         return
 
-def load_target_encodings(pkl_path='target_faces.pkl'):
-    """保存された顔特徴辞書データをロードする"""
-    if not os.path.exists(pkl_path):
-        print(f"エラー: 特徴データファイルが見つかりません: {pkl_path}")
-        sys.exit(1)
-    
-    with open(pkl_path, 'rb') as f:
-        data = pickle.load(f)
-    
-    if not isinstance(data, dict):
-        # 旧バージョン互換性（単一人物）
-        data = {"target": data}
+def apply_scene_analysis(d, emo, v_score):
+    """感情・画質スコアから検出結果 d の happy/drama/description/vibe/visual_score を埋める"""
+    try:
+        desc, vibe = infer_description_vibe(emo, motion=d["motion"], face_ratio=d["face_ratio"], visual_score=v_score)
         
-    print(f"特徴データをロードしました: {list(data.keys())} ({len(data)} 人)")
-    return data
+        d["happy"] = round(float(emo.get('happy', 0)) / 100.0, 3)
+        d["drama"] = round((float(emo.get('surprise', 0)) + float(emo.get('sad', 0)) + 
+                       float(emo.get('angry', 0)) + float(emo.get('fear', 0))) / 100.0, 3)
+        d["description"] = desc
+        d["vibe"] = vibe
+        d["visual_score"] = v_score
+    except Exception as e:
+        print(f"    Analysis Error: {e}")
+        set_default_analysis(d)
+    return d
+
+def set_default_analysis(d):
+    d["happy"], d["drama"], d["description"], d["vibe"], d["visual_score"] = 0, 0, "人物が映っているシーン", "ナチュラル", 5.0
+
+class EmotionStage:
+    """
+    確定した検出の顔画像をためておき、batch_size 件ごと (と動画の最後) にまとめて感情分析する。
+    結果は add() で渡した検出結果の辞書に直接書き込まれる。
+    executor を渡すと推論はスレッドプールで行われるので、結果を読む前に wait() を呼ぶ。
+    """
+
+    def __init__(self, analyzer, batch_size=16, executor=None):
+        self.analyzer = analyzer
+        self.batch_size = max(1, int(batch_size))
+        self.executor = executor
+        self.pending = [] # [(detection_dict, preprocessed_face, visual_score)]
+        self._futures = []
+
+    def add(self, d, face_img, v_score):
+        if self.analyzer is None:
+            # 感情分析なし (従来通り、空の感情データとして扱う)
+            apply_scene_analysis(d, {}, v_score)
+            return
+        self.pending.append((d, self.analyzer.preprocess(face_img), v_score))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        if self.executor is None:
+            self._analyze(pending)
+        else:
+            self._futures.append(self.executor.submit(self._analyze, pending))
+
+    def wait(self):
+        """スレッドプールに渡した推論がすべて終わるまで待つ"""
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def _analyze(self, pending):
+        try:
+            analyses = self.analyzer.analyze_batch([p[1] for p in pending], batch_size=self.batch_size)
+        except Exception as e:
+            print(f"    Analysis Error (batch): {e}")
+            analyses = []
+            for _, face, _ in pending:
+                try:
+                    analyses.append(self.analyzer.analyze_batch([face], batch_size=1)[0])
+                except Exception as e:
+                    print(f"    Analysis Error: {e}")
+                    analyses.append(None)
+        for (d, _, v_score), analysis in zip(pending, analyses):
+            if analysis is None:
+                set_default_analysis(d)
+            else:
+                apply_scene_analysis(d, analysis.get('emotion', {}), v_score)
+
+# config.json の "scan" セクションで上書きできるスキャン設定
+SCAN_OPTION_DEFAULTS = {
+    "frame_reader": "opencv",   # "opencv" | "ffmpeg" (デコーダ側で縮小してパイプで受け取る。解析は元解像度で行う)
+    "frame_strategy": "auto",   # "auto" | "sequential" | "keyframe" | "seek" (opencv のみ)
+    "ann_index": "auto",        # "auto" | "on" | "off" (auto: 登録数が多い場合のみ近似最近傍インデックスを使用)
+    "ann_nprobe": 8,            # 近似検索で調べるクラスタ数 (大きいほど正確で遅い)
+    "emotion_batch_size": 16,   # 感情分析をまとめて推論する顔の数 (バッチ次元が固定のモデルはその件数ずつ)
+    "emotion_intra_op_threads": 0,  # onnxruntime のスレッド数 (0 = onnxruntime のデフォルト)
+    "emotion_inter_op_threads": 0,
+    "emotion_graph_optimization": "all",  # "disable" | "basic" | "extended" | "all"
+    **DETECTOR_OPTION_DEFAULTS, # face_detector / face_detector_model / face_detector_threshold (face_detector.py)
+    "prefilter": "off",         # "off" | "static" | "skin" | "all" (顔が新しく映り得ないフレームの検出を省略)
+    "prefilter_static_threshold": 0.15,  # 顔の無かったフレームからの変化量 (motion_score と同じ 0-10) がこれ未満なら省略
+    "prefilter_skin_ratio": 0.003,       # 肌色画素の割合がこれ未満なら省略
+    "prefilter_max_skips": 8,   # 連続して省略する最大フレーム数
+    "face_tracking": False,     # 前のサンプルと同じ位置 (IoU) の顔は人物判定を引き継ぎ、エンコードを省略 (距離は引き継いだ値になる)
+    "face_track_iou": 0.5,      # 同じ顔とみなす枠の重なり (IoU)
+    "face_track_reencode": 4,   # 引き継ぎ中でも、このサンプル数ごとにエンコードし直す
+    "adaptive_sampling": False, # 顔が無く動きの小さい場面ではサンプリング間隔を広げる
+    "adaptive_min_interval": 0.5,  # 顔・動きがある場面の間隔 (秒)
+    "adaptive_max_interval": 4.0,  # 間隔を広げる上限 (秒)
+    "adaptive_motion_threshold": 0.5,  # motion_score (0-10) がこれ以上なら最小間隔に戻す
+    "scan_mode": "full",        # "full" | "coarse_to_fine" (粗いパスで人物のいる区間を探し、その区間だけ精査)
+    "coarse_interval": 3.0,     # 粗いパスの間隔 (秒)
+    "coarse_max_width": 640,    # 粗いパスで検出に使う画像の幅 (px)
+    "coarse_threshold": 0.5,    # 粗いパスの照合しきい値 (見逃し防止のため本スキャンより緩め)
+    "coarse_padding": 3.0,      # ヒット前後に精査する秒数
+    "checkpoint_interval": 60,  # 途中経過をジャーナルに書き出す間隔 (動画内の秒数、0 で無効)
+    "shard_seconds": 300,       # 長い動画をこの秒数ごとに分割して並列にスキャンする (0 で分割しない)
+    "max_workers": 0,           # スキャン用プロセス数の上限 (0 = CPU数 - 1)。実際の数は空きメモリに合わせて増減する
+    "memory_reserve_mb": 1024,  # スキャン以外のために空けておくメモリ (MB)
+    "store_encodings": False,   # 計算した顔エンコーディングを動画ごとに保存し、人物を追加したときに動画を読まずに照合し直せるようにする
+    "pipeline_threads": 0,      # 1本の動画の中で、先読み・顔検出・感情分析・サムネイル作成に使うスレッド数 (0 = 従来通り直列)
+}
+
+def get_scan_options(config=None):
+    """config.json の "scan" セクションとデフォルト値をマージしたスキャン設定を返す"""
+    if config is None:
+        from utils import load_config
+        config = load_config(os.path.join(get_user_data_dir(), "config.json"))
+    options = dict(SCAN_OPTION_DEFAULTS)
+    options.update(config.get("scan", {}) or {})
+    return options
 
-def scan_video(video_path, target_data, check_interval_sec=0.5, resize_scale=0.5, stop_event=None):
+def load_target_gallery(gallery_path='target_faces.gallery'):
+    """登録済みの顔ギャラリーを開く (旧形式の target_faces.pkl は自動で変換される)"""
+    from gallery import open_gallery
+    gallery = open_gallery(gallery_path)
+    if gallery is None:
+        print(f"エラー: 特徴データファイルが見つかりません: {gallery_path}")
+        sys.exit(1)
+
+    print(f"特徴データをロードしました: {gallery.names} ({len(gallery.names)} 人)")
+    return gallery
+
+def build_face_matcher(gallery, options):
+    """
+    スキャン設定に応じて、全件比較または近似最近傍インデックス付きの FaceMatcher を作る。
+    ギャラリーは memmap のまま使い、スキャン用プロセスにはファイルパスだけが渡される。
+    """
+    from ann_index import ANN_MIN_SIZE, load_or_build_index
+    mode = options.get("ann_index", "auto")
+    index = None
+    if mode == "on" or (mode == "auto" and len(gallery) >= ANN_MIN_SIZE):
+        index = load_or_build_index(gallery.path, gallery, nprobe=options.get("ann_nprobe", 8))
+    return FaceMatcher.from_gallery(gallery, index=index)
+
+def scan_video(video_path, target_data, check_interval_sec=0.5, resize_scale=0.5, stop_event=None, options=None, stats=None, ranges=None, journal_path=None,
+               encodings_path=None, keep_range=None):
     """
     1本の動画をスキャンし、各人物の出現タイムスタンプを辞書形式で返す。
-    target_data: { "Name": encoding }
+    target_data: { "Name": [encoding, ...] } または FaceMatcher
+    options: get_scan_options() で得られるスキャン設定
+    stats: 辞書を渡すと、プレフィルタのカウンタ (省略フレーム数・推定高速化率) が書き込まれる
+    ranges: [(start_sec, end_sec), ...] を渡すと、その区間だけをスキャンする (find_candidate_ranges の結果)
+    journal_path: 指定すると、途中経過をチャンクごとにジャーナルへ書き出し、前回中断した位置から再開する
+    encodings_path: 指定すると、計算した全ての顔エンコーディングを保存する (rematch 用、keep_range は分割スキャンの担当範囲)。
+                    途中で中断した・ジャーナルから再開した場合は、全体がそろわないので保存しない
     """
+    if options is None:
+        options = get_scan_options()
+
+    # 登録エンコーディングを (N,128) 行列にまとめておく (FaceMatcher を直接渡すことも可能)
+    matcher = target_data if isinstance(target_data, FaceMatcher) else FaceMatcher(target_data)
+
     # { "Name": [timestamps...] }
-    results_per_person = {name: [] for name in target_data.keys()}
-    init_emotion_analyzer() # 感情分析の準備 (ONNX)
+    results_per_person = {name: [] for name in matcher.names}
+    init_emotion_analyzer(options) # 感情分析の準備 (ONNX)
+    # 動画内のパイプライン: デコードは先読みスレッド、検出・感情分析・サムネイル作成はスレッドプールで行う
+    pipeline_threads = int(options.get("pipeline_threads", 0) or 0)
+    pool = ThreadPoolExecutor(max_workers=pipeline_threads) if pipeline_threads > 0 else None
+    thumb_futures = []
+    emotion_stage = EmotionStage(emotion_analyzer, options.get("emotion_batch_size", 16), executor=pool)
+    detector = get_face_detector(options) # 顔検出器 (HOG / ONNX)
+    prefilter = FramePrefilter(options.get("prefilter", "off"),
+                               static_threshold=float(options.get("prefilter_static_threshold", 0.15)),
+                               skin_ratio=float(options.get("prefilter_skin_ratio", 0.003)),
+                               max_skips=int(options.get("prefilter_max_skips", 8)))
+    # 顔の追跡 (無効時は毎回エンコードする)
+    tracking = bool(options.get("face_tracking", False))
+    tracker = FaceTracker(iou_threshold=float(options.get("face_track_iou", 0.5)),
+                          reencode_every=int(options.get("face_track_reencode", 4)) if tracking else 1,
+                          match_threshold=0.42) # 下の判定と同じしきい値
     
-    # 動画を開く
-    cap = cv2.VideoCapture(video_path)
+    # 動画を開く (GOP長とサンプリング間隔から、読み飛ばし/シークの方式を動画ごとに選択)
+    cap = open_frame_source(video_path, check_interval_sec=check_interval_sec,
+                            strategy=options["frame_strategy"], reader=options["frame_reader"],
+                            resize_scale=resize_scale)
     if not cap.isOpened():
         print(f"  警告: 動画を開けませんでした: {video_path}")
-        return {name: [] for name in target_data.keys()}
+        if pool:
+            pool.shutdown()
+        return {name: [] for name in matcher.names}
 
     fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
@@ -217,7 +427,7 @@ def scan_video(video_path, target_data, check_interval_sec=0.5, resize_scale=0.5
     total_pixels = frame_width * frame_height if frame_width > 0 else 1
     
     # 動画名と長さを表示
-    print(f"  スキャン中: {os.path.basename(video_path)} ({video_duration:.1f}秒, {fps:.1f}fps)")
+    print(f"  スキャン中: {os.path.basename(video_path)} ({video_duration:.1f}秒, {fps:.1f}fps, {cap.name})")
 
     # チェックするフレーム間隔
     frame_step = int(fps * check_interval_sec)
@@ -227,58 +437,140 @@ def scan_video(video_path, target_data, check_interval_sec=0.5, resize_scale=0.5
     # 前後1.5秒（3秒カット用）はスキャン対象外とする
     start_margin = int(fps * 1.5)
     end_limit = total_frames - int(fps * 1.5)
-    
-    current_frame_index = start_margin
+
+    # スキャンする区間 (フレーム番号)。指定が無ければ動画全体
+    if ranges is None:
+        windows = [(start_margin, end_limit)]
+    else:
+        windows = []
+        for s, e in ranges:
+            # 区間の開始を固定間隔のサンプル位置 (start_margin + k * frame_step) に揃える
+            w_start = max(start_margin, int(s * fps))
+            w_start = start_margin + -(-(w_start - start_margin) // frame_step) * frame_step
+            w_end = min(end_limit, int(e * fps) + 1)
+            if w_start < w_end:
+                windows.append((w_start, w_end))
+    window_index = 0
+    current_frame_index = windows[0][0] if windows else end_limit
+    # 場面に合わせてサンプリング間隔を広げる/狭める (無効時は frame_step の固定間隔)
+    sampler = AdaptiveSampler(frame_step,
+                              min_step=fps * float(options.get("adaptive_min_interval", check_interval_sec)),
+                              max_step=fps * float(options.get("adaptive_max_interval", 4.0)),
+                              motion_threshold=float(options.get("adaptive_motion_threshold", 0.5)),
+                              enabled=bool(options.get("adaptive_sampling", False)),
+                              grid=cap.frame_grid)
+    if pool:
+        # プレフィルタは直前の検出結果を使って判定するため、有効な場合は検出を先に始めない。
+        # 先読みの位置はサンプラーの予測 (今の場面が続いた場合の間隔) に従う
+        cap = PrefetchingFrameSource(cap, frame_step, resize_scale, depth=pipeline_threads * 2,
+                                     detect=None if prefilter.enabled else detector.detect,
+                                     executor=pool, end=end_limit, planner=sampler.predict_next)
     prev_frame_gray = None # 動き解析用
+    prev_sample = None # 直前に処理したサンプル (last_detections の検出が見つかったフレーム)
     last_detections = {} # { name: (detection_dict, already_added_to_results) }
+    enriched = set() # 解析済みの検出結果 (id)
+
+    # --- チャンク単位のチェックポイント (長い動画の中断・クラッシュ対策) ---
+    journal = None
+    checkpoint_frames = int(fps * float(options.get("checkpoint_interval", 60)))
+    if journal_path and checkpoint_frames > 0 and windows:
+        journal = ScanJournal(journal_path, video_path, {
+            "interval": check_interval_sec, "resize_scale": resize_scale,
+            "ranges": [list(r) for r in ranges] if ranges is not None else None,
+        })
+        restored = journal.load()
+        if restored:
+            resume_index, restored_detections, last_detections = restored
+            for name, dets in restored_detections.items():
+                results_per_person.setdefault(name, []).extend(dets)
+            # 再開位置より前の区間は飛ばす
+            windows = [(max(s, resume_index), e) for s, e in windows if e > resume_index]
+            current_frame_index = windows[0][0] if windows else end_limit
+            print(f"  前回の続きから再開します: {current_frame_index / fps:.1f}秒〜")
+    # 再照合用のエンコーディングの記録 (動画の最初から最後まで通してスキャンした場合のみ保存する)
+    recorder = EncodingRecorder() if encodings_path and windows and not (journal and restored) else None
+    completed = False
+    chunk_counts = {name: len(dets) for name, dets in results_per_person.items()}
+    next_checkpoint = current_frame_index + checkpoint_frames
+
+    def write_checkpoint(end_index):
+        # 感情分析を済ませてから、前回のチェックポイント以降に追加された検出だけを書き出す
+        emotion_stage.flush()
+        emotion_stage.wait()
+        new_dets = {}
+        for name, dets in results_per_person.items():
+            if len(dets) > chunk_counts.get(name, 0):
+                new_dets[name] = dets[chunk_counts.get(name, 0):]
+            chunk_counts[name] = len(dets)
+        try:
+            journal.append_chunk(end_index, new_dets, last_detections)
+        except Exception as e:
+            print(f"  Warning: ジャーナルを書き込めませんでした: {e}")
     
-    while True:
+    while current_frame_index < end_limit:
         if stop_event and stop_event.is_set():
+            # 中断時はここまでの結果をジャーナルに残し、次回はこのフレームから再開する
+            if journal:
+                write_checkpoint(current_frame_index)
             break
 
-        cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_index)
-        ret, frame = cap.read()
-        if not ret:
+        # sample.rgb_small: 検出用の縮小RGB / sample.analysis_frame(): 解析用BGR (ffmpeg読み込み時も元解像度)
+        sample = cap.read_sample(current_frame_index, resize_scale)
+        if sample is None:
+            completed = True # フレーム数の見積もりより動画が短い場合も、最後まで読んだものとする
             break
 
         # 動き（モーション）スコアの計算
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = sample.gray
         motion_score = 0.0
         if prev_frame_gray is not None:
             # 前のチェックフレームとの差分（簡易的）
             diff = cv2.absdiff(gray, prev_frame_gray)
             motion_score = np.mean(diff) / 25.5 # 0-10にスケーリング
+        prev_gray_before = prev_frame_gray
         prev_frame_gray = gray
+        rgb_small_frame = sample.rgb_small
 
-        # BGR(OpenCV) -> RGB(face_recognition)
-        small_frame = cv2.resize(frame, (0, 0), fx=resize_scale, fy=resize_scale)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        # 顔検出 (プレフィルタで顔が新しく映り得ないと判断したフレームは省略)
+        if prefilter.should_skip(sample):
+            face_locations = []
+        else:
+            t_detect = time.perf_counter()
+            if sample.detection is not None:
+                face_locations = sample.detection.result() # 先読みスレッドで始めておいた検出
+            else:
+                face_locations = detector.detect(rgb_small_frame)
+            prefilter.record_detection(len(face_locations), time.perf_counter() - t_detect)
 
-        # 顔検出
-        face_locations = face_recognition.face_locations(rgb_small_frame)
+        # 広げた間隔の後で顔が見つかった場合は、このフレームは使わずに手前から調べ直す
+        restart_index = sampler.backtrack_index(current_frame_index, bool(face_locations))
+        if restart_index is not None:
+            current_frame_index = restart_index
+            prev_frame_gray = prev_gray_before
+            continue
         
         current_frame_matches = set()
-        if face_locations:
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+        # 前のサンプルと同じ位置の顔は判定を引き継ぎ、それ以外の顔だけエンコードする
+        assigned = tracker.assign(face_locations)
+        to_encode = [loc for loc, track in zip(face_locations, assigned) if track is None]
+        new_matches = []
+        face_encodings = []
+        if to_encode:
+            face_encodings = face_recognition.face_encodings(rgb_small_frame, to_encode)
             
-            for i, enc in enumerate(face_encodings):
-                # 精度向上のため compare_faces ではなく face_distance (最短距離) を使用
-                best_dist = 1.0
-                best_name = None
-                
-                for name, enc_list in target_data.items():
-                    # 互換性のため、単一エンコーディングの場合はリストとして扱う
-                    if not isinstance(enc_list, list):
-                        enc_list = [enc_list]
-                    
-                    # 登録されている全写真との距離を計算し、最も近いものを採用
-                    distances = face_recognition.face_distance(enc_list, enc)
-                    min_d = min(distances) if len(distances) > 0 else 1.0
-                    
-                    if min_d < best_dist:
-                        best_dist = min_d
-                        best_name = name
-                
+            # 精度向上のため compare_faces ではなく最短距離を使用
+            # フレーム内の全ての顔 × 登録済みの全写真の距離を一括で計算する
+            new_matches = matcher.match(face_encodings)
+        matches = tracker.update(face_locations, assigned, new_matches)
+        if recorder is not None:
+            inv_scale = 1.0 / resize_scale
+            locs = [[int(v * inv_scale) for v in loc] for loc in face_locations]
+            ratios = [((loc[1] - loc[3]) * inv_scale) * ((loc[2] - loc[0]) * inv_scale) / total_pixels * 100.0
+                      for loc in face_locations]
+            recorder.add_frame(current_frame_index / fps, motion_score, locs, ratios, assigned, face_encodings)
+
+        if face_locations:
+            for i, (best_name, best_dist) in enumerate(matches):
                 # 精度向上のための厳格化: 0.45 -> 0.42
                 if best_name and best_dist < 0.42:
                     # 顔の大きさ（クローズアップ度）
@@ -310,10 +602,15 @@ def scan_video(video_path, target_data, check_interval_sec=0.5, resize_scale=0.5
                         prev_det, added = last_detections[best_name]
                         
                         # 記録が確定したタイミングで、重たい解析（Emotion/Thumb）を一度だけ実行
-                        def enrich_detection(d):
-                            if "happy" in d: return d # すでに解析済み
+                        # src: 検出が見つかったフレーム (ジャーナルから復元した検出など、手元に無い場合は None)
+                        def enrich_detection(d, src):
+                            if id(d) in enriched: return d # すでに解析済み (感情分析は後でまとめて行う)
+                            enriched.add(id(d))
+                            analysis_sample = src or sample
                             try:
-                                t_top, t_right, t_bottom, t_left = d["face_loc"]
+                                # 解析用フレーム上の座標に変換 (ffmpeg読み込み時も元解像度のフレームで解析する)
+                                frame, frame_scale = analysis_sample.analysis_frame()
+                                t_top, t_right, t_bottom, t_left = [int(v * frame_scale) for v in d["face_loc"]]
                                 
                                 # 安全マージン
                                 h, w, _ = frame.shape
@@ -323,35 +620,29 @@ def scan_video(video_path, target_data, check_interval_sec=0.5, resize_scale=0.5
                                 t_right = min(w, t_right)
                                 
                                 face_img = frame[t_top:t_bottom, t_left:t_right]
-                                
-                                # Emotion Analysis (ONNX)
-                                emo = {}
-                                if emotion_analyzer:
-                                    analysis = emotion_analyzer.analyze(face_img)
-                                    emo = analysis.get('emotion', {})
-                                
                                 v_score = calculate_visual_score(frame)
-                                desc, vibe = infer_description_vibe(emo, motion=d["motion"], face_ratio=d["face_ratio"], visual_score=v_score)
                                 
-                                d["happy"] = round(float(emo.get('happy', 0)) / 100.0, 3)
-                                d["drama"] = round((float(emo.get('surprise', 0)) + float(emo.get('sad', 0)) + 
-                                               float(emo.get('angry', 0)) + float(emo.get('fear', 0))) / 100.0, 3)
-                                d["description"] = desc
-                                d["vibe"] = vibe
-                                d["visual_score"] = v_score
+                                # Emotion Analysis (ONNX) はまとめて推論するため、ここでは顔画像をためるだけ
+                                emotion_stage.add(d, face_img, v_score)
                             except Exception as e:
                                 print(f"    Analysis Error: {e}")
-                                d["happy"], d["drama"], d["description"], d["vibe"], d["visual_score"] = 0, 0, "人物が映っているシーン", "ナチュラル", 5.0
+                                set_default_analysis(d)
                             
                             # Generate thumbnail for UI (using user profile dir)
+                            # デコード済みのフレームから切り出す (手元に無い場合だけ動画を開き直す)
                             from utils import generate_face_thumbnail, get_user_data_dir
                             profile_dir = os.path.join(get_user_data_dir(), "profiles")
-                            generate_face_thumbnail(video_path, d["t"], d["face_loc"], profile_dir)
+                            thumb_frame, thumb_scale = src.analysis_frame() if src is not None else (None, 1.0)
+                            thumb_args = (video_path, d["t"], d["face_loc"], profile_dir, thumb_frame, thumb_scale)
+                            if pool:
+                                thumb_futures.append(pool.submit(generate_face_thumbnail, *thumb_args))
+                            else:
+                                generate_face_thumbnail(*thumb_args)
                             return d
 
                         if not added:
-                            results_per_person[best_name].append(enrich_detection(prev_det))
-                        results_per_person[best_name].append(enrich_detection(det))
+                            results_per_person[best_name].append(enrich_detection(prev_det, prev_sample))
+                        results_per_person[best_name].append(enrich_detection(det, sample))
                         last_detections[best_name] = (det, True)
                     else:
                         last_detections[best_name] = (det, False)
@@ -360,39 +651,192 @@ def scan_video(video_path, target_data, check_interval_sec=0.5, resize_scale=0.5
         for name in list(last_detections.keys()):
             if name not in current_frame_matches:
                 del last_detections[name]
+        prev_sample = sample
 
-        # 次のフレームへ (Seeking vs Reading)
-        current_frame_index += frame_step
-        if current_frame_index >= end_limit:
-            break
-        
-        # 1フレーム飛ばし程度なら cap.read() の方が速い場合があるが、
-        # 大抵の interval (0.5s) では cap.set() の方が効率的
-        # cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_index)
+        # 次のフレームへ (読み飛ばしかシークかは FrameSource 側で判断)
+        current_frame_index = sampler.next_index(current_frame_index, bool(face_locations), motion_score)
+        if current_frame_index >= windows[window_index][1]:
+            # 次の区間へ移動する。区間をまたいだ連続検知や追跡は引き継がない
+            window_index += 1
+            if window_index >= len(windows):
+                completed = True
+                break
+            current_frame_index = windows[window_index][0]
+            last_detections.clear()
+            tracker.tracks = []
+            if recorder is not None:
+                recorder.new_segment()
+            prev_frame_gray = None
+            sampler.reset()
+
+        if journal and current_frame_index >= next_checkpoint and current_frame_index < end_limit:
+            write_checkpoint(current_frame_index)
+            next_checkpoint = current_frame_index + checkpoint_frames
+    else:
+        completed = True
             
     cap.release()
+    # ためておいた顔の感情分析を済ませる (中断時も、記録済みの検出は解析してから返す)
+    emotion_stage.flush()
+    if pool:
+        emotion_stage.wait()
+        for future in thumb_futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"    Thumbnail Error: {e}")
+        pool.shutdown()
+    if recorder is not None and completed:
+        try:
+            recorder.save(encodings_path, keep_range=keep_range,
+                          settings={"interval": check_interval_sec, "resize_scale": resize_scale,
+                                    "detector": options.get("face_detector", "hog")})
+        except Exception as e:
+            print(f"  Warning: エンコーディングを保存できませんでした: {e}")
+
+    if prefilter.enabled:
+        pf = prefilter.stats()
+        print(f"  プレフィルタ: {pf['skipped']}/{pf['sampled']} フレームの顔検出を省略 "
+              f"(変化なし {pf['skipped_static']}, 肌色なし {pf['skipped_skin']}, 検出部分の推定 {pf['est_speedup']:.2f}x)")
+        if stats is not None:
+            stats.update(pf)
+    if sampler.enabled:
+        sc = sampler.stats(start_margin, end_limit)
+        print(f"  サンプリング: {sc['evaluated']} フレームを評価 (固定間隔では {sc['baseline']} フレーム, 戻り {sc['backtracks']} 回)")
+    if tracking:
+        tc = tracker.counters
+        print(f"  顔の追跡: {tc['reused']}/{tc['encoded'] + tc['reused']} 件のエンコードを省略")
+    if pool:
+        print(f"  パイプライン: {pipeline_threads} スレッド (先読みのやり直し {cap.restarts} 回, 読み捨て {cap.skipped} 枚)")
+    if stats is not None:
+        stats["faces_encoded"] = tracker.counters["encoded"]
+        stats["faces_reused"] = tracker.counters["reused"]
+        if sampler.enabled:
+            sc = sampler.stats(start_margin, end_limit)
+            stats["frames_evaluated"] = sc["evaluated"]
+            stats["frames_baseline"] = sc["baseline"]
     return results_per_person
 
-def run_scan(video_folder, target_pkl='target_faces.pkl', output_json=None, force=False, stop_event=None):
+def merge_time_ranges(hit_times, padding, duration):
+    """ヒットした時刻の前後 padding 秒を区間にし、重なる区間をまとめる"""
+    ranges = []
+    for t in sorted(hit_times):
+        start, end = max(0.0, t - padding), min(duration, t + padding)
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return [(round(s, 2), round(e, 2)) for s, e in ranges]
+
+def find_candidate_ranges(video_path, target_data, options=None, stop_event=None, stats=None):
+    """
+    粗いパス: 長い間隔・低解像度で登録人物が映っていそうな時間帯を探し、[(start_sec, end_sec), ...] を返す。
+    感情分析やサムネイル作成は行わない。動画を開けない場合は None。
+    """
+    if options is None:
+        options = get_scan_options()
+    matcher = target_data if isinstance(target_data, FaceMatcher) else FaceMatcher(target_data)
+    interval = float(options.get("coarse_interval", 3.0))
+    threshold = float(options.get("coarse_threshold", 0.5))
+    padding = float(options.get("coarse_padding", interval))
+
+    # 解像度は幅 coarse_max_width 程度まで落とす (小さすぎると HOG が顔を見つけられないため、幅で指定)
+    probe = cv2.VideoCapture(video_path)
+    width = probe.get(cv2.CAP_PROP_FRAME_WIDTH)
+    probe.release()
+    scale = min(0.5, float(options.get("coarse_max_width", 640)) / width) if width > 0 else 0.5
+
+    cap = open_frame_source(video_path, check_interval_sec=interval,
+                            strategy=options["frame_strategy"], reader=options["frame_reader"],
+                            resize_scale=scale)
+    if not cap.isOpened():
+        return None
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if fps <= 0:
+        cap.release()
+        return None
+    duration = total_frames / fps
+    step = max(1, int(fps * interval))
+    detector = get_face_detector(options)
+
+    hit_times = []
+    for idx in range(int(fps * 1.5), total_frames - int(fps * 1.5), step):
+        if stop_event and stop_event.is_set():
+            break
+        sample = cap.read_sample(idx, scale)
+        if sample is None:
+            break
+        face_locations = detector.detect(sample.rgb_small)
+        if not face_locations:
+            continue
+        face_encodings = face_recognition.face_encodings(sample.rgb_small, face_locations)
+        # 見逃しを減らすため、本スキャン (0.42) より緩いしきい値で判定する
+        if any(name and dist < threshold for name, dist in matcher.match(face_encodings)):
+            hit_times.append(idx / fps)
+    cap.release()
+
+    ranges = merge_time_ranges(hit_times, padding, duration)
+    covered = sum(e - s for s, e in ranges)
+    print(f"  粗いスキャン: {os.path.basename(video_path)} - {len(hit_times)} 箇所でヒット "
+          f"(精査 {covered:.0f}/{duration:.0f}秒)")
+    if stats is not None:
+        stats["coarse_hits"] = len(hit_times)
+        stats["coarse_seconds"] = covered
+        stats["video_seconds"] = duration
+    return ranges
+
+# --- スキャン用プロセスの常駐データ ---
+# ProcessPoolExecutor の initializer でプロセスごとに1回だけ設定し、各タスクでは動画パスと設定だけを受け取る
+_worker_matcher = None
+_worker_stop_event = None
+
+def _init_scan_worker(matcher, stop_event, options=None):
+    """スキャン用プロセスの起動時に1回だけ呼ばれ、ギャラリーと感情分析モデルを読み込んでおく"""
+    global _worker_matcher, _worker_stop_event
+    _worker_matcher = matcher # ギャラリー由来の FaceMatcher はここで memmap を開き直したもの
+    _worker_stop_event = stop_event
+    init_emotion_analyzer(options)
+
+def _scan_video_task(video_path, options, ranges=None, part=None, encodings_path=None, keep_range=None, split=False):
+    if split:
+        # 長い動画はスキャンせずに区間の分割だけを返す (動画の長さはワーカー側で調べる)
+        _, shards = plan_video_shards(video_path, options)
+        if shards != [None]:
+            return None, {"shards": shards}
+    stats = {}
+    results_per_person = scan_video(video_path, _worker_matcher, stop_event=_worker_stop_event, options=options, stats=stats,
+                                    ranges=ranges, journal_path=journal_path_for(video_path, part),
+                                    encodings_path=encodings_path, keep_range=keep_range)
+    return results_per_person, stats
+
+def _coarse_scan_task(video_path, options):
+    stats = {}
+    ranges = find_candidate_ranges(video_path, _worker_matcher, options=options, stop_event=_worker_stop_event, stats=stats)
+    return ranges, stats
+
+def run_scan(video_folder, gallery_path='target_faces.gallery', output_json=None, force=False, stop_event=None, options=None):
+    from gallery import gallery_in_use, compact_if_needed
+    # 削除時に見送った詰め直しはここで行い、スキャン中は詰め直さない (スキャン用プロセスが memmap で開いているため)
+    compact_if_needed(gallery_path)
+    with gallery_in_use(gallery_path):
+        return _run_scan(video_folder, gallery_path, output_json, force, stop_event, options)
+
+def _run_scan(video_folder, gallery_path, output_json, force, stop_event, options):
     if output_json is None:
         from utils import get_user_data_dir
         output_json = os.path.join(get_user_data_dir(), 'scan_results.json')
+    if options is None:
+        options = get_scan_options()
         
     # 特徴量ロード
-    target_data = load_target_encodings(target_pkl)
+    gallery = load_target_gallery(gallery_path)
+    matcher = build_face_matcher(gallery, options)
 
-    # 動画ファイル検索
-    video_extensions = ['*.mp4', '*.mov', '*.avi', '*.mkv', '*.MP4', '*.MOV']
-    video_files = []
-    
+    # 動画ファイル検索 (サブフォルダも含めて1回でたどる)
     print(f"フォルダを検索中 (再帰的): {video_folder}...")
-    for ext in video_extensions:
-        # 再帰的に検索 (サブフォルダも含む)
-        path_pattern = os.path.join(video_folder, "**", ext)
-        video_files.extend(glob.glob(path_pattern, recursive=True))
-    
-    # 重複排除とソート
-    video_files = sorted(list(set(video_files)))
+    video_files = find_videos(video_folder)
     
     if not video_files:
         print("動画ファイルが見つかりませんでした。")
@@ -400,27 +844,21 @@ def run_scan(video_folder, target_pkl='target_faces.pkl', output_json=None, forc
 
     print(f"動画ファイル {len(video_files)} 本を対象に処理を開始します。")
 
-    # --- 既存の結果をロード ---
-    from utils import load_json_safe
-    
-    # 既存の結果をロード
-    default_results = {
-            "people": {name: {} for name in target_data.keys()},
-            "metadata": {}
-        }
-    results = load_json_safe(output_json, default_results)
-    
+    # --- 既存の結果をロード (スキャン対象の判定に必要な動画のメタデータだけを読む) ---
+    from results_store import open_results_store
+    store = open_results_store(output_json)
     # 未登録の人物を同期
-    for name in target_data.keys():
-        if name not in results["people"]:
-            results["people"][name] = {}
-
-    # スキャン対象を決定
-    to_scan = []
-    for video_path in video_files:
-        if not force and video_path in results["metadata"]:
-            continue
-        to_scan.append(video_path)
+    store.add_people(matcher.names)
+    results = {"people": {}, "metadata": store.video_metadata()}
+
+    # スキャン対象を決定 (パスではなく、サイズ・更新日時・内容の一部から作った指紋で判断する)
+    to_scan, file_infos, relinked, backfilled = plan_incremental_scan(results, video_files, force=force)
+    for old_path, new_path in relinked:
+        store.relink_video(old_path, new_path)
+    if relinked:
+        print(f"移動・名前変更された動画 {len(relinked)} 本の結果を新しいパスに付け替えました。")
+    for path in backfilled:
+        store.update_metadata(path, results["metadata"][path])
 
     if not to_scan:
         print("スキャン対象の新しい動画はありません。")
@@ -428,15 +866,14 @@ def run_scan(video_folder, target_pkl='target_faces.pkl', output_json=None, forc
 
     print(f"スキャン開始: {len(to_scan)} 本の動画を処理します。")
     
-    # プロセス数はCPU芯数の半分程度に制限（メモリ消費対策）
-    max_workers = max(1, multiprocessing.cpu_count() // 2)
-    if max_workers > 4: max_workers = 4 # メモリを大量に使うため最大4程度に制限
-    
-    from utils import save_json_atomic
-    
     # ProcessPoolExecutor では stop_event (threading.Event) は渡せないので注意
     # GUI側の停止イベント(threading.Event)をサブプロセス用の停止イベント(multiprocessing.Event)に同期させる
+    prefilter_total = {} # プレフィルタのカウンタ (全動画の合計)
+    scan_totals = {"faces_encoded": 0, "faces_reused": 0, "frames_evaluated": 0, "frames_baseline": 0,
+                   "coarse_empty": 0, "coarse_seconds": 0.0, "video_seconds": 0.0}
     manager = multiprocessing.Manager()
+    # この時点の子プロセス (Manager など) はスキャン用ではないので、メモリの実測から外す
+    non_worker_pids = [p.pid for p in multiprocessing.active_children()]
     try:
         m_stop_event = manager.Event()
         
@@ -444,24 +881,112 @@ def run_scan(video_folder, target_pkl='target_faces.pkl', output_json=None, forc
         futures = {}
         completed_count = 0
         
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            # scan_video をサブプロセスで実行開始
+        def record_result(video_path, results_per_person, extra_meta=None):
+            # --- マージ処理 ---
+            # 1本分の動画と検出だけをデータベースに書き込む
+            mtime = os.path.getmtime(video_path)
+            dt = datetime.datetime.fromtimestamp(mtime)
+            month_str = dt.strftime('%Y-%m')
+            date_str = dt.strftime('%Y-%m-%d %H:%M:%S')
+            # 内容が変わって再スキャンした動画は、前の内容のエンコーディングを削除する
+            old_fingerprint = results["metadata"].get(video_path, {}).get("fingerprint")
+            if old_fingerprint and old_fingerprint != file_infos.get(video_path, {}).get("fingerprint"):
+                remove_encoding_store(old_fingerprint)
+            meta = {"month": month_str, "date": date_str}
+            meta.update(file_infos.get(video_path, {}))
+            if extra_meta:
+                meta.update(extra_meta)
+            results["metadata"][video_path] = meta
+            
+            # タイムスタンプの最終確定 (検出されなかった人物は、その動画の検出を削除する)
+            for ts_list in results_per_person.values():
+                for det in ts_list:
+                    if det.get("timestamp") == "PENDING":
+                        det["timestamp"] = date_str
+            
+            # 1本ごとに保存（大規模スキャン時のクラッシュ対策）
+            store.record_video(video_path, meta, results_per_person)
+            # 途中経過のジャーナルはスキャン結果に反映済みなので削除する
+            remove_journal(video_path)
+
+        def report_progress(video_path, hit_info):
+            pct = int((completed_count / len(to_scan)) * 100)
+            print(f"進捗: {pct}% ({completed_count}/{len(to_scan)}本完了) - {os.path.basename(video_path)}{hit_info}")
+            sys.stdout.flush()
+
+        coarse_to_fine = options.get("scan_mode", "full") == "coarse_to_fine"
+        coarse_meta = {} # { video_path: {"coarse_hits": n} }
+        shard_parts = {} # { video_path: {"remaining": 残りシャード数, "results": {name: [det, ...]}} }
+
+        # 同時実行数はプロセスごとのメモリ使用量と空きメモリから決め、タスクの合間に増減させる（メモリ消費対策）
+        scaler = WorkerScaler(max_workers=options.get("max_workers", 0), reserve_mb=options.get("memory_reserve_mb", 1024),
+                              exclude_pids=non_worker_pids)
+        pending_tasks = collections.deque()
+
+        # 再照合用のエンコーディングは、動画全体を通してスキャンする場合 (粗いパスで絞らない場合) に保存する
+        store_encodings = bool(options.get("store_encodings", False)) and not coarse_to_fine
+
+        def encodings_path(v_path, part=None):
+            if not store_encodings or not file_infos.get(v_path):
+                return None
+            return encoding_store_path(file_infos[v_path]["fingerprint"], part)
+
+        def stored_encoding_meta(v_path, parts):
+            # 全区間の分がそろって保存できた場合だけ、metadata に記録する
+            if not store_encodings or not file_infos.get(v_path):
+                return None
+            paths = encoding_store_paths(file_infos[v_path]["fingerprint"], parts)
+            return {"encoding_parts": parts} if all(os.path.exists(p) for p in paths) else None
+
+        def submit_pending():
+            while pending_tasks and len(futures) < scaler.target:
+                v_path, phase, shard = pending_tasks.popleft()
+                if phase == "coarse":
+                    f = workers.submit(_coarse_scan_task, v_path, options)
+                elif phase == "shard":
+                    f = workers.submit(_scan_video_task, v_path, options, [shard[1]], shard[0],
+                                       encodings_path(v_path, shard[0]), shard[2])
+                elif phase == "fine":
+                    f = workers.submit(_scan_video_task, v_path, options, shard)
+                else:
+                    f = workers.submit(_scan_video_task, v_path, options, None, None, encodings_path(v_path), None, True)
+                futures[f] = (v_path, phase, shard)
+
+        # プロセスは同時実行数 (scaler.target) の分だけ起動し、増減に合わせて追加・終了する
+        with ScalingProcessPool(scaler, initializer=_init_scan_worker, initargs=(matcher, m_stop_event, options)) as workers:
+            # scan_video をサブプロセスで実行開始 (ギャラリーと停止イベントは initializer で渡し済み)
+            # coarse_to_fine の場合は、まず全動画の粗いパスを投入し、ヒットした動画から順に精査を投入する
+            # 全タスクをファイルサイズの大きい順 (おおよそ長い順) に投入する (最後に長いタスクが1つだけ残るのを防ぐ)
+            # 長い動画の区間への分割は、ワーカーが動画を開いたときに決めて返す (起動時に全動画を順に開かない)
+            tasks = []
             for v_path in to_scan:
-                f = executor.submit(scan_video, v_path, target_data, stop_event=m_stop_event)
-                futures[f] = v_path
+                if store_encodings and file_infos.get(v_path):
+                    # 分割の設定が前回と違う場合に備えて、同じ内容の古いエンコーディングは消しておく
+                    remove_encoding_store(file_infos[v_path]["fingerprint"])
+                size = file_infos.get(v_path, {}).get("size", 0)
+                tasks.append((size, v_path, "coarse" if coarse_to_fine else "full", None))
+            tasks.sort(key=lambda t: t[0], reverse=True)
+            pending_tasks.extend((v_path, phase, shard) for _, v_path, phase, shard in tasks)
+            submit_pending()
             
             # ポーリングによる非ブロッキング監視（中断への即時応答のため）
-            while futures:
+            while futures or pending_tasks:
                 # GUI側で中断が押されたかチェック
                 if stop_event and stop_event.is_set():
                     if not m_stop_event.is_set():
                         print("\nユーザーによる中断がリクエストされました。")
                         m_stop_event.set() # サブプロセスへ停止命令
                         # まだ開始されていないタスクをキャンセル
+                        pending_tasks.clear()
                         for f in futures:
                             f.cancel()
                     break
 
+                # 空きメモリに合わせて同時実行数を決め直し、空いた分だけ次のタスクを投入する
+                scaler.update(len(futures))
+                workers.resize()
+                submit_pending()
+
                 # 完了したタスクを待機（タイムアウト付きで定期的にループを回す）
                 done, _ = concurrent.futures.wait(
                     futures.keys(), 
@@ -471,44 +996,70 @@ def run_scan(video_folder, target_pkl='target_faces.pkl', output_json=None, forc
                 
                 for future in done:
                     if future not in futures: continue # 既に処理済みの場合
-                    video_path = futures.pop(future)
-                    completed_count += 1
+                    video_path, phase, shard = futures.pop(future)
+                    workers.release(future)
                     
                     try:
-                        results_per_person = future.result()
+                        if phase == "coarse":
+                            ranges, video_stats = future.result()
+                            for key in ("coarse_seconds", "video_seconds"):
+                                scan_totals[key] += video_stats.get(key, 0)
+                            if stop_event and stop_event.is_set():
+                                continue
+                            if ranges is None:
+                                # 粗いパスで開けなかった動画は通常のスキャンに回す
+                                pending_tasks.appendleft((video_path, "full", None))
+                            elif ranges:
+                                coarse_meta[video_path] = {"coarse_hits": video_stats.get("coarse_hits", 0)}
+                                pending_tasks.appendleft((video_path, "fine", ranges))
+                            else:
+                                # 誰も映っていない動画: 精査せずに「粗いパスでヒットなし」として記録する
+                                completed_count += 1
+                                scan_totals["coarse_empty"] += 1
+                                report_progress(video_path, " [No Hits (coarse)]")
+                                record_result(video_path, {name: [] for name in matcher.names}, {"coarse_hits": 0})
+                            continue
+
+                        results_per_person, video_stats = future.result()
+                        if "shards" in video_stats:
+                            # 長い動画: 区間ごとのタスクを次に投入する
+                            shards = video_stats["shards"]
+                            shard_parts[video_path] = {"remaining": len(shards), "count": len(shards), "results": {}}
+                            for i in reversed(range(len(shards))):
+                                pending_tasks.appendleft((video_path, "shard", (i, *shards[i])))
+                            print(f"  長い動画を {len(shards)} 区間に分割しました: {os.path.basename(video_path)}")
+                            continue
+                        if "sampled" in video_stats:
+                            merge_prefilter_stats(prefilter_total, video_stats)
+                        for key in ("faces_encoded", "faces_reused", "frames_evaluated", "frames_baseline"):
+                            scan_totals[key] += video_stats.get(key, 0)
+
+                        extra_meta = coarse_meta.pop(video_path, None)
+                        if phase == "full":
+                            extra_meta = stored_encoding_meta(video_path, 1)
+                        if phase == "shard":
+                            # 自分の担当区間の検出だけを残し、全シャードがそろったら1本分として記録する
+                            part = shard_parts[video_path]
+                            keep_start, keep_end = shard[2]
+                            for name, ts_list in results_per_person.items():
+                                part["results"].setdefault(name, []).extend(
+                                    d for d in ts_list if keep_start <= d["t"] < keep_end)
+                            part["remaining"] -= 1
+                            if part["remaining"] > 0:
+                                continue
+                            results_per_person = {name: sorted(ts_list, key=lambda d: d["t"])
+                                                  for name, ts_list in part["results"].items()}
+                            extra_meta = stored_encoding_meta(video_path, shard_parts.pop(video_path)["count"])
+
+                        completed_count += 1
                         
                         # 誰がヒットしたかを確認
                         hit_names = [name for name, ts in results_per_person.items() if len(ts) > 0]
                         hit_info = f" [HIT: {', '.join(hit_names)}]" if hit_names else " [No Hits]"
                         
                         # 進捗表示
-                        pct = int((completed_count / len(to_scan)) * 100)
-                        print(f"進捗: {pct}% ({completed_count}/{len(to_scan)}本完了) - {os.path.basename(video_path)}{hit_info}")
-                        sys.stdout.flush()
-
-                        # --- マージ処理 ---
-                        # 毎回ファイル全体をリロードすると非常に遅いため、インメモリの results を直接更新する
-                        mtime = os.path.getmtime(video_path)
-                        dt = datetime.datetime.fromtimestamp(mtime)
-                        month_str = dt.strftime('%Y-%m')
-                        date_str = dt.strftime('%Y-%m-%d %H:%M:%S')
-                        results["metadata"][video_path] = {"month": month_str, "date": date_str}
-                        
-                        for name, ts_list in results_per_person.items():
-                            if name not in results["people"]:
-                                results["people"][name] = {}
-                            if ts_list:
-                                # タイムスタンプの最終確定
-                                for det in ts_list:
-                                    if det.get("timestamp") == "PENDING":
-                                        det["timestamp"] = date_str
-                                results["people"][name][video_path] = ts_list
-                            elif video_path in results["people"][name]:
-                                # 検出されなかった場合は削除（再スキャン時など）
-                                del results["people"][name][video_path]
-                        
-                        # 1本ごとに保存（大規模スキャン時のクラッシュ対策）
-                        save_json_atomic(output_json, results)
+                        report_progress(video_path, hit_info)
+                        record_result(video_path, results_per_person, extra_meta)
 
                     except Exception as e:
                         print(f"  エラー ({os.path.basename(video_path)}): {e}")
@@ -517,12 +1068,89 @@ def run_scan(video_folder, target_pkl='target_faces.pkl', output_json=None, forc
         if 'manager' in locals():
             manager.shutdown()
 
+    if 'scaler' in locals():
+        print(f"ワーカー: {scaler.summary()}")
+    if prefilter_total:
+        print(f"プレフィルタ合計: {prefilter_total['skipped']}/{prefilter_total['sampled']} フレームの顔検出を省略 "
+              f"(検出部分の推定 {prefilter_total['est_speedup']:.2f}x)")
+    if scan_totals["faces_reused"]:
+        faces = scan_totals["faces_encoded"] + scan_totals["faces_reused"]
+        print(f"顔の追跡合計: {scan_totals['faces_reused']}/{faces} 件のエンコードを省略")
+    if scan_totals["frames_baseline"]:
+        print(f"サンプリング合計: {scan_totals['frames_evaluated']} フレームを評価 (固定間隔では {scan_totals['frames_baseline']} フレーム)")
+    if scan_totals["video_seconds"]:
+        print(f"粗いスキャン合計: {scan_totals['coarse_empty']} 本は人物なし、精査した範囲 "
+              f"{scan_totals['coarse_seconds']:.0f}/{scan_totals['video_seconds']:.0f}秒")
     print(f"\n処理完了。結果詳細を保存しました: {output_json}")
     if results and "metadata" in results:
         print("検出された動画:")
         for path in results["metadata"].keys():
             print(f"- {os.path.basename(path)}")
 
+def run_rematch(video_folder=None, gallery_path='target_faces.gallery', output_json=None, options=None):
+    """
+    保存済みの顔エンコーディング (store_encodings) を現在のギャラリーで照合し直し、動画を読まずに結果を更新する。
+    人物を追加・削除した後に、全動画を再スキャンする代わりに使う。
+    既にある検出 (感情分析済み) はそのまま残し、新しく見つかった検出には既定の解析値を入れる
+    (サムネイルは GUI で表示するときに作られる)。
+    video_folder を指定すると、そのフォルダ以下の動画だけを対象にする。
+    """
+    from gallery import gallery_in_use
+    with gallery_in_use(gallery_path):
+        return _run_rematch(video_folder, gallery_path, output_json, options)
+
+def _run_rematch(video_folder, gallery_path, output_json, options):
+    if output_json is None:
+        from utils import get_user_data_dir
+        output_json = os.path.join(get_user_data_dir(), 'scan_results.json')
+    if options is None:
+        options = get_scan_options()
+
+    from results_store import open_results_store
+    gallery = load_target_gallery(gallery_path)
+    matcher = build_face_matcher(gallery, options)
+    results_store = open_results_store(output_json)
+    results_store.add_people(matcher.names)
+    folder = os.path.abspath(video_folder) if video_folder else None
+
+    start = time.time()
+    rematched = 0
+    missing = []
+    for video_path, meta in results_store.video_metadata().items():
+        if folder and not os.path.abspath(video_path).startswith(folder + os.sep):
+            continue
+        stores = None
+        if meta.get("fingerprint") and meta.get("encoding_parts"):
+            stores = [load_encoding_store(p) for p in encoding_store_paths(meta["fingerprint"], meta["encoding_parts"])]
+        if not stores or any(store is None for store in stores):
+            missing.append(video_path)
+            continue
+
+        results_per_person = {name: [] for name in matcher.names}
+        for store in stores:
+            for name, dets in rematch_store(store, matcher).items():
+                results_per_person[name].extend(dets)
+
+        existing_per_person = results_store.video_detections(video_path)
+        for name, dets in results_per_person.items():
+            existing = {d["t"]: d for d in existing_per_person.get(name, [])}
+            merged = []
+            for det in sorted(dets, key=lambda d: d["t"]):
+                if det["t"] in existing:
+                    merged.append(existing[det["t"]])
+                    continue
+                set_default_analysis(det)
+                det["timestamp"] = meta.get("date", det["timestamp"])
+                merged.append(det)
+            results_per_person[name] = merged
+        results_store.record_video(video_path, meta, results_per_person)
+        rematched += 1
+
+    print(f"照合し直した動画: {rematched} 本 ({time.time() - start:.1f}秒)")
+    if missing:
+        print(f"エンコーディングが保存されていない動画: {len(missing)} 本 (これらは再スキャンが必要です)")
+    return rematched, missing
+
 if __name__ == "__main__":
     import argparse
     # Ensure freeze_support is called at the very beginning for Windows binaries
@@ -530,8 +1158,12 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser()
     parser.add_argument("video_folder")
-    parser.add_argument("target_pkl", nargs="?", default='target_faces.pkl')
+    parser.add_argument("gallery", nargs="?", default='target_faces.gallery')
     parser.add_argument("--force", action="store_true", help="既スキャン動画を再スキャン")
+    parser.add_argument("--rematch", action="store_true", help="動画を読まずに、保存済みのエンコーディングを現在のギャラリーで照合し直す")
     args = parser.parse_args()
     
-    run_scan(args.video_folder, args.target_pkl, force=args.force)
+    if args.rematch:
+        run_rematch(args.video_folder, args.gallery)
+    else:
+        run_scan(args.video_folder, args.gallery, force=args.force)
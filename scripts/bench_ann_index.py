@@ -0,0 +1,80 @@
+"""
+近似最近傍インデックス (ann_index.IVFIndex) と全件比較 (FaceMatcher) の精度・速度比較。
+人物ごとにまとまった合成エンコーディングで、1k / 10k / 100k 件の登録データを想定する。
+
+使用法: python scripts/bench_ann_index.py [--sizes 1000,10000,100000] [--nprobe 8]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from face_matcher import FaceMatcher
+from ann_index import IVFIndex
+
+ENCODING_DIM = 128
+# 実際の dlib エンコーディングに近い距離感: 別人同士 ≈ 0.9 / 同一人物 ≈ 0.25-0.35
+PERSON_STD = 0.9 / np.sqrt(2 * ENCODING_DIM)
+SAMPLE_STD = 0.25 / np.sqrt(ENCODING_DIM)
+
+
+def make_gallery(n, per_person, rng):
+    people = max(1, n // per_person)
+    centers = rng.normal(0, PERSON_STD, (people, ENCODING_DIM))
+    target_data = {}
+    for p in range(people):
+        target_data[f"person_{p:05d}"] = [centers[p] + rng.normal(0, SAMPLE_STD, ENCODING_DIM) for _ in range(per_person)]
+    return target_data, centers
+
+
+def time_queries(match_fn, queries, faces_per_frame):
+    results = []
+    t0 = time.perf_counter()
+    for s in range(0, len(queries), faces_per_frame):
+        results.extend(match_fn(queries[s:s + faces_per_frame]))
+    elapsed = time.perf_counter() - t0
+    return results, elapsed / len(queries) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--per-person", type=int, default=20, help="1人あたりの登録写真数")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--faces-per-frame", type=int, default=4)
+    parser.add_argument("--nprobe", default="4,8,16")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>7} {'method':>12} {'build s':>8} {'ms/face':>8} {'recall@1':>9} {'same name':>9}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        target_data, centers = make_gallery(n, args.per_person, rng)
+        # 半分は登録済みの人物の新しい写真、半分は未登録の人物
+        known = centers[rng.integers(0, len(centers), args.queries // 2)] + rng.normal(0, SAMPLE_STD, (args.queries // 2, ENCODING_DIM))
+        unknown = rng.normal(0, PERSON_STD, (args.queries - len(known), ENCODING_DIM))
+        queries = np.concatenate([known, unknown])
+
+        t0 = time.perf_counter()
+        matcher = FaceMatcher(target_data)
+        build_exact = time.perf_counter() - t0
+        exact, ms_exact = time_queries(matcher.match, queries, args.faces_per_frame)
+        print(f"{n:>7} {'brute-force':>12} {build_exact:>8.2f} {ms_exact:>8.3f} {1.0:>9.3f} {1.0:>9.3f}")
+
+        t0 = time.perf_counter()
+        index = IVFIndex.build(target_data)
+        build_ivf = time.perf_counter() - t0
+        for nprobe in [int(p) for p in args.nprobe.split(",")]:
+            index.nprobe = nprobe
+            approx, ms_ivf = time_queries(index.match, queries, args.faces_per_frame)
+            # recall@1: 全件比較と同じ距離の最近傍を見つけられた割合
+            recall = np.mean([abs(a[1] - e[1]) < 1e-6 for a, e in zip(approx, exact)])
+            # 判定結果 (しきい値 0.42 未満の人物名) が一致した割合
+            same = np.mean([(a[0] if a[1] < 0.42 else None) == (e[0] if e[1] < 0.42 else None) for a, e in zip(approx, exact)])
+            print(f"{n:>7} {f'ivf/np={nprobe}':>12} {build_ivf:>8.2f} {ms_ivf:>8.3f} {recall:>9.3f} {same:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+顔検出器 (HOG / ONNX) の速度と、HOG の検出結果との一致度を比較するベンチマーク。
+画像 (フォルダ可) や動画を指定すると、scan_video と同じく縮小した RGB 画像で検出を行う。
+
+使用法: python scripts/bench_face_detector.py <画像/フォルダ/動画 ...> [--detectors hog,onnx] [--scale 0.5]
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from face_detector import get_face_detector
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTS = (".mp4", ".mov", ".avi", ".mkv")
+
+
+def load_fixtures(paths, frames_per_video, scale):
+    """(ラベル, 縮小RGB画像) のリスト"""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, names in os.walk(p):
+                files.extend(os.path.join(root, n) for n in sorted(names))
+        else:
+            files.append(p)
+
+    fixtures = []
+    for path in files:
+        ext = os.path.splitext(path)[1].lower()
+        frames = []
+        if ext in IMAGE_EXTS:
+            img = cv2.imread(path)
+            if img is not None:
+                frames.append((os.path.basename(path), img))
+        elif ext in VIDEO_EXTS:
+            cap = cv2.VideoCapture(path)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            for idx in np.linspace(0, max(0, total - 1), frames_per_video).astype(int):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+                ret, img = cap.read()
+                if ret:
+                    frames.append((f"{os.path.basename(path)}#{idx}", img))
+            cap.release()
+        for label, img in frames:
+            small = cv2.resize(img, (0, 0), fx=scale, fy=scale)
+            fixtures.append((label, cv2.cvtColor(small, cv2.COLOR_BGR2RGB)))
+    return fixtures
+
+
+def iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(reference, detected, threshold=0.4):
+    """HOG の枠と IoU で貪欲に対応付け、(一致数, 一致した枠の IoU リスト) を返す"""
+    used = set()
+    ious = []
+    for ref in reference:
+        best, best_j = 0.0, None
+        for j, box in enumerate(detected):
+            if j in used:
+                continue
+            v = iou(ref, box)
+            if v > best:
+                best, best_j = v, j
+        if best_j is not None and best >= threshold:
+            used.add(best_j)
+            ious.append(best)
+    return len(ious), ious
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="画像・フォルダ・動画")
+    parser.add_argument("--detectors", default="hog,onnx")
+    parser.add_argument("--scale", type=float, default=0.5, help="検出前の縮小率 (scan_video の resize_scale)")
+    parser.add_argument("--frames-per-video", type=int, default=20)
+    parser.add_argument("--model", default="", help="ONNX モデルのパス (省略時は assets/models)")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.paths, args.frames_per_video, args.scale)
+    if not fixtures:
+        print("画像が見つかりませんでした。")
+        return
+    print(f"{len(fixtures)} 枚の画像で計測します (縮小率 {args.scale})")
+
+    results = {}
+    print(f"{'detector':>9} {'images/s':>9} {'faces':>6} {'faces/s':>8} {'recall':>7} {'precision':>9} {'mean IoU':>8}")
+    for backend in args.detectors.split(","):
+        detector = get_face_detector({"face_detector": backend, "face_detector_model": args.model,
+                                      "face_detector_threshold": args.threshold})
+        if detector.name != backend:
+            print(f"{backend:>9} (使用できないためスキップ)")
+            continue
+        detector.detect(fixtures[0][1]) # ウォームアップ
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            boxes = [detector.detect(rgb) for _, rgb in fixtures]
+        sec = (time.perf_counter() - t0) / args.repeat
+        results[backend] = boxes
+        n_faces = sum(len(b) for b in boxes)
+
+        recall = precision = mean_iou = float("nan")
+        if "hog" in results and backend != "hog":
+            matched, ious = 0, []
+            for ref, det in zip(results["hog"], boxes):
+                m, v = agreement(ref, det)
+                matched += m
+                ious.extend(v)
+            n_ref = sum(len(b) for b in results["hog"])
+            recall = matched / n_ref if n_ref else float("nan")
+            precision = matched / n_faces if n_faces else float("nan")
+            mean_iou = float(np.mean(ious)) if ious else float("nan")
+        print(f"{backend:>9} {len(fixtures) / sec:>9.1f} {n_faces:>6} {n_faces / sec:>8.1f} {recall:>7.3f} {precision:>9.3f} {mean_iou:>8.3f}")
+
+    if "hog" in results:
+        print("\nrecall / precision: HOG の検出枠を基準とした一致率 (IoU >= 0.4)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+scan_video のフレーム取得方式（シーク / 読み飛ばし / キーフレーム考慮 / ffmpegパイプ）のベンチマーク。
+合成テスト動画を同梱の ffmpeg で生成し、方式ごとのサンプル取得速度を比較する。
+
+使用法: python scripts/bench_frame_sampling.py [--size 1920x1080] [--duration 30]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from frame_source import SeekFrameSource, SequentialFrameSource, FFmpegPipeFrameSource, open_frame_source, probe_gop_size
+
+
+def make_test_video(path, size, duration, fps, gop):
+    import imageio_ffmpeg
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}",
+        "-t", str(duration),
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(gop), "-keyint_min", str(gop),
+        "-sc_threshold", "0", "-pix_fmt", "yuv420p", path
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def sample_indices(source, check_interval_sec):
+    fps = source.get(cv2.CAP_PROP_FPS)
+    total = int(source.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = max(1, int(fps * check_interval_sec))
+    start = int(fps * 1.5)
+    end = total - int(fps * 1.5)
+    return list(range(start, end, step))
+
+
+def run_strategy(source, check_interval_sec):
+    indices = sample_indices(source, check_interval_sec)
+    frames = {}
+    t0 = time.perf_counter()
+    for idx in indices:
+        # scan_video と同じく、検出用の縮小RGBまで作るところを計測する
+        sample = source.read_sample(idx, 0.5)
+        if sample is None:
+            break
+        frames[idx] = sample.rgb_small[::32, ::32].copy() # 比較用に間引いて保持
+    elapsed = time.perf_counter() - t0
+    stats = (len(frames), elapsed, source.decoded_frames, source.seek_count)
+    source.release()
+    return stats, frames
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="1920x1080")
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--gops", default="30,120,300", help="GOP長（カンマ区切り）")
+    parser.add_argument("--intervals", default="0.5,2.0", help="check_interval_sec（カンマ区切り）")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="omokage_bench_")
+    gops = [int(g) for g in args.gops.split(",")]
+    intervals = [float(i) for i in args.intervals.split(",")]
+
+    print(f"{'GOP':>5} {'interval':>8} {'strategy':>11} {'samples':>7} {'sec':>7} {'samples/s':>9} {'decoded':>7} {'seeks':>5} {'speedup':>7}")
+    for gop in gops:
+        path = os.path.join(tmp_dir, f"synthetic_gop{gop}.mp4")
+        make_test_video(path, args.size, args.duration, args.fps, gop)
+        probed = probe_gop_size(path)
+        if probed != gop:
+            print(f"  (probe_gop_size: {probed}, expected {gop})")
+
+        for interval in intervals:
+            sources = [
+                ("seek", lambda: SeekFrameSource(path)),
+                ("sequential", lambda: SequentialFrameSource(path)),
+                ("keyframe", lambda: SeekFrameSource(path, gop_size=probed)),
+                ("auto", lambda: open_frame_source(path, check_interval_sec=interval)),
+                # デコーダ側で縮小するため、得られるフレームは比較対象外
+                ("ffmpeg", lambda: FFmpegPipeFrameSource(path, check_interval_sec=interval, resize_scale=0.5)),
+            ]
+            baseline_sec = None
+            reference = None
+            for label, factory in sources:
+                source = factory()
+                if label == "auto":
+                    label = f"auto:{source.name}"
+                (n, sec, decoded, seeks), frames = run_strategy(source, interval)
+                if baseline_sec is None:
+                    baseline_sec, reference = sec, frames
+                elif label != "ffmpeg":
+                    # 方式が違っても同じフレームが得られているかを確認
+                    mismatched = [i for i in reference if i in frames and not np.array_equal(reference[i], frames[i])]
+                    if mismatched:
+                        print(f"  Warning: {label} returned different frames at {len(mismatched)} indices")
+                print(f"{gop:>5} {interval:>8.1f} {label:>11} {n:>7} {sec:>7.2f} {n / sec if sec else 0:>9.1f} {decoded:>7} {seeks:>5} {baseline_sec / sec if sec else 0:>6.2f}x")
+
+    print(f"\nテスト動画: {tmp_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+1本の動画を scan_video でスキャンしたときの所要時間を、直列 (pipeline_threads=0) と
+動画内のスレッドパイプライン (先読み・検出・感情分析・サムネイル作成を別スレッドで実行) で比較する。
+登録人物はギャラリー (--gallery) から読み込む。省略時はランダムなエンコーディングを使う
+(その場合は照合がヒットしないため、感情分析・サムネイル作成の分は含まれない)。
+
+使用法: python scripts/bench_scan_pipeline.py <動画> [--threads 0,2,4] [--interval 0.5] [--gallery target_faces.gallery]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from scan_videos import scan_video, get_scan_options, load_target_gallery, build_face_matcher
+from face_matcher import FaceMatcher
+
+
+def detections_key(results):
+    return {name: [d["t"] for d in dets] for name, dets in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video")
+    parser.add_argument("--threads", default="0,2,4", help="比較する pipeline_threads (カンマ区切り、0 = 直列)")
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--scale", type=float, default=0.5)
+    parser.add_argument("--gallery", default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    base_options = get_scan_options()
+    if args.gallery:
+        matcher = build_face_matcher(load_target_gallery(args.gallery), base_options)
+    else:
+        rng = np.random.default_rng(0)
+        matcher = FaceMatcher({"dummy": list(rng.normal(size=(4, 128)))})
+
+    results = []
+    for threads in [int(t) for t in args.threads.split(",")]:
+        options = dict(base_options, pipeline_threads=threads, checkpoint_interval=0)
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            found = scan_video(args.video, matcher, check_interval_sec=args.interval,
+                               resize_scale=args.scale, options=options)
+            times.append(time.perf_counter() - t0)
+        results.append((threads, min(times), detections_key(found)))
+
+    base_threads, base_time, base_found = results[0]
+    print()
+    print(f"{'threads':>8} {'sec':>9} {'speedup':>8}  same-result")
+    for threads, sec, found in results:
+        print(f"{threads:>8} {sec:>9.2f} {base_time / sec:>7.2f}x  {found == base_found}")
+
+
+if __name__ == "__main__":
+    main()
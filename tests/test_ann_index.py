@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex, index_path_for, load_or_build_index
+from face_matcher import FaceMatcher
+
+
+def _gallery(people=40, per_person=30, seed=0):
+    """人物ごとにまとまった合成エンコーディング {name: [encoding, ...]}"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for p in range(people):
+        center = rng.normal(0, 0.09, 128)
+        data[f"person{p:02d}"] = [center + rng.normal(0, 0.02, 128) for _ in range(per_person)]
+    return data
+
+
+def _queries(data, n=200, seed=1):
+    rng = np.random.default_rng(seed)
+    names = list(data)
+    queries = []
+    for i in range(n):
+        if i % 10 == 0:
+            queries.append(rng.normal(0, 0.09, 128)) # 誰でもない顔
+        else:
+            encs = data[names[rng.integers(len(names))]]
+            queries.append(encs[rng.integers(len(encs))] + rng.normal(0, 0.02, 128))
+    return np.stack(queries)
+
+
+def test_ivf_with_all_lists_probed_matches_brute_force():
+    data = _gallery()
+    queries = _queries(data)
+    index = IVFIndex.build(data)
+    index.nprobe = len(index.centroids)
+
+    expected = FaceMatcher(data).match(queries)
+    got = index.match(queries)
+    assert [name for name, _ in got] == [name for name, _ in expected]
+    assert [d for _, d in got] == pytest.approx([d for _, d in expected], abs=1e-5)
+
+
+def test_ivf_default_probe_finds_the_same_people():
+    data = _gallery()
+    queries = _queries(data)
+    expected = [name for name, _ in FaceMatcher(data).match(queries)]
+    got = [name for name, _ in FaceMatcher(data, index=IVFIndex.build(data)).match(queries)]
+    agree = sum(a == b for a, b in zip(got, expected))
+    assert agree >= 0.98 * len(queries)
+
+
+def test_add_and_remove_follow_the_gallery():
+    data = _gallery(people=10)
+    index = IVFIndex.build({name: encs for name, encs in data.items() if name != "person09"})
+    index.add("person09", data["person09"])
+    index.remove("person03")
+    del data["person03"]
+    assert index.counts() == {name: len(encs) for name, encs in data.items()}
+
+    index.nprobe = len(index.centroids)
+    queries = _queries(data, n=50)
+    assert [name for name, _ in index.match(queries)] == [name for name, _ in FaceMatcher(data).match(queries)]
+
+
+def test_load_or_build_index_reuses_and_rebuilds(tmp_path):
+    gallery_path = str(tmp_path / "target_faces.gallery")
+    data = _gallery(people=8)
+    index = load_or_build_index(gallery_path, data)
+    path = index_path_for(gallery_path)
+    saved_at = (tmp_path / "target_faces.ann.npz").stat().st_mtime_ns
+
+    again = load_or_build_index(gallery_path, data)
+    assert (tmp_path / "target_faces.ann.npz").stat().st_mtime_ns == saved_at
+    np.testing.assert_array_equal(again.vectors, index.vectors)
+    np.testing.assert_array_equal(again.centroids, index.centroids)
+
+    # ギャラリー側で人物が増えていたら作り直す
+    data["extra"] = [np.zeros(128)]
+    rebuilt = load_or_build_index(gallery_path, data)
+    assert rebuilt.counts()["extra"] == 1
+    assert IVFIndex.load(path).counts() == rebuilt.counts()
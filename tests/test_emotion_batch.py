@@ -0,0 +1,77 @@
+import math
+
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+scan_videos = pytest.importorskip("scan_videos")
+
+from onnx import TensorProto, helper
+
+
+def _write_model(path, batch_dim):
+    """顔画像の明るさの平均から8感情のスコアを出すだけの小さなモデル (batch_dim: 固定の件数、None なら可変)"""
+    inp = helper.make_tensor_value_info("input", TensorProto.FLOAT, [batch_dim or "N", 1, 64, 64])
+    out = helper.make_tensor_value_info("scores", TensorProto.FLOAT, [batch_dim or "N", 8])
+    weights = helper.make_tensor("w", TensorProto.FLOAT, [1, 8], np.linspace(-0.03, 0.03, 8).tolist())
+    bias = helper.make_tensor("b", TensorProto.FLOAT, [8], np.linspace(1.0, -1.0, 8).tolist())
+    nodes = [
+        helper.make_node("ReduceMean", ["input"], ["mean"], axes=[2, 3], keepdims=0),
+        helper.make_node("Mul", ["mean", "w"], ["scaled"]),
+        helper.make_node("Add", ["scaled", "b"], ["scores"]),
+    ]
+    graph = helper.make_graph(nodes, "emotion", [inp], [out], initializer=[weights, bias])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+
+
+class _CountingSession:
+    def __init__(self, session):
+        self.session = session
+        self.runs = 0
+
+    def run(self, *args, **kwargs):
+        self.runs += 1
+        return self.session.run(*args, **kwargs)
+
+
+def _faces(n=7):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (40 + 3 * i, 36 + 2 * i, 3), dtype=np.uint8) for i in range(n)]
+
+
+@pytest.mark.parametrize("batch_dim, expected_runs", [(None, 3), (1, 7), (4, 2)])
+def test_batched_analysis_equals_per_face(tmp_path, batch_dim, expected_runs):
+    path = tmp_path / "emotion.onnx"
+    _write_model(path, batch_dim)
+    analyzer = scan_videos.EmotionAnalyzer(str(path))
+    assert analyzer.fixed_batch == batch_dim
+    faces = _faces()
+    per_face = [analyzer.analyze(face) for face in faces]
+
+    analyzer.session = _CountingSession(analyzer.session)
+    batched = analyzer.analyze_batch([analyzer.preprocess(face) for face in faces], batch_size=3)
+    assert batched == per_face
+    # 可変なら batch_size 件ずつ、固定ならその件数ずつ推論する
+    assert analyzer.session.runs == expected_runs
+    assert expected_runs == math.ceil(len(faces) / (batch_dim or 3))
+
+
+def test_emotion_stage_fills_detections_like_per_face_analysis(tmp_path):
+    path = tmp_path / "emotion.onnx"
+    _write_model(path, None)
+    analyzer = scan_videos.EmotionAnalyzer(str(path))
+    faces = _faces(5)
+
+    stage = scan_videos.EmotionStage(analyzer, batch_size=2)
+    staged = [{"motion": 1.0, "face_ratio": 5.0} for _ in faces]
+    for d, face in zip(staged, faces):
+        stage.add(d, face, 6.5)
+    stage.flush()
+    stage.wait()
+
+    expected = [scan_videos.apply_scene_analysis({"motion": 1.0, "face_ratio": 5.0},
+                                                 analyzer.analyze(face)["emotion"], 6.5) for face in faces]
+    assert staged == expected
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from encoding_store import EncodingRecorder, load_encoding_store, rematch_store
+from face_matcher import FaceMatcher
+from face_tracker import FaceTracker
+
+RNG = np.random.default_rng(0)
+PEOPLE = {name: RNG.normal(0, 0.09, 128) for name in ("Alice", "Bob", "Carol")}
+STRANGER = RNG.normal(0, 0.09, 128)
+
+
+def _near(base, seed, scale=0.012):
+    return base + np.random.default_rng(seed).normal(0, scale, 128)
+
+
+def _face(who, seed, box, ratio=3.0):
+    enc = _near(STRANGER if who is None else PEOPLE[who], seed)
+    return {"enc": enc, "loc": box, "ratio": ratio}
+
+
+def _frames():
+    """評価したサンプルフレームの列 (顔の位置・エンコーディング・大きさ)"""
+    frames = []
+    for i in range(12):
+        faces = []
+        if i < 6:
+            # 少しずつ動く Alice (追跡で判定を引き継ぐ)
+            faces.append(_face("Alice", i, (100 + i, 200 + i, 200 + i, 100 + i)))
+        if i == 2:
+            faces.append(_face("Bob", 100 + i, (300, 400, 400, 300))) # 1回だけ: 連続検知フィルタで落ちる
+        if 3 <= i < 9:
+            faces.append(_face("Carol", 200 + i, (50, 120, 120, 50)))
+        if i in (4, 5):
+            faces.append(_face("Bob", 300 + i, (500, 520, 520, 500), ratio=0.5)) # 小さすぎる顔
+        if 8 <= i:
+            faces.append(_face(None, 400 + i, (10, 60, 60, 10)))
+        frames.append({"t": i * 0.5 + 1.5, "motion": 0.1 * i, "faces": faces, "segment": i == 7})
+    return frames
+
+
+def _live_scan(frames, matcher, recorder=None, reencode_every=3):
+    """scan_video の判定部分 (追跡・照合・しきい値・連続検知フィルタ・区間の移動) と同じ手順"""
+    tracker = FaceTracker(iou_threshold=0.5, reencode_every=reencode_every, match_threshold=0.42)
+    results = {name: [] for name in matcher.names}
+    last_detections = {}
+    for frame in frames:
+        if frame["segment"]:
+            last_detections.clear()
+            tracker.tracks = []
+            if recorder is not None:
+                recorder.new_segment()
+        locs = [f["loc"] for f in frame["faces"]]
+        assigned = tracker.assign(locs)
+        to_encode = [f["enc"] for f, j in zip(frame["faces"], assigned) if j is None]
+        new_matches = matcher.match(to_encode) if to_encode else []
+        matches = tracker.update(locs, assigned, new_matches)
+        if recorder is not None:
+            recorder.add_frame(frame["t"], frame["motion"], locs, [f["ratio"] for f in frame["faces"]],
+                               assigned, to_encode)
+
+        current = set()
+        for f, (name, dist) in zip(frame["faces"], matches):
+            if not name or dist >= 0.42 or f["ratio"] < 1.2:
+                continue
+            current.add(name)
+            det = {"t": round(frame["t"], 2), "motion": round(frame["motion"], 2), "face_ratio": round(f["ratio"], 2),
+                   "dist": round(float(dist), 4), "face_loc": list(f["loc"]), "timestamp": "PENDING"}
+            if name in last_detections:
+                prev_det, added = last_detections[name]
+                if not added:
+                    results[name].append(prev_det)
+                results[name].append(det)
+                last_detections[name] = (det, True)
+            else:
+                last_detections[name] = (det, False)
+        for name in list(last_detections):
+            if name not in current:
+                del last_detections[name]
+    return results
+
+
+def _assert_same(rematched, live):
+    assert set(rematched) == set(live)
+    for name in live:
+        assert len(rematched[name]) == len(live[name]), name
+        for a, b in zip(rematched[name], live[name]):
+            # エンコーディングは float16 で保存するので、距離だけはわずかに違ってよい
+            assert a["dist"] == pytest.approx(b["dist"], abs=2e-3)
+            assert {k: v for k, v in a.items() if k != "dist"} == {k: v for k, v in b.items() if k != "dist"}
+
+
+def _matcher(names):
+    return FaceMatcher({name: [PEOPLE[name]] for name in names})
+
+
+def test_rematch_agrees_with_live_scan(tmp_path):
+    frames = _frames()
+    matcher = _matcher(["Alice", "Bob"])
+    recorder = EncodingRecorder()
+    live = _live_scan(frames, matcher, recorder)
+    path = str(tmp_path / "enc.npz")
+    recorder.save(path)
+
+    store = load_encoding_store(path)
+    assert len(store["encodings"]) < sum(len(f["faces"]) for f in frames) # 追跡した顔はエンコードしていない
+    assert [d["t"] for d in live["Alice"]] == [1.5, 2.0, 2.5, 3.0, 3.5, 4.0]
+    assert live["Bob"] == []
+    _assert_same(rematch_store(store, matcher), live)
+
+
+def test_rematch_after_adding_a_person_matches_a_fresh_scan(tmp_path):
+    frames = _frames()
+    recorder = EncodingRecorder()
+    _live_scan(frames, _matcher(["Alice", "Bob"]), recorder, reencode_every=1)
+    path = str(tmp_path / "enc.npz")
+    recorder.save(path)
+
+    # Carol を登録した後: 動画を読み直した場合と、保存済みのエンコーディングで照合し直した場合が同じ
+    # (追跡なし (既定) の場合。追跡ありでは、引き継いだ顔の距離が記録時の引き継ぎ方によって変わる)
+    matcher = _matcher(["Alice", "Bob", "Carol"])
+    live = _live_scan(frames, matcher, reencode_every=1)
+    assert live["Carol"] # 区間の移動 (frame 7) で連続検知がリセットされても残る
+    _assert_same(rematch_store(load_encoding_store(path), matcher), live)
+
+
+def test_rematch_keeps_only_the_shard_range(tmp_path):
+    frames = _frames()
+    matcher = _matcher(["Alice", "Carol"])
+    recorder = EncodingRecorder()
+    live = _live_scan(frames, matcher, recorder)
+    path = str(tmp_path / "enc.npz")
+    recorder.save(path, keep_range=(2.75, 4.25))
+
+    rematched = rematch_store(load_encoding_store(path), matcher)
+    expected = {name: [d for d in dets if 2.75 <= d["t"] < 4.25] for name, dets in live.items()}
+    _assert_same(rematched, expected)
+
+
+def test_missing_or_foreign_store(tmp_path):
+    assert load_encoding_store(str(tmp_path / "none.npz")) is None
+    path = tmp_path / "old.npz"
+    np.savez(str(path), version=np.int32(0))
+    assert load_encoding_store(str(path)) is None
@@ -0,0 +1,17 @@
+from face_detector import DETECTOR_OPTION_DEFAULTS, HOGFaceDetector, get_face_detector, load_detector_options
+
+
+def test_detector_options_from_scan_section():
+    options = load_detector_options({"scan": {"face_detector": "onnx", "pipeline_threads": 2}})
+    assert options == dict(DETECTOR_OPTION_DEFAULTS, face_detector="onnx")
+
+
+def test_detector_options_defaults_without_scan_section():
+    assert load_detector_options({}) == DETECTOR_OPTION_DEFAULTS
+    assert load_detector_options({"scan": None}) == DETECTOR_OPTION_DEFAULTS
+
+
+def test_unknown_detector_falls_back_to_hog():
+    detector = get_face_detector({"face_detector": "unknown"})
+    assert isinstance(detector, HOGFaceDetector)
+    assert get_face_detector({"face_detector": "unknown"}) is detector
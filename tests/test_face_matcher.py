@@ -0,0 +1,94 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from ann_index import load_or_build_index
+from face_matcher import FaceMatcher
+from gallery import Gallery, append_encodings, delete_name
+
+
+def _reference_match(target_data, encodings):
+    """以前の実装と同じく、1つずつ face_recognition.face_distance と同じ距離で比較する"""
+    results = []
+    for enc in encodings:
+        best_name, best_dist = None, 1.0
+        for name, enc_list in target_data.items():
+            if not isinstance(enc_list, list):
+                enc_list = [enc_list]
+            for known in enc_list:
+                dist = float(np.linalg.norm(np.asarray(known, dtype=np.float64) - enc))
+                if dist < best_dist:
+                    best_name, best_dist = name, dist
+        results.append((best_name, best_dist))
+    return results
+
+
+def _data(seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "Alice": [rng.normal(0, 0.09, 128) for _ in range(3)],
+        "Bob": rng.normal(0, 0.09, 128), # 旧形式 (単一エンコーディング)
+        "Carol": [rng.normal(0, 0.09, 128) for _ in range(2)],
+    }
+
+
+def _queries(data, seed=1):
+    rng = np.random.default_rng(seed)
+    near = [data["Alice"][1], data["Bob"], data["Carol"][0]]
+    queries = [q + rng.normal(0, 0.02, 128) for q in near]
+    queries.append(rng.normal(0, 0.5, 128)) # 誰とも 1.0 以上離れている
+    return np.stack(queries)
+
+
+def test_batched_match_equals_one_by_one():
+    data = _data()
+    queries = _queries(data)
+    got = FaceMatcher(data).match(queries)
+    expected = _reference_match(data, queries)
+    assert [n for n, _ in got] == ["Alice", "Bob", "Carol", None]
+    assert [n for n, _ in got] == [n for n, _ in expected]
+    assert [d for _, d in got] == pytest.approx([d for _, d in expected], abs=1e-6) # 登録側は float32 で保持
+
+
+def test_empty_inputs():
+    assert FaceMatcher(_data()).match([]) == []
+    assert FaceMatcher({}).match(_queries(_data())[:2]) == [(None, 1.0), (None, 1.0)]
+
+
+def test_from_gallery_skips_deleted_rows_and_pickles_by_path(tmp_path):
+    data = _data()
+    path = str(tmp_path / "target_faces.gallery")
+    for name, encs in data.items():
+        append_encodings(path, name, np.asarray(encs if isinstance(encs, list) else [encs], dtype=np.float32))
+    delete_name(path, "Bob")
+    del data["Bob"]
+
+    matcher = FaceMatcher.from_gallery(Gallery(path))
+    assert len(matcher) == 5
+    queries = _queries(_data())
+    expected = [n for n, _ in _reference_match(data, queries.astype(np.float32).astype(np.float64))]
+    assert [n for n, _ in matcher.match(queries)] == expected
+    assert "Bob" not in expected
+
+    copied = pickle.loads(pickle.dumps(matcher))
+    assert [n for n, _ in copied.match(queries)] == expected
+
+
+def test_pickled_matcher_loads_the_saved_index_once_per_process(tmp_path):
+    data = _data()
+    path = str(tmp_path / "target_faces.gallery")
+    for name, encs in data.items():
+        append_encodings(path, name, np.asarray(encs if isinstance(encs, list) else [encs], dtype=np.float32))
+    g = Gallery(path)
+    matcher = FaceMatcher.from_gallery(g, index=load_or_build_index(path, g))
+
+    # インデックスのベクトルは送らず、保存先のパスだけを送る
+    payload = pickle.dumps(matcher)
+    assert matcher.index.vectors.tobytes() not in payload
+    assert len(payload) < matcher.index.vectors.nbytes
+
+    first, second = pickle.loads(payload), pickle.loads(payload)
+    assert first.index is second.index
+    queries = _queries(data)
+    assert first.match(queries) == matcher.match(queries)
@@ -0,0 +1,78 @@
+import numpy as np
+
+from face_matcher import FaceMatcher
+from face_tracker import FaceTracker, box_iou
+
+RNG = np.random.default_rng(0)
+ALICE = RNG.normal(0, 0.09, 128)
+BOB = RNG.normal(0, 0.09, 128)
+MATCHER = FaceMatcher({"Alice": [ALICE], "Bob": [BOB]})
+
+
+def _frames():
+    """
+    Alice: 同じ位置に映り続ける。
+    Bob: 最初の2サンプルは横顔 (距離がしきい値を超える) で、同じ位置のまま正面を向く。
+    他人: 誰とも一致しない顔が同じ位置に映り続ける。
+    """
+    turned = BOB + np.random.default_rng(1).normal(0, 0.05, 128)
+    stranger = RNG.normal(0, 0.5, 128)
+    frames = []
+    for i in range(10):
+        faces = [((100 + i, 300 + i, 300 + i, 100 + i), ALICE),
+                 ((100, 700, 300, 500), turned if i < 2 else BOB),
+                 ((400, 200, 500, 100), stranger)]
+        frames.append(faces)
+    return frames
+
+
+def _scan(frames, reencode_every):
+    """scan_video の追跡・照合・しきい値・連続検知フィルタと同じ手順で検出を集める"""
+    tracker = FaceTracker(iou_threshold=0.5, reencode_every=reencode_every, match_threshold=0.42)
+    results = {name: [] for name in MATCHER.names}
+    last_detections = {}
+    for t, faces in enumerate(frames):
+        locs = [loc for loc, _ in faces]
+        assigned = tracker.assign(locs)
+        new_matches = MATCHER.match([enc for (_, enc), j in zip(faces, assigned) if j is None])
+        current = set()
+        for loc, (name, dist) in zip(locs, tracker.update(locs, assigned, new_matches)):
+            if not name or dist >= 0.42:
+                continue
+            current.add(name)
+            det = {"t": t, "dist": round(float(dist), 4), "face_loc": list(loc)}
+            if name in last_detections:
+                prev_det, added = last_detections[name]
+                if not added:
+                    results[name].append(prev_det)
+                results[name].append(det)
+                last_detections[name] = (det, True)
+            else:
+                last_detections[name] = (det, False)
+        for name in list(last_detections):
+            if name not in current:
+                del last_detections[name]
+    return results, tracker.counters
+
+
+def test_tracked_scan_gives_the_same_detections_as_untracked():
+    frames = _frames()
+    assert MATCHER.match([frames[0][1][1]])[0][1] >= 0.42 # 横顔は判定されない
+    untracked, plain = _scan(frames, reencode_every=1)
+    tracked, counters = _scan(frames, reencode_every=4)
+    assert plain["reused"] == 0 and counters["reused"] > 0
+    assert [d["t"] for d in untracked["Bob"]] == list(range(2, 10))
+    assert tracked == untracked
+
+
+def test_unidentified_faces_are_not_carried_over():
+    tracker = FaceTracker(iou_threshold=0.5, reencode_every=4, match_threshold=0.42)
+    locs = [(0, 100, 100, 0), (0, 300, 100, 200), (0, 500, 100, 400)]
+    tracker.update(locs, tracker.assign(locs), [("Alice", 0.3), ("Bob", 0.5), (None, 1.0)])
+    assert tracker.assign(locs) == [0, None, None]
+
+
+def test_box_iou():
+    assert box_iou((0, 10, 10, 0), (0, 10, 10, 0)) == 1.0
+    assert box_iou((0, 10, 10, 0), (0, 20, 10, 10)) == 0.0
+    assert box_iou((0, 10, 10, 0), (0, 15, 10, 5)) == 50 / 150
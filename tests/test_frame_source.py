@@ -0,0 +1,158 @@
+import cv2
+import numpy as np
+import pytest
+
+from adaptive_sampler import AdaptiveSampler
+from frame_source import FFmpegPipeFrameSource, PrefetchingFrameSource, SeekFrameSource
+
+pytest.importorskip("imageio_ffmpeg")
+
+FPS = 30
+FRAMES = 240
+BITS = 8
+STRIPE = 16
+
+
+def _write_counter_video(path):
+    """各フレームの番号を白黒の縦縞 (8ビット) で描いた動画を作る"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), FPS, (BITS * STRIPE, 64))
+    for i in range(FRAMES):
+        frame = np.zeros((64, BITS * STRIPE, 3), dtype=np.uint8)
+        for b in range(BITS):
+            if i >> b & 1:
+                frame[:, b * STRIPE:(b + 1) * STRIPE] = 255
+        writer.write(frame)
+    writer.release()
+
+
+def _frame_number(rgb):
+    stripe = rgb.shape[1] // BITS
+    row = rgb[rgb.shape[0] // 2]
+    return sum(1 << b for b in range(BITS) if row[b * stripe + stripe // 2].mean() > 127)
+
+
+@pytest.fixture
+def counter_video(tmp_path):
+    path = tmp_path / "counter.avi"
+    _write_counter_video(path)
+    return str(path)
+
+
+def test_counter_video_matches_opencv(counter_video):
+    cap = cv2.VideoCapture(counter_video)
+    for i in range(FRAMES):
+        ret, frame = cap.read()
+        assert ret
+        assert _frame_number(frame) == i
+    cap.release()
+
+
+def test_ffmpeg_reader_returns_requested_frames(counter_video):
+    source = FFmpegPipeFrameSource(counter_video, check_interval_sec=0.5, resize_scale=0.5)
+    assert source.step == 15
+    try:
+        # 並びに沿った読み込み、並びから外れた位置 (適応サンプリングの間隔)、巻き戻し
+        for index in [45, 60, 75, 97, 112, 130, 160, 100, 115, 229]:
+            sample = source.read_sample(index)
+            assert sample is not None
+            assert _frame_number(sample.rgb_small) == index
+    finally:
+        source.release()
+
+
+def test_ffmpeg_reader_with_sampler_steps(counter_video):
+    source = FFmpegPipeFrameSource(counter_video, check_interval_sec=0.5, resize_scale=0.5)
+    sampler = AdaptiveSampler(source.step, min_step=FPS * 0.4, max_step=FPS * 2.1, enabled=True,
+                              grid=source.frame_grid)
+    assert sampler.min_step % source.step == 0 and sampler.max_step % source.step == 0
+    try:
+        index = 45
+        while index < FRAMES:
+            sample = source.read_sample(index)
+            assert _frame_number(sample.rgb_small) == index
+            index = sampler.next_index(index, False, 0.0)
+        # 最初の起動以外に再起動していない
+        assert source.seek_count == 1
+    finally:
+        source.release()
+
+
+def test_ffmpeg_reader_keeps_previous_sample(counter_video):
+    source = FFmpegPipeFrameSource(counter_video, check_interval_sec=0.5, resize_scale=0.5)
+    try:
+        prev = source.read_sample(30)
+        for index in range(45, 200, 15):
+            sample = source.read_sample(index)
+            # scan_video は直前のサンプルを次の読み込みの後まで使う
+            assert _frame_number(prev.rgb_small) == index - 15
+            assert _frame_number(sample.rgb_small) == index
+            prev = sample
+    finally:
+        source.release()
+
+
+def test_prefetching_source_matches_direct_reads(counter_video):
+    source = PrefetchingFrameSource(FFmpegPipeFrameSource(counter_video, check_interval_sec=0.5, resize_scale=0.5),
+                                    15, 0.5, depth=3, end=FRAMES)
+    try:
+        for index in [30, 45, 60, 90, 120, 105, 135]:
+            sample = source.read_sample(index)
+            assert _frame_number(sample.rgb_small) == index
+    finally:
+        source.release()
+
+
+def _run_sampler(source, faces):
+    """scan_video と同じ順序で sampler を進め、評価したフレーム番号の列を返す"""
+    sampler = AdaptiveSampler(15, min_step=15, max_step=60, enabled=True, grid=15)
+    if isinstance(source, PrefetchingFrameSource):
+        source.planner = sampler.predict_next
+    evaluated = []
+    index = 45
+    while index < FRAMES - 15:
+        sample = source.read_sample(index)
+        assert _frame_number(sample.rgb_small) == index
+        has_faces = faces[0] <= index < faces[1]
+        restart = sampler.backtrack_index(index, has_faces)
+        if restart is not None:
+            index = restart
+            continue
+        evaluated.append(index)
+        index = sampler.next_index(index, has_faces, 0.0)
+    return evaluated
+
+
+def test_prefetching_source_follows_sampler(counter_video):
+    faces = (120, 240)
+    direct = FFmpegPipeFrameSource(counter_video, check_interval_sec=0.5, resize_scale=0.5)
+    try:
+        expected = _run_sampler(direct, faces)
+    finally:
+        direct.release()
+
+    source = PrefetchingFrameSource(FFmpegPipeFrameSource(counter_video, check_interval_sec=0.5, resize_scale=0.5),
+                                    15, 0.5, depth=3, end=FRAMES)
+    try:
+        assert _run_sampler(source, faces) == expected
+        # 間隔を広げるたびにやり直さず、やり直すのは最初と戻り (顔の登場) の時だけ
+        assert source.restarts == 2
+    finally:
+        source.release()
+
+
+def test_ffmpeg_samples_are_analysed_at_full_resolution(counter_video):
+    # 画質スコア・感情・サムネイルは、OpenCV で読んだ場合と同じ元解像度のフレームから計算する
+    source = FFmpegPipeFrameSource(counter_video, check_interval_sec=0.5, resize_scale=0.5)
+    reference = SeekFrameSource(counter_video)
+    try:
+        for index in [15, 30, 97, 60, 200]:
+            sample = source.read_sample(index)
+            frame, scale = sample.analysis_frame()
+            assert scale == 1.0
+            ret, expected = reference.read(index)
+            assert ret
+            np.testing.assert_array_equal(frame, expected)
+            assert sample.gray.shape == sample.rgb_small.shape[:2] # 動きの計算は縮小画像のまま
+    finally:
+        source.release()
+        reference.release()
@@ -0,0 +1,117 @@
+import os
+import pickle
+
+import numpy as np
+
+import gallery
+from gallery import (Gallery, append_encodings, compact_gallery, compact_if_needed, delete_name,
+                     gallery_in_use, is_gallery_in_use, open_gallery)
+
+
+def _enc(seed, n=1):
+    return np.random.default_rng(seed).random((n, 128)).astype(np.float32)
+
+
+def _file_rows(path):
+    return (os.path.getsize(path) - gallery.HEADER_SIZE) // (gallery.ENCODING_DIM * 4)
+
+
+def test_append_and_reopen(tmp_path):
+    path = str(tmp_path / "target_faces.gallery")
+    open_gallery(path, create=True)
+    append_encodings(path, "Alice", _enc(1, 2), source="a.jpg")
+    append_encodings(path, "Bob", _enc(2), source="b.jpg")
+
+    g = open_gallery(path)
+    assert g.names == ["Alice", "Bob"]
+    assert g.counts() == {"Alice": 2, "Bob": 1}
+    assert [source for source, _ in g.entries("Bob")] == ["b.jpg"]
+    np.testing.assert_array_equal(g.to_dict()["Bob"][0], _enc(2)[0].astype(np.float64))
+
+
+def test_delete_sets_tombstone_without_rewriting(tmp_path):
+    path = str(tmp_path / "target_faces.gallery")
+    append_encodings(path, "Alice", _enc(1, 3))
+    append_encodings(path, "Bob", _enc(2, 2))
+
+    assert delete_name(path, "Bob") == 2
+    assert delete_name(path, "Nobody") == 0
+    g = Gallery(path)
+    assert g.names == ["Alice"]
+    assert len(g) == 3 and g.deleted_count == 2
+    assert _file_rows(path) == 5 # 削除済みの割合が COMPACT_RATIO 以下なので詰め直さない
+    vectors, names = g.vectors_and_names()
+    np.testing.assert_array_equal(vectors, _enc(1, 3))
+    assert list(names) == ["Alice"] * 3
+
+
+def test_delete_compacts_when_mostly_deleted(tmp_path):
+    path = str(tmp_path / "target_faces.gallery")
+    append_encodings(path, "Alice", _enc(1))
+    append_encodings(path, "Bob", _enc(2, 3))
+
+    delete_name(path, "Bob")
+    g = Gallery(path)
+    assert _file_rows(path) == 1
+    assert g.deleted_count == 0 and g.names == ["Alice"]
+    np.testing.assert_array_equal(g.vectors_and_names()[0], _enc(1))
+
+
+def test_compaction_waits_while_gallery_is_in_use(tmp_path):
+    path = str(tmp_path / "target_faces.gallery")
+    append_encodings(path, "Alice", _enc(1))
+    append_encodings(path, "Bob", _enc(2, 3))
+
+    with gallery_in_use(path):
+        assert is_gallery_in_use(path)
+        delete_name(path, "Bob")
+        assert _file_rows(path) == 4
+        assert Gallery(path).names == ["Alice"]
+    assert not is_gallery_in_use(path)
+    # 見送った詰め直しは、次の機会 (スキャンの開始時など) に行う
+    assert compact_if_needed(path)
+    assert _file_rows(path) == 1
+
+
+def test_stale_in_use_marker_is_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / "target_faces.gallery")
+    append_encodings(path, "Alice", _enc(1))
+    marker = path + gallery.IN_USE_SUFFIX + "999999-1"
+    open(marker, "w").close()
+    monkeypatch.setattr(gallery, "_pid_alive", lambda pid: pid != 999999)
+    assert not is_gallery_in_use(path)
+    assert not os.path.exists(marker)
+
+
+def test_interrupted_append_is_trimmed(tmp_path):
+    path = str(tmp_path / "target_faces.gallery")
+    append_encodings(path, "Alice", _enc(1))
+    # エンコーディングだけ書かれてメタデータが書かれなかった追記
+    with open(path, "ab") as f:
+        f.write(_enc(9).tobytes())
+    assert len(Gallery(path)) == 1
+    append_encodings(path, "Bob", _enc(2))
+    g = Gallery(path)
+    assert g.counts() == {"Alice": 1, "Bob": 1}
+    np.testing.assert_array_equal(g.to_dict()["Bob"][0], _enc(2)[0].astype(np.float64))
+
+
+def test_migrate_from_pkl(tmp_path):
+    pkl_path = tmp_path / "target_faces.pkl"
+    data = {"Alice": [_enc(1)[0].astype(np.float64), _enc(2)[0].astype(np.float64)], "Bob": _enc(3)[0]}
+    with open(pkl_path, "wb") as f:
+        pickle.dump(data, f)
+
+    g = open_gallery(str(pkl_path))
+    assert g.counts() == {"Alice": 2, "Bob": 1}
+    assert os.path.exists(str(pkl_path) + ".migrated")
+    assert not os.path.exists(pkl_path)
+    np.testing.assert_allclose(g.to_dict()["Alice"][1], data["Alice"][1], rtol=1e-6)
+    assert not list(tmp_path.glob("*.migrating*"))
+
+
+def test_missing_gallery(tmp_path):
+    assert open_gallery(str(tmp_path / "none.gallery")) is None
+    g = open_gallery(str(tmp_path / "none.gallery"), create=True)
+    assert len(g) == 0 and g.names == []
+    compact_gallery(str(tmp_path / "none.gallery"))
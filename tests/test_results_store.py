@@ -0,0 +1,145 @@
+import json
+import os
+
+from results_store import JsonlResultsStore, ResultsStore, merge_results_log, open_results_store, results_db_path_for
+from utils import load_json_safe
+
+
+def _det(t, score=5.0):
+    return {"t": t, "motion": 0.1, "face_ratio": 2.0, "dist": 0.3, "face_loc": [1, 2, 3, 4],
+            "timestamp": "2024-01-02 03:04:05", "visual_score": score}
+
+
+SAMPLE = {
+    "people": {
+        "Alice": {"/v/a.mp4": [_det(1.5), _det(2.0)], "/v/b.mp4": [_det(10.0, 7.5)]},
+        "Bob": {},
+    },
+    "metadata": {
+        "/v/a.mp4": {"month": "2024-01", "date": "2024-01-02 03:04:05", "size": 10, "fingerprint": "f-a"},
+        "/v/b.mp4": {"month": "2024-02", "date": "2024-02-01 00:00:00", "size": 20, "fingerprint": "f-b"},
+    },
+}
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def test_sqlite_migrates_existing_json(tmp_path):
+    json_path = str(tmp_path / "scan_results.json")
+    _write_json(json_path, SAMPLE)
+    _write_json(str(tmp_path / "scan_results_bk.json"), SAMPLE)
+
+    store = open_results_store(json_path, backend="sqlite")
+    assert isinstance(store, ResultsStore)
+    assert store.path == results_db_path_for(json_path)
+    assert store.load() == SAMPLE
+    # 取り込んだファイルは .migrated に改名され、次回は取り込み直さない
+    assert not os.path.exists(json_path)
+    assert os.path.exists(json_path + ".migrated")
+    assert os.path.exists(str(tmp_path / "scan_results_bk.json.migrated"))
+    assert open_results_store(json_path, backend="sqlite").load() == SAMPLE
+
+
+def test_sqlite_load_by_person_and_updates(tmp_path):
+    store = open_results_store(str(tmp_path / "scan_results.json"), backend="sqlite")
+    store.import_results(SAMPLE)
+    rev = store.revision()
+
+    alice = store.load("Alice")
+    assert alice["people"] == {"Alice": SAMPLE["people"]["Alice"]}
+    assert set(alice["metadata"]) == {"/v/a.mp4", "/v/b.mp4"}
+    assert store.load("Bob") == {"people": {"Bob": {}}, "metadata": {}}
+    assert store.months() == ["2024-01", "2024-02"]
+
+    store.record_video("/v/c.mp4", {"month": "2024-03"}, {"Bob": [_det(4.0)], "Alice": []})
+    store.delete_detections("Alice", [("/v/a.mp4", 1.505)])
+    store.relink_video("/v/b.mp4", "/w/b.mp4")
+    assert store.revision() > rev
+
+    data = store.load()
+    assert [d["t"] for d in data["people"]["Alice"]["/v/a.mp4"]] == [2.0]
+    assert "/w/b.mp4" in data["people"]["Alice"] and "/w/b.mp4" in data["metadata"]
+    assert data["people"]["Bob"] == {"/v/c.mp4": [_det(4.0)]}
+
+    store.delete_person("Alice")
+    assert "Alice" not in store.load()["people"]
+
+
+def test_sqlite_export_json_round_trip(tmp_path):
+    store = open_results_store(str(tmp_path / "scan_results.json"), backend="sqlite")
+    store.import_results(SAMPLE)
+    out = str(tmp_path / "export.json")
+    store.export_json(out)
+    with open(out, encoding="utf-8") as f:
+        assert json.load(f) == SAMPLE
+
+
+def test_jsonl_store_appends_and_merges_log(tmp_path):
+    json_path = str(tmp_path / "scan_results.json")
+    _write_json(json_path, SAMPLE)
+    store = open_results_store(json_path, backend="jsonl")
+    assert isinstance(store, JsonlResultsStore)
+
+    store.add_people(["Alice", "Carol"])
+    store.record_video("/v/c.mp4", {"month": "2024-03"}, {"Carol": [_det(4.0)], "Alice": []})
+    store.delete_detections("Alice", [("/v/a.mp4", 1.5)])
+    store.relink_video("/v/b.mp4", "/w/b.mp4")
+
+    # スナップショットは書き換えず、ログに1行ずつ追記している
+    with open(json_path, encoding="utf-8") as f:
+        assert json.load(f) == SAMPLE
+    with open(store.log_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 4
+
+    expected = store.load()
+    assert expected["people"]["Carol"] == {"/v/c.mp4": [_det(4.0)]}
+    assert [d["t"] for d in expected["people"]["Alice"]["/v/a.mp4"]] == [2.0]
+    assert "/w/b.mp4" in expected["metadata"] and "/v/b.mp4" not in expected["metadata"]
+    # 他のツールは load_json_safe でスナップショット + ログを読む
+    assert load_json_safe(json_path, dict) == expected
+
+    # 同じログを2回反映しても結果は変わらない (まとめる途中で中断した場合)
+    with open(json_path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert merge_results_log(merge_results_log(data, store.log_path), store.log_path) == expected
+
+    store.compact()
+    assert os.path.getsize(store.log_path) == 0
+    assert store.load() == expected
+    assert JsonlResultsStore(json_path).load() == expected
+
+
+def test_jsonl_ignores_and_repairs_partial_last_line(tmp_path):
+    json_path = str(tmp_path / "scan_results.json")
+    store = JsonlResultsStore(json_path)
+    store.record_video("/v/a.mp4", {"month": "2024-01"}, {"Alice": [_det(1.0)]})
+    with open(store.log_path, "a", encoding="utf-8") as f:
+        f.write('{"op": "delete_person", "na')
+
+    assert merge_results_log({}, store.log_path)["people"] == {"Alice": {"/v/a.mp4": [_det(1.0)]}}
+    # 開き直すと書きかけの行を切り落とし、続けて追記できる
+    store = JsonlResultsStore(json_path)
+    store.delete_person("Alice")
+    assert store.load()["people"] == {}
+
+
+def test_jsonl_exports_existing_database(tmp_path):
+    json_path = str(tmp_path / "scan_results.json")
+    db_store = open_results_store(json_path, backend="sqlite")
+    db_store.import_results(SAMPLE)
+
+    store = open_results_store(json_path, backend="jsonl")
+    assert store.load() == SAMPLE
+    assert os.path.exists(json_path)
+
+
+def test_relink_onto_a_path_with_results_keeps_both(tmp_path):
+    for backend in ("sqlite", "jsonl"):
+        os.makedirs(str(tmp_path / backend))
+        store = open_results_store(str(tmp_path / backend / "scan_results.json"), backend=backend)
+        store.import_results(SAMPLE)
+        store.relink_video("/v/a.mp4", "/v/b.mp4")
+        assert store.load() == SAMPLE, backend
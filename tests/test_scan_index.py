@@ -0,0 +1,55 @@
+import os
+import shutil
+
+from scan_index import find_videos, plan_incremental_scan
+
+
+def _video(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def _scanned(videos):
+    """plan_incremental_scan の結果を、全部スキャン済みとして記録した results"""
+    results = {"people": {"Alice": {}}, "metadata": {}}
+    to_scan, infos, _, _ = plan_incremental_scan(results, videos)
+    for path in to_scan:
+        results["metadata"][path] = dict(infos[path])
+        results["people"]["Alice"][path] = [{"t": 1.0}]
+    return results
+
+
+def test_moved_video_is_relinked(tmp_path):
+    a = _video(str(tmp_path / "A" / "clip.mp4"), b"x" * 1000)
+    results = _scanned(find_videos(str(tmp_path / "A")))
+
+    b = str(tmp_path / "B" / "renamed.mp4")
+    os.makedirs(os.path.dirname(b))
+    shutil.move(a, b)
+    to_scan, _, relinked, _ = plan_incremental_scan(results, find_videos(str(tmp_path / "B")))
+    assert to_scan == [] and relinked == [(a, b)]
+    assert list(results["metadata"]) == [b] and list(results["people"]["Alice"]) == [b]
+
+
+def test_copy_in_another_folder_is_not_taken_over(tmp_path):
+    a = _video(str(tmp_path / "A" / "clip.mp4"), b"x" * 1000)
+    results = _scanned(find_videos(str(tmp_path / "A")))
+
+    # A を残したまま、同じ内容のコピーがある B をスキャンする
+    b = str(tmp_path / "B" / "clip.mp4")
+    os.makedirs(os.path.dirname(b))
+    shutil.copy2(a, b)
+    to_scan, _, relinked, _ = plan_incremental_scan(results, find_videos(str(tmp_path / "B")))
+    assert relinked == [] and to_scan == [b]
+    assert a in results["metadata"] and a in results["people"]["Alice"]
+
+
+def test_changed_video_is_rescanned(tmp_path):
+    a = _video(str(tmp_path / "A" / "clip.mp4"), b"x" * 1000)
+    results = _scanned(find_videos(str(tmp_path / "A")))
+    assert plan_incremental_scan(results, find_videos(str(tmp_path / "A")))[0] == []
+
+    _video(a, b"y" * 2000)
+    assert plan_incremental_scan(results, find_videos(str(tmp_path / "A")))[0] == [a]
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+import scan_journal
+from scan_journal import ScanJournal, journal_path_for, remove_journal
+
+SETTINGS = {"interval": 0.5, "resize_scale": 0.5, "ranges": None}
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"\0" * 1024)
+    return str(path)
+
+
+def _det(t):
+    return {"t": t, "dist": 0.3}
+
+
+def test_resume_from_last_chunk(tmp_path, video):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ScanJournal(path, video, SETTINGS)
+    assert journal.load() is None
+    journal.append_chunk(1800, {"Alice": [_det(10.0), _det(10.5)]}, {"Alice": (_det(10.5), True)})
+    journal.append_chunk(3600, {"Alice": [_det(70.0)], "Bob": [_det(80.0)]}, {"Bob": (_det(119.5), False)})
+
+    resume_index, detections, pending = ScanJournal(path, video, SETTINGS).load()
+    assert resume_index == 3600
+    assert detections == {"Alice": [_det(10.0), _det(10.5), _det(70.0)], "Bob": [_det(80.0)]}
+    # 連続検知フィルタの状態は最後のチャンクのもの
+    assert pending == {"Bob": (_det(119.5), False)}
+
+
+def test_resumed_journal_keeps_appending(tmp_path, video):
+    path = str(tmp_path / "journal.jsonl")
+    ScanJournal(path, video, SETTINGS).append_chunk(1800, {"Alice": [_det(1.0)]}, {})
+    resumed = ScanJournal(path, video, SETTINGS)
+    assert resumed.load()[0] == 1800
+    resumed.append_chunk(3600, {"Alice": [_det(2.0)]}, {})
+    resume_index, detections, _ = ScanJournal(path, video, SETTINGS).load()
+    assert resume_index == 3600
+    assert detections == {"Alice": [_det(1.0), _det(2.0)]}
+
+
+def test_partial_last_chunk_is_dropped(tmp_path, video):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ScanJournal(path, video, SETTINGS)
+    journal.append_chunk(1800, {"Alice": [_det(1.0)]}, {})
+    size = os.path.getsize(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"end": 3600, "detections": {"Alice": [')
+
+    resumed = ScanJournal(path, video, SETTINGS)
+    assert resumed.load()[0] == 1800
+    assert os.path.getsize(path) == size
+    resumed.append_chunk(3600, {}, {})
+    assert ScanJournal(path, video, SETTINGS).load()[0] == 3600
+
+
+@pytest.mark.parametrize("change", ["settings", "video"])
+def test_journal_for_other_conditions_is_discarded(tmp_path, video, change):
+    path = str(tmp_path / "journal.jsonl")
+    ScanJournal(path, video, SETTINGS).append_chunk(1800, {"Alice": [_det(1.0)]}, {})
+    settings = SETTINGS
+    if change == "settings":
+        settings = dict(SETTINGS, interval=1.0)
+    else:
+        with open(video, "ab") as f:
+            f.write(b"\0")
+    assert ScanJournal(path, video, settings).load() is None
+    assert not os.path.exists(path)
+
+
+def test_remove_journal_removes_shard_parts(tmp_path, video, monkeypatch):
+    monkeypatch.setattr(scan_journal, "journal_dir", lambda: str(tmp_path / "journals"))
+    paths = [journal_path_for(video), journal_path_for(video, 0), journal_path_for(video, 1)]
+    other = journal_path_for(str(tmp_path / "other.mp4"))
+    for p in paths + [other]:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        open(p, "w").close()
+
+    remove_journal(video)
+    assert not any(os.path.exists(p) for p in paths)
+    assert os.path.exists(other)
@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+
+from video_shards import plan_video_shards, split_shards
+
+
+def _sample_times(fps, total_frames, interval=0.5):
+    """scan_video の固定間隔のサンプル時刻 (det["t"] と同じ丸め)"""
+    step = max(1, int(fps * interval))
+    return [(i / fps, round(i / fps, 2)) for i in range(int(fps * 1.5), total_frames - int(fps * 1.5), step)]
+
+
+def test_short_video_is_not_split():
+    assert split_shards(30.0, 30 * 400, 300) == [None]
+    assert split_shards(30.0, 30 * 4000, 0) == [None]
+
+
+def test_every_sample_is_kept_by_exactly_one_shard():
+    for fps, seconds in [(30.0, 1000), (29.97, 1234), (25.0, 901), (59.94, 777)]:
+        total_frames = int(fps * seconds)
+        shards = split_shards(fps, total_frames, 300)
+        assert len(shards) > 1
+        for exact, t in _sample_times(fps, total_frames):
+            owners = [i for i, (_, (ks, ke)) in enumerate(shards) if ks <= t < ke]
+            assert len(owners) == 1, (fps, t, owners)
+            scan_start, scan_end = shards[owners[0]][0]
+            assert scan_start <= exact < scan_end
+
+
+def test_shards_scan_one_extra_sample_across_boundaries():
+    fps, total_frames = 30.0, 30 * 1000
+    step = 15
+    shards = split_shards(fps, total_frames, 300)
+    for (scan_a, keep_a), (scan_b, keep_b) in zip(shards, shards[1:]):
+        assert keep_a[1] == keep_b[0]
+        # 境界の前後1サンプルは両方のシャードでスキャンする (連続検知フィルタが同じ判定になるように)
+        assert scan_a[1] >= keep_a[1] + step / 2 / fps
+        assert scan_b[0] <= keep_b[0] - step / 2 / fps
+    assert shards[0][1][0] == float("-inf")
+    assert shards[-1][1][1] == float("inf")
+
+
+def test_plan_video_shards_reads_video_length(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (32, 32))
+    for _ in range(200):
+        writer.write(np.zeros((32, 32, 3), dtype=np.uint8))
+    writer.release()
+
+    duration, shards = plan_video_shards(path, {"shard_seconds": 5})
+    assert duration == 20.0
+    assert len(shards) == 4
+    assert plan_video_shards(path, {"shard_seconds": 300}) == (20.0, [None])
+    assert plan_video_shards(str(tmp_path / "missing.avi"), {}) == (0.0, [None])
@@ -0,0 +1,59 @@
+import os
+
+from worker_scaler import ScalingProcessPool
+
+
+class FixedScaler:
+    def __init__(self, target):
+        self.target = target
+
+
+def _pid(_):
+    return os.getpid()
+
+
+def test_pool_starts_only_target_workers():
+    scaler = FixedScaler(2)
+    with ScalingProcessPool(scaler) as workers:
+        assert workers.capacity == 2
+        futures = [workers.submit(_pid, i) for i in range(2)]
+        pids = {f.result() for f in futures}
+        for f in futures:
+            workers.release(f)
+        assert len(pids) <= 2
+
+
+def test_pool_grows_and_retires_idle_pools():
+    scaler = FixedScaler(1)
+    with ScalingProcessPool(scaler) as workers:
+        first = workers.submit(_pid, 0)
+        scaler.target = 3
+        workers.resize()
+        assert workers.capacity == 3
+        more = [workers.submit(_pid, i) for i in range(2)]
+        for f in [first] + more:
+            f.result()
+            workers.release(f)
+
+        scaler.target = 1
+        workers.resize()
+        assert workers.capacity == 1
+        assert workers.peak_workers == 3
+        f = workers.submit(_pid, 0)
+        f.result()
+        workers.release(f)
+
+
+def test_pool_keeps_busy_workers_when_shrinking():
+    scaler = FixedScaler(2)
+    with ScalingProcessPool(scaler) as workers:
+        busy = workers.submit(_pid, 0)
+        scaler.target = 1
+        workers.resize()
+        # 手の空いたプロセスだけを閉じ、実行中のものは終わるまで残す
+        assert workers.capacity == 1
+        assert not busy.cancelled()
+        busy.result()
+        workers.release(busy)
+        workers.resize()
+        assert workers.capacity == 1
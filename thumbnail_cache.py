@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+MB = 1024 * 1024
+
+# GUI のサムネイル画像キャッシュの既定の上限
+DEFAULT_CACHE_BYTES = 64 * MB
+
+
+class ThumbnailImageCache:
+    """
+    デコード済みのサムネイル画像を (path, t, size) をキーに保持する LRU キャッシュ。
+    登録時に渡した見積もりバイト数の合計が max_bytes を超えたら、古く使われたものから捨てる。
+    GUI のスレッドと読み込み用のスレッドから同時に使える。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict() # key -> (image, nbytes)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, image, nbytes):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if nbytes > self.max_bytes:
+                return
+            self._items[key] = (image, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                _, (_, freed) = self._items.popitem(last=False)
+                self.bytes -= freed
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
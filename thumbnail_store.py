@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import contextlib
+
+# 1回の SELECT で問い合わせるキーの数 (SQLite の変数の上限より十分小さく)
+QUERY_CHUNK = 500
+
+# 以前の保存形式 (1検出 = 1ファイル) のフォルダ。見つかったものはデータベースへ取り込んで削除する
+LEGACY_DIR = "thumbnails"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnails (
+    key TEXT PRIMARY KEY,
+    video TEXT,
+    t REAL,
+    jpeg BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_thumbnails_video ON thumbnails(video);
+"""
+
+
+def thumbnail_key(video_path, timestamp):
+    """以前のファイル名 (thumb_<key>.jpg) と同じキー"""
+    return hashlib.md5(f"{video_path}_{timestamp}".encode()).hexdigest()
+
+
+class ThumbnailStore:
+    """
+    顔のサムネイル (JPEG) を output_dir/thumbnails.db の1つのテーブルにまとめて保存する。
+    小さなファイルを大量に作らずに済み、GUI の1ページ分 (最大200件) を1回の読み込みで取得できる。
+    操作ごとに接続を開くので、スキャン中のスレッドや別プロセスから同時に書き込める。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, "thumbnails.db")
+        os.makedirs(output_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn: # 正常終了ならコミット、例外ならロールバック
+                yield conn
+        finally:
+            conn.close()
+
+    def has(self, video_path, timestamp):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM thumbnails WHERE key = ?",
+                                (thumbnail_key(video_path, timestamp),)).fetchone() is not None
+
+    def get(self, video_path, timestamp):
+        return self.get_many([(video_path, timestamp)]).get((video_path, timestamp))
+
+    def get_many(self, items):
+        """
+        [(video_path, timestamp), ...] のサムネイルをまとめて読み込み、{(video_path, timestamp): JPEG のバイト列} を返す。
+        まだ無いものは含まれない。
+        """
+        keys = {}
+        for item in items:
+            keys.setdefault(thumbnail_key(*item), []).append(item)
+        found = {}
+        key_list = list(keys)
+        with self._connect() as conn:
+            for i in range(0, len(key_list), QUERY_CHUNK):
+                chunk = key_list[i:i + QUERY_CHUNK]
+                rows = conn.execute(f"SELECT key, jpeg FROM thumbnails WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                for key, jpeg in rows:
+                    for item in keys[key]:
+                        found[item] = bytes(jpeg)
+
+        missing = [key for key in keys if keys[key][0] not in found]
+        if missing:
+            for key, jpeg in self._import_legacy(missing, keys).items():
+                for item in keys[key]:
+                    found[item] = jpeg
+        return found
+
+    def missing(self, items):
+        """[(video_path, timestamp), ...] のうち、サムネイルがまだ無いもの"""
+        found = self.get_many(items)
+        return [item for item in items if item not in found]
+
+    def put(self, video_path, timestamp, jpeg):
+        self.put_many([(video_path, timestamp, jpeg)])
+
+    def put_many(self, rows):
+        """[(video_path, timestamp, JPEG のバイト列), ...] を1回のトランザクションで書き込む"""
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO thumbnails(key, video, t, jpeg) VALUES (?, ?, ?, ?)",
+                             [(thumbnail_key(v, t), v, float(t), sqlite3.Binary(jpeg)) for v, t, jpeg in rows])
+
+    def _import_legacy(self, keys, items_by_key):
+        """以前の形式のファイル (thumbnails/thumb_<key>.jpg) があれば取り込み、ファイルは削除する"""
+        legacy_dir = os.path.join(self.output_dir, LEGACY_DIR)
+        if not os.path.isdir(legacy_dir):
+            return {}
+        imported = {}
+        for key in keys:
+            path = os.path.join(legacy_dir, f"thumb_{key}.jpg")
+            try:
+                with open(path, "rb") as f:
+                    imported[key] = f.read()
+            except OSError:
+                continue
+        if imported:
+            self.put_many([(*items_by_key[key][0], jpeg) for key, jpeg in imported.items()])
+            for key in imported:
+                try:
+                    os.remove(os.path.join(legacy_dir, f"thumb_{key}.jpg"))
+                except OSError:
+                    pass
+        return imported
+
+
+_stores = {}
+_stores_guard = threading.Lock()
+
+
+def open_thumbnail_store(output_dir):
+    """output_dir ごとに1つの ThumbnailStore を使い回す (テーブルの作成を毎回行わないため)"""
+    output_dir = os.path.abspath(output_dir)
+    with _stores_guard:
+        store = _stores.get(output_dir)
+        if store is None:
+            store = _stores[output_dir] = ThumbnailStore(output_dir)
+        return store
@@ -0,0 +1,142 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from thumbnail_store import open_thumbnail_store
+from utils import crop_face_thumbnail
+
+# 同時に処理する動画の数の上限 (デコードは OpenCV 内で GIL を解放するのでスレッドで並列になる)
+MAX_WARMUP_WORKERS = 4
+
+# 次の時刻までこの秒数以内なら、シークせずに読み進める (シークはキーフレームからのデコードになるため)
+FORWARD_READ_LIMIT_SEC = 2.0
+
+# この件数ごとにまとめてデータベースに書き込む
+WRITE_BATCH = 50
+
+
+def plan_thumbnail_warmup(results, store):
+    """
+    スキャン結果のうち、サムネイルがまだ無い検出を動画ごとにまとめる。
+    {video_path: [(t, face_loc), ...] (時刻順)} を返す。
+    """
+    clips = {}
+    for videos in results.get("people", {}).values():
+        for v_path, dets in videos.items():
+            for det in dets:
+                loc = det.get("face_loc")
+                if loc and len(loc) >= 4:
+                    clips.setdefault((v_path, det["t"]), loc)
+
+    plan = {}
+    for v_path, t in store.missing(list(clips)):
+        plan.setdefault(v_path, []).append((t, clips[(v_path, t)]))
+    for items in plan.values():
+        items.sort(key=lambda item: item[0])
+    return plan
+
+
+def render_video_thumbnails(video_path, clips, store, cancel_event=None):
+    """
+    1本の動画を先頭から1回だけ読み進めて、clips [(t, face_loc), ...] (時刻順) のサムネイルを作る。
+    離れた時刻へはシークする。作成した件数を返す。
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return 0
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    forward_limit = int(fps * FORWARD_READ_LIMIT_SEC)
+
+    made = 0
+    pending = []
+    next_index = 0 # 次に read() したときに得られるフレーム番号
+    frame = None
+    frame_index = -1
+    try:
+        for t, face_loc in clips:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            # scan_video は frame_index / fps を時刻にしている
+            target = int(round(float(t) * fps))
+            if target != frame_index:
+                if target < next_index or target - next_index > forward_limit:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                else:
+                    while next_index < target and cap.grab():
+                        next_index += 1
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_index = target
+                next_index = target + 1
+
+            jpeg = crop_face_thumbnail(frame, face_loc)
+            if jpeg is not None:
+                pending.append((video_path, t, jpeg))
+            if len(pending) >= WRITE_BATCH:
+                store.put_many(pending)
+                made += len(pending)
+                pending = []
+    finally:
+        cap.release()
+        if pending:
+            store.put_many(pending)
+            made += len(pending)
+    return made
+
+
+class ThumbnailWarmup:
+    """
+    スキャン結果のサムネイルのうち、まだ無いものをバックグラウンドで作る。
+    動画ごとにまとめて1回の読み進めで作り、動画単位で最大 max_workers 本を並列に処理する。
+    保存先はスキャン時と同じ output_dir (プロファイルフォルダ) の thumbnails.db。
+    progress(done, total) は動画が1本終わるたびにワーカースレッドから呼ばれる (件数はサムネイル単位)。
+    """
+
+    def __init__(self, output_dir, max_workers=None, progress=None):
+        self.output_dir = output_dir
+        if not max_workers:
+            max_workers = min(MAX_WARMUP_WORKERS, max(1, (os.cpu_count() or 2) // 2))
+        self.max_workers = max_workers
+        self.progress = progress
+        self.cancel_event = threading.Event()
+        self.made = 0
+        self.done = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """処理中の動画は次のサムネイルの手前で止まり、未着手の動画は処理しない"""
+        self.cancel_event.set()
+
+    def run(self, results):
+        """results (scan_results と同じ形) の未作成のサムネイルを作り、作成した件数を返す (終わるまで戻らない)"""
+        store = open_thumbnail_store(self.output_dir)
+        plan = plan_thumbnail_warmup(results, store)
+        self.total = sum(len(clips) for clips in plan.values())
+        if not plan:
+            return 0
+
+        def task(v_path, clips):
+            if self.cancel_event.is_set():
+                return
+            try:
+                made = render_video_thumbnails(v_path, clips, store, self.cancel_event)
+            except Exception as e:
+                print(f"Warm-up Error ({os.path.basename(v_path)}): {e}")
+                made = 0
+            with self._lock:
+                self.made += made
+                self.done += len(clips)
+                done = self.done
+            if self.progress:
+                self.progress(done, self.total)
+
+        # 検出の多い動画から始める (最後に長い動画が1本だけ残るのを避ける)
+        ordered = sorted(plan.items(), key=lambda item: len(item[1]), reverse=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for v_path, clips in ordered:
+                pool.submit(task, v_path, clips)
+        return self.made
@@ -2,7 +2,6 @@ import sys
 import os
 import json
 import logging
-import hashlib
 import cv2
 import numpy as np
 from datetime import datetime
@@ -102,6 +101,19 @@ def get_app_dir():
         # Normal script
         return os.path.dirname(os.path.abspath(__file__))
 
+def find_model_path(filename):
+    """assets/models 内のモデルファイルのパスを探す。見つからない場合は先頭の候補を返す"""
+    candidates = [os.path.join(get_app_dir(), "assets", "models", filename)]
+    if getattr(sys, 'frozen', False):
+        candidates.append(os.path.join(os.path.dirname(sys.executable), "assets", "models", filename))
+    # 開発環境 / PyInstaller の展開先
+    candidates.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "models", filename))
+    candidates.append(resource_path(os.path.join("assets", "models", filename)))
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return candidates[0]
+
 def get_user_data_dir():
     """Returns a writable user data directory (Documents/Omokage)"""
     app_name = "Omokage"
@@ -130,7 +142,20 @@ def save_json_atomic(file_path, data):
         raise e
 
 def load_json_safe(file_path, default_factory):
-    """ Load JSON file with backup recovery. Returns default if both fail. """
+    """
+    Load JSON file with backup recovery. Returns default if both fail.
+    スキャン結果の追記ログ (scan_results.log.jsonl) がある場合は、読み込んだ内容にログを反映して返す。
+    """
+    data = _load_json_with_backup(file_path, default_factory)
+    log_path = os.path.splitext(file_path)[0] + ".log.jsonl"
+    if os.path.exists(log_path):
+        from results_store import merge_results_log
+        if not isinstance(data, dict):
+            data = {"people": {}, "metadata": {}}
+        merge_results_log(data, log_path)
+    return data
+
+def _load_json_with_backup(file_path, default_factory):
     bk_path = file_path.replace(".json", "_bk.json")
     
     # 1. Try primary file
@@ -155,51 +180,64 @@ def load_json_safe(file_path, default_factory):
         return default_factory()
     return default_factory
 
-def generate_face_thumbnail(video_path, timestamp, face_loc, output_dir):
+def generate_face_thumbnail(video_path, timestamp, face_loc, output_dir, frame=None, frame_scale=1.0):
     """
     指定された動画のタイムスタンプ＋座標から、お顔のサムネイルを取得/生成する (共通化用)
     face_loc: [top, right, bottom, left]
+    frame: スキャン中でフレームが手元にある場合はその BGR 画像 (動画を開き直さずに切り出す)。
+           frame_scale は frame の元解像度に対する倍率 (ffmpeg 読み込み時は縮小済みのため)
+    サムネイルは output_dir/thumbnails.db (thumbnail_store) に保存し、JPEG のバイト列を返す。
     """
     if not face_loc or len(face_loc) < 4:
         return None
         
-    thumb_dir = os.path.join(output_dir, "thumbnails")
-    os.makedirs(thumb_dir, exist_ok=True)
-    
-    # ハッシュでファイル名を一意にする
-    h = hashlib.md5(f"{video_path}_{timestamp}".encode()).hexdigest()
-    thumb_path = os.path.join(thumb_dir, f"thumb_{h}.jpg")
-    
-    if os.path.exists(thumb_path):
-        return thumb_path
+    from thumbnail_store import open_thumbnail_store
+    store = open_thumbnail_store(output_dir)
+    existing = store.get(video_path, timestamp)
+    if existing:
+        return existing
         
     try:
-        cap = cv2.VideoCapture(video_path)
-        cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
-        ret, frame = cap.read()
-        cap.release()
-        
-        if not ret: return None
-        
-        # クロップ
-        h_orig, w_orig = frame.shape[:2]
-        t, r, b, l = face_loc
-        
-        # 少しマージンを持たせる (30%)
-        pad_h = int((b - t) * 0.3)
-        pad_w = int((r - l) * 0.3)
-        
-        t = max(0, t - pad_h)
-        b = min(h_orig, b + pad_h)
-        l = max(0, l - pad_w)
-        r = min(w_orig, r + pad_w)
-        
-        face_img = frame[t:b, l:r]
-        if face_img.size == 0: return None
+        if frame is None:
+            # 以前のスキャン結果など、フレームが手元に無い場合は動画を開いて読み直す
+            cap = cv2.VideoCapture(video_path)
+            cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+            ret, frame = cap.read()
+            cap.release()
+            
+            if not ret: return None
+            frame_scale = 1.0
         
-        # 保存前にリサイズ (80px四方程度で十分)
-        face_img = cv2.resize(face_img, (80, 80))
-        cv2.imwrite(thumb_path, face_img)
-        return thumb_path
+        jpeg = crop_face_thumbnail(frame, face_loc, frame_scale)
+        if jpeg is None: return None
+        store.put(video_path, timestamp, jpeg)
+        return jpeg
     except:
         return None
+
+def crop_face_thumbnail(frame, face_loc, frame_scale=1.0):
+    """BGR フレームから顔の周りを切り出し、80x80 の JPEG のバイト列にする (切り出せない場合は None)"""
+    if frame_scale != 1.0:
+        face_loc = [int(v * frame_scale) for v in face_loc]
+    
+    # クロップ
+    h_orig, w_orig = frame.shape[:2]
+    t, r, b, l = face_loc
+    
+    # 少しマージンを持たせる (30%)
+    pad_h = int((b - t) * 0.3)
+    pad_w = int((r - l) * 0.3)
+    
+    t = max(0, t - pad_h)
+    b = min(h_orig, b + pad_h)
+    l = max(0, l - pad_w)
+    r = min(w_orig, r + pad_w)
+    
+    face_img = frame[t:b, l:r]
+    if face_img.size == 0: return None
+    
+    # 保存前にリサイズ (80px四方程度で十分)
+    face_img = cv2.resize(face_img, (80, 80))
+    ok, jpeg = cv2.imencode(".jpg", face_img)
+    if not ok: return None
+    return jpeg.tobytes()
@@ -0,0 +1,43 @@
+import cv2
+
+
+def plan_video_shards(video_path, options, check_interval_sec=0.5):
+    """
+    長い動画を時間区間 (シャード) に分割し、(動画の長さ, [(scan_range, keep_range), ...]) を返す。
+    分割しない場合のシャードは [None]。
+    動画を開いて長さを調べるので、スキャン用プロセスの中で呼ぶ (起動時に全動画を順に開かないように)。
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if fps <= 0 or total_frames <= 0:
+        return 0.0, [None]
+    return total_frames / fps, split_shards(fps, total_frames, float(options.get("shard_seconds", 300)), check_interval_sec)
+
+
+def split_shards(fps, total_frames, shard_sec, check_interval_sec=0.5):
+    """
+    fps / フレーム数の動画を shard_sec 秒ごとのシャード [(scan_range, keep_range), ...] に分ける
+    (分割しない場合は [None])。
+    各シャードは前後に1サンプルずつ余分にスキャンし (連続検知フィルタが境界をまたいでも同じ判定になるように)、
+    結果は keep_range (秒) に入る検出だけを残す。区間の境界は固定間隔のサンプル位置に揃える。
+    """
+    duration = total_frames / fps
+    if shard_sec <= 0 or duration < shard_sec * 1.5:
+        return [None]
+
+    step = max(1, int(fps * check_interval_sec))
+    start_margin = int(fps * 1.5)
+    end_limit = total_frames - int(fps * 1.5)
+    shard_frames = max(1, int(fps * shard_sec) // step) * step
+
+    shards = []
+    for s in range(start_margin, end_limit, shard_frames):
+        e = min(s + shard_frames, end_limit)
+        scan_range = (max(start_margin, s - step) / fps, min(end_limit, e + step) / fps)
+        # サンプル時刻の丸め誤差を避けるため、境界は半サンプル手前に置く
+        keep_start = (s - step / 2) / fps if s > start_margin else float("-inf")
+        keep_end = (e - step / 2) / fps if e < end_limit else float("inf")
+        shards.append((scan_range, (keep_start, keep_end)))
+    return shards
@@ -0,0 +1,142 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+
+# 実測値が無い間の、スキャン用プロセス1つあたりのメモリの見積もり
+DEFAULT_WORKER_BYTES = 1500 * MB
+# 見積もりに上乗せする余裕 (RSS は動画の解像度や顔の数で増減するため)
+RSS_SAFETY = 1.25
+
+
+class WorkerScaler:
+    """
+    スキャン用プロセスの同時実行数を、実測したプロセスごとのメモリ (RSS) と空きメモリから決める。
+    プロセスは ScalingProcessPool が target に合わせて用意し、同時に投入するタスク数も target までにする。
+    psutil が無い場合は従来通り min(CPU数/2, 4) の固定値。
+    """
+
+    def __init__(self, max_workers=0, reserve_mb=1024, exclude_pids=()):
+        cpu = multiprocessing.cpu_count()
+        self.max_workers = int(max_workers) if max_workers else max(1, cpu - 1)
+        self.reserve = int(reserve_mb) * MB
+        self.exclude_pids = set(exclude_pids) # Manager など、スキャン用ではない子プロセス
+        self.peak_rss = 0
+        self.peak_target = 0
+
+        if psutil is None:
+            self.max_workers = min(self.max_workers, max(1, cpu // 2), 4)
+            self.target = self.max_workers
+        else:
+            self.target = self._fit(0, DEFAULT_WORKER_BYTES)
+        self.peak_target = self.target
+
+    def _fit(self, running, per_worker):
+        """空きメモリに収まる同時実行数 (最低1)"""
+        available = psutil.virtual_memory().available - self.reserve
+        return max(1, min(self.max_workers, running + int(max(0, available) // max(per_worker, 1))))
+
+    def worker_rss(self):
+        """現在のスキャン用プロセスごとの RSS (バイト) のリスト"""
+        if psutil is None:
+            return []
+        rss = []
+        for child in psutil.Process(os.getpid()).children():
+            if child.pid in self.exclude_pids:
+                continue
+            try:
+                rss.append(child.memory_info().rss)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return rss
+
+    def update(self, running):
+        """
+        実行中のタスク数 running を元に、次に目指す同時実行数を決め直す (タスクの完了時・定期的に呼ぶ)。
+        空きメモリはすでに動いているプロセスの使用分を差し引いた値なので、追加できる分だけ増やす。
+        """
+        if psutil is None:
+            return self.target
+        rss = self.worker_rss()
+        if rss:
+            self.peak_rss = max(self.peak_rss, max(rss))
+        per_worker = int(self.peak_rss * RSS_SAFETY) if self.peak_rss else DEFAULT_WORKER_BYTES
+
+        if psutil.virtual_memory().available < self.reserve:
+            # 空きが予備分を割り込んだら、完了したタスクの分を補充せずに減らしていく
+            self.target = max(1, min(self.target, running) - 1)
+        else:
+            self.target = self._fit(running, per_worker)
+        self.peak_target = max(self.peak_target, self.target)
+        return self.target
+
+    def summary(self):
+        text = f"同時実行数 最大 {self.peak_target} (上限 {self.max_workers})"
+        if self.peak_rss:
+            text += f", プロセスあたりのピークメモリ {self.peak_rss / MB:.0f} MB"
+        return text
+
+
+class ScalingProcessPool:
+    """
+    WorkerScaler の同時実行数 (target) に合わせてスキャン用プロセスを用意する。
+    ProcessPoolExecutor は後から大きさを変えられないため、1プロセスずつのプールを target の数だけ作り、
+    target が増えたら追加し、減ったら手の空いたものから閉じる (プロセスごとにモデルを読み込むので、使わないプロセスは残さない)。
+    submit() したタスクが終わったら、結果を受け取った後に release() を呼ぶ。
+    """
+
+    def __init__(self, scaler, **pool_kwargs):
+        self.scaler = scaler
+        self.pool_kwargs = pool_kwargs # initializer など、ProcessPoolExecutor にそのまま渡す引数
+        self.peak_workers = 0
+        self._idle = []   # タスクを実行していないプール
+        self._busy = {}   # future -> 実行中のプール
+
+    def __enter__(self):
+        self.resize()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+    @property
+    def capacity(self):
+        return len(self._idle) + len(set(self._busy.values()))
+
+    def resize(self):
+        """scaler.target に合わせてプロセスを追加・終了する (scaler.update() の後に呼ぶ)"""
+        target = self.scaler.target
+        while self._idle and self.capacity > target:
+            self._idle.pop().shutdown(wait=False)
+        for _ in range(target - self.capacity):
+            self._idle.append(ProcessPoolExecutor(max_workers=1, **self.pool_kwargs))
+        self.peak_workers = max(self.peak_workers, self.capacity)
+
+    def submit(self, fn, *args):
+        """空いているプロセスにタスクを投入する (実行中のタスク数が target 未満のときに呼ぶ)"""
+        if not self._idle:
+            self._idle.append(ProcessPoolExecutor(max_workers=1, **self.pool_kwargs))
+            self.peak_workers = max(self.peak_workers, self.capacity)
+        executor = self._idle.pop()
+        future = executor.submit(fn, *args)
+        self._busy[future] = executor
+        return future
+
+    def release(self, future):
+        """終わった (取り消した) タスクのプロセスを空きに戻す"""
+        executor = self._busy.pop(future, None)
+        if executor is not None:
+            self._idle.append(executor)
+
+    def shutdown(self, wait=True):
+        for executor in self._idle + list(self._busy.values()):
+            executor.shutdown(wait=wait)
+        self._idle = []
+        self._busy = {}